@@ -0,0 +1,274 @@
+"""Bounded pool of isolated worker processes for sample analysis.
+
+Parsing and feature extraction run in a fixed number of forked worker
+processes instead of on the request threads, one sample per worker at a time.
+Requests beyond the busy workers wait in a queue of bounded depth; once that is
+full, run() raises PoolSaturated immediately so the server can answer 503
+instead of piling up threads. Every sample has a wall-clock budget: a worker
+that has not answered in time is killed and replaced, and the sample gets the
+TIMEOUT_VERDICT. Workers also run under a memory limit on top of what they
+inherit from the server (RLIMIT_DATA, which counts the heap and anonymous
+mappings but not mapped files; RLIMIT_AS where it does not exist), so a parse
+that tries to allocate past its budget fails with MemoryError inside the
+worker, which reports it and is replaced as well.
+
+Samples mapped from a file (Sample.fileno) are not copied through the pipe:
+the worker receives the file descriptor and maps the file itself.
+
+Workers are started by a forkserver (spawn where there is none), never forked
+from the server itself: by the time a worker is started or replaced the server
+runs request, VirusTotal and watcher threads, and a child forked from it could
+inherit a lock one of them holds and hang. The forkserver imports the main
+module and the analysis code once, so workers still start quickly and share
+those pages.
+
+Time spent waiting for a free worker is recorded as the 'queue' stage of
+analysis_stage_seconds. Workers time their own stages ('parse', 'scan') and
+send the durations back with the features; the server records them as if they
+had run in-process, in analysis_stage_seconds and the request's Server-Timing
+breakdown. Queue depth, busy workers, rejections and outcomes have their own
+metrics.
+"""
+import mmap
+import multiprocessing
+import os
+import contextvars
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import reduction
+
+try:
+    import resource
+except ImportError:  # Unix only; on Windows workers run without a memory limit
+    resource = None
+
+import metrics
+from pe_analysis import DEFAULT_FEATURES, features_from_bytes
+
+TIMEOUT_VERDICT = "analysis timeout"
+TIMEOUT_ERROR = "SUSPICIOUS FILE ALERT: Analysis did not finish within its time budget."
+MEMORY_ERROR = "SUSPICIOUS FILE ALERT: Analysis exceeded its memory budget."
+CRASH_ERROR = "Analysis worker crashed"
+
+QUEUE_DEPTH = metrics.REGISTRY.gauge('analysis_queue_depth', 'Samples waiting for a free analysis worker.')
+QUEUE_DEPTH.set(0)
+WORKERS_BUSY = metrics.REGISTRY.gauge('analysis_workers_busy', 'Analysis workers processing a sample.')
+WORKERS_BUSY.set(0)
+REJECTED = metrics.REGISTRY.counter('analysis_rejected_total', 'Requests turned away because the analysis queue was full.')
+OUTCOMES = metrics.REGISTRY.counter('analysis_outcomes_total', 'Samples analysed, by outcome.', ['outcome'])
+RESTARTS = metrics.REGISTRY.counter('analysis_worker_restarts_total', 'Analysis workers replaced, by reason.', ['reason'])
+
+
+class PoolSaturated(Exception):
+    """Every worker is busy and the wait queue is full."""
+
+
+def is_budget_error(error):
+    """True if a sample's error means it ran out of time or memory rather than being malformed."""
+    return error in (TIMEOUT_ERROR, MEMORY_ERROR)
+
+
+def _memory_in_use(field):
+    """Bytes of the /proc/self/status field (VmData or VmSize), or None where /proc is not available."""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def _limit_memory(budget):
+    if hasattr(resource, 'RLIMIT_DATA'):
+        limit, field = resource.RLIMIT_DATA, 'VmData'
+    else:
+        limit, field = resource.RLIMIT_AS, 'VmSize'
+    in_use = _memory_in_use(field)
+    if in_use is not None:
+        resource.setrlimit(limit, (in_use + budget, resource.getrlimit(limit)[1]))
+
+
+def _analyze_file(fd, features):
+    """features_from_bytes() over a read-only map of the file behind fd, which is closed afterwards."""
+    with open(fd, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return features_from_bytes(b'', features)
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            return features_from_bytes(data, features)
+
+
+def _worker_main(conn, memory_limit, features, timed):
+    """Analyse samples received on conn until the server closes it, replying (features, error, stages)."""
+    metrics.enable(timed)  # the worker's registry is never rendered; its stage timings go back to the server
+    if memory_limit and resource is not None:
+        _limit_memory(memory_limit)
+    while True:
+        token = metrics.begin_breakdown()
+        try:
+            if conn.recv() == 'fd':
+                result = _analyze_file(reduction.recv_handle(conn), features)
+            else:
+                data = conn.recv_bytes()
+                result = features_from_bytes(data, features)
+        except EOFError:
+            return
+        except MemoryError:
+            # The heap may be fragmented past use; report and exit so the server starts a fresh worker
+            data = None
+            conn.send((None, MEMORY_ERROR, metrics.end_breakdown(token)))
+            return
+        data = None
+        conn.send((*result, metrics.end_breakdown(token)))
+
+
+class _Worker:
+    def __init__(self, context, memory_limit, features):
+        self.conn, child = context.Pipe()
+        self.process = context.Process(target=_worker_main, args=(child, memory_limit, features, metrics.enabled()),
+                                       daemon=True)
+        self.process.start()
+        child.close()
+
+    def stop(self):
+        self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+
+class AnalysisPool:
+    """`workers` isolated processes running features_from_bytes(), with at most `max_queue` samples waiting.
+
+    features is the list of feature names the workers extract (pe_analysis.DEFAULT_FEATURES if None).
+    """
+
+    def __init__(self, workers, max_queue=None, timeout=30.0, memory_limit=None, features=None):
+        self.workers = workers
+        self.max_queue = workers * 4 if max_queue is None else max_queue
+        self.timeout = timeout
+        self.memory_limit = memory_limit
+        self.features = list(DEFAULT_FEATURES if features is None else features)
+        method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+        self._context = multiprocessing.get_context(method)
+        self._idle = queue.LifoQueue()  # the most recently used worker has the warmest caches
+        self._lock = threading.Lock()
+        self._admitted = 0
+        self._pool = []  # every live worker
+        self._started = False
+
+    def _start(self):
+        # Workers are started on first use, so a pre-forking server gets a pool per worker process
+        with self._lock:
+            if self._started:
+                return
+            if self._context.get_start_method() == 'forkserver':
+                self._context.set_forkserver_preload(['__main__', 'analysis_pool'])
+            for _ in range(self.workers):
+                self._add_worker()
+            self._started = True
+
+    def _add_worker(self):
+        worker = _Worker(self._context, self.memory_limit, self.features)
+        self._pool.append(worker)
+        self._idle.put(worker)
+
+    def _replace(self, worker, reason):
+        RESTARTS.inc(reason=reason)
+        worker.stop()
+        with self._lock:
+            self._pool.remove(worker)
+            self._add_worker()
+
+    def _admit(self):
+        with self._lock:
+            if self._admitted >= self.workers + self.max_queue:
+                REJECTED.inc()
+                raise PoolSaturated(f"All {self.workers} analysis workers are busy and {self.max_queue} samples are queued")
+            self._admitted += 1
+
+    def _release(self):
+        with self._lock:
+            self._admitted -= 1
+
+    def _analyze(self, data, fileno=None):
+        QUEUE_DEPTH.inc()
+        try:
+            with metrics.stage('queue'):
+                worker = self._idle.get()
+        finally:
+            QUEUE_DEPTH.dec()
+        WORKERS_BUSY.inc()
+        failure = None
+        try:
+            try:
+                if fileno is not None:
+                    worker.conn.send('fd')
+                    reduction.send_handle(worker.conn, fileno, worker.process.pid)
+                else:
+                    worker.conn.send('bytes')
+                    worker.conn.send_bytes(data)
+            except OSError:
+                pass  # the worker stopped reading, e.g. it could not allocate the sample; its reply says why
+            if worker.conn.poll(self.timeout):
+                features, error, stages = worker.conn.recv()
+                for name, seconds in stages:
+                    metrics.record_stage(name, seconds)
+                if error == MEMORY_ERROR:
+                    failure = 'memory'
+            else:
+                features, error, failure = None, TIMEOUT_ERROR, 'timeout'
+        except (EOFError, OSError):
+            features, error, failure = None, CRASH_ERROR, 'crash'
+        finally:
+            WORKERS_BUSY.dec()
+        if failure is None:
+            self._idle.put(worker)
+        else:
+            self._replace(worker, failure)
+        OUTCOMES.inc(outcome=failure or ('ok' if error is None else 'error'))
+        return features, error
+
+    def run(self, data, fileno=None):
+        """(features, error) of one sample, as features_from_bytes() returns; raises PoolSaturated when full.
+
+        With the fileno of the file data is mapped from, the worker maps that file instead of receiving a copy.
+        """
+        self._start()
+        self._admit()
+        try:
+            return self._analyze(data, fileno)
+        finally:
+            self._release()
+
+    def map(self, datas, filenos=None):
+        """run() over many samples, admitted as one queued request and spread over the workers.
+
+        filenos, if given, has one entry per sample: its fileno as run() takes it, or None.
+        """
+        self._start()
+        self._admit()
+        try:
+            if filenos is None:
+                filenos = [None] * len(datas)
+            # Each sample runs in a copy of the caller's context, so its stages join the request's breakdown
+            contexts = [contextvars.copy_context() for _ in datas]
+            with ThreadPoolExecutor(max_workers=max(1, min(self.workers, len(datas)))) as executor:
+                return list(executor.map(lambda context, data, fileno: context.run(self._analyze, data, fileno),
+                                         contexts, datas, filenos))
+        finally:
+            self._release()
+
+    def stats(self):
+        with self._lock:
+            return {"workers": self.workers, "max_queue": self.max_queue, "timeout": self.timeout,
+                    "memory_limit": self.memory_limit, "admitted": self._admitted, "idle": self._idle.qsize()}
+
+    def close(self):
+        with self._lock:
+            workers, self._pool = self._pool, []
+            self._started = False
+        for worker in workers:
+            worker.stop()
+        self._idle = queue.LifoQueue()
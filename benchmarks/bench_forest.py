@@ -0,0 +1,62 @@
+"""Compare the compiled forest with scikit-learn for equality and latency.
+
+Usage: python benchmarks/bench_forest.py [model.joblib] [scaler.joblib] [features.csv]
+
+Rows are taken from the CSV (the 'malware' column is dropped). The script exits
+non-zero if predict or predict_proba differ in any bit.
+"""
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+from joblib import load
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+from compiled_forest import CompiledForest  # noqa: E402
+
+
+def per_call_us(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - start) * 1e6)
+    return statistics.median(times), sorted(times)[int(0.99 * (len(times) - 1))]
+
+
+def main():
+    args = sys.argv[1:] + [None] * 3
+    model = load(args[0] or os.path.join(ROOT, 'model', 'random_forest_model.joblib'))
+    scaler = load(args[1] or os.path.join(ROOT, 'model', 'scaler.joblib'))
+    csv_path = args[2] or os.path.join(ROOT, 'colab code and csvs', 'csv', 'final_external_test.csv')
+    X = pd.read_csv(csv_path).drop(columns=['malware']).values.astype(np.float64)
+
+    start = time.perf_counter()
+    forest = CompiledForest.from_sklearn(model, scaler)
+    print(f"compile: {time.perf_counter() - start:.2f} s, {len(forest.children)} nodes, {len(forest.roots)} trees")
+
+    expected = model.predict_proba(scaler.transform(X))
+    actual = forest.predict_proba(X)
+    identical = np.array_equal(expected, actual) and np.array_equal(model.predict(scaler.transform(X)), forest.predict(X))
+    print(f"identical on {len(X)} rows: {identical}")
+
+    row = X[:1]
+    print(f"{'':<24} {'p50 us':>10} {'p99 us':>10}")
+    for name, fn in [("sklearn single", lambda: model.predict(scaler.transform(row))),
+                     ("compiled single", lambda: forest.predict(row))]:
+        p50, p99 = per_call_us(fn, 200)
+        print(f"{name:<24} {p50:>10.1f} {p99:>10.1f}")
+    batch = X[:1000]
+    for name, fn in [("sklearn batch 1000", lambda: model.predict(scaler.transform(batch))),
+                     ("compiled batch 1000", lambda: forest.predict(batch))]:
+        p50, _ = per_call_us(fn, 10)
+        print(f"{name:<24} {p50:>10.1f} {'':>10}  ({len(batch) / p50 * 1e6:,.0f} rows/s)")
+    sys.exit(0 if identical else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,146 @@
+"""Peak memory of analysing very large PEs, before and after the bounded-memory path.
+
+Usage: python benchmarks/bench_memory.py [--sizes 64 256 1024] [--dir DIR] [--output memory.json]
+
+Writes a synthetic PE of each size in MB (a small valid PE from synthetic_pe
+followed by an overlay of random and zero blocks, streamed to disk) and
+analyses it once per mode, each in a fresh process, reporting how far that
+process's peak RSS rose above its RSS before the analysis:
+
+  legacy    the original analyze_file: is_pe_file's pefile.PE(data=f.read()), then f.read(),
+            a byte histogram and a full pefile.PE(file_path) whose verify_checksum() copies
+            the image first. The per-byte dict and pefile's dword loop are replaced by chunked
+            equivalents that allocate nothing, so only their time differs, not their memory.
+  buffered  features_from_bytes() over the file read into memory
+  mapped    features_from_bytes() over read_sample_file(): the file mapped in place and
+            scanned chunk by chunk
+  pool-copy the server path before bounded-memory analysis: the bytes sent through the
+            pipe to an AnalysisPool worker (the worker's peak RSS above its RSS when idle)
+  pool      the server path: the mapped file's descriptor handed to the worker instead
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..'))
+sys.path.insert(0, HERE)
+from synthetic_pe import build_pe  # noqa: E402
+
+MODES = ['legacy', 'buffered', 'mapped', 'pool-copy', 'pool']
+BLOCK = 8 * 1024 * 1024
+
+
+def write_large_pe(path, size, seed=0):
+    """A valid PE padded with an overlay to `size` bytes, written block by block."""
+    rng = np.random.default_rng(seed)
+    head = build_pe(rng, 1 << 20, n_sections=4, n_dlls=3)
+    with open(path, 'wb') as f:
+        f.write(head)
+        written = len(head)
+        while written < size:
+            block = min(BLOCK, size - written)
+            # Alternate random and zero blocks so the entropy is not trivial
+            f.write(rng.bytes(block) if (written // BLOCK) % 2 else bytes(block))
+            written += block
+
+
+def rss(field='VmRSS', pid='self'):
+    """Current (VmRSS) or peak (VmHWM) resident set size of a process in bytes, from /proc."""
+    with open(f'/proc/{pid}/status') as f:
+        for line in f:
+            if line.startswith(field + ':'):
+                return int(line.split()[1]) * 1024
+
+
+def legacy(path):
+    import pefile
+    from entropy import EntropyAccumulator
+    from sample_scan import scan
+    with open(path, 'rb') as f:
+        pefile.PE(data=f.read())
+    with open(path, 'rb') as f:
+        file_content = f.read()
+    EntropyAccumulator().update(file_content).entropy()
+    pe = pefile.PE(path)
+    image = pe.write()  # what verify_checksum() sums
+    scan(image, digests=(), histogram=False)
+    pe.close()
+
+
+def child(mode, path):
+    """Run one mode in this process and print its timing and memory as JSON."""
+    from pe_analysis import features_from_bytes, read_sample_file
+    from analysis_pool import AnalysisPool
+    baseline = rss()
+    start = time.perf_counter()
+    if mode == 'legacy':
+        legacy(path)
+        peak = rss('VmHWM')
+    elif mode == 'buffered':
+        with open(path, 'rb') as f:
+            features_from_bytes(f.read())
+        peak = rss('VmHWM')
+    elif mode == 'mapped':
+        with read_sample_file(path) as sample:
+            features_from_bytes(sample.data)
+        peak = rss('VmHWM')
+    else:
+        pool = AnalysisPool(1, timeout=600, memory_limit=None)
+        pool.run(b'')  # start the worker and measure from its idle state
+        worker = pool._pool[0].process.pid
+        baseline = rss(pid=worker)
+        start = time.perf_counter()
+        with read_sample_file(path) as sample:
+            pool.run(sample.data, sample.fileno if mode == 'pool' else None)
+        peak = rss('VmHWM', pid=worker)
+        pool.close()
+    elapsed = time.perf_counter() - start
+    print(json.dumps({"seconds": round(elapsed, 3), "baseline_mb": round(baseline / 2 ** 20, 1),
+                      "peak_growth_mb": round(max(peak - baseline, 0) / 2 ** 20, 1)}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Peak RSS of analysing large synthetic PEs, per analysis mode.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[64, 256, 1024], help='Sample sizes in MB.')
+    parser.add_argument('--modes', nargs='+', choices=MODES, default=MODES)
+    parser.add_argument('--dir', help='Where to write the samples (default: a temporary directory).')
+    parser.add_argument('--output', help='Also write the results as JSON to this file.')
+    parser.add_argument('--child', nargs=2, metavar=('MODE', 'PATH'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(*args.child)
+        return
+
+    results = {}
+    if args.dir:
+        os.makedirs(args.dir, exist_ok=True)
+    with tempfile.TemporaryDirectory(dir=args.dir) as tmp:
+        print(f"{'size':>8} {'mode':<9} {'peak RSS growth':>16} {'time':>9}")
+        for size_mb in args.sizes:
+            path = os.path.join(tmp, f'large_{size_mb}mb.exe')
+            write_large_pe(path, size_mb * 2 ** 20)
+            for mode in args.modes:
+                out = subprocess.run([sys.executable, os.path.abspath(__file__), '--child', mode, path],
+                                     capture_output=True, text=True)
+                if out.returncode != 0:
+                    print(f"{size_mb:>6}MB {mode:<9} failed: {out.stderr.strip().splitlines()[-1:]}")
+                    continue
+                result = json.loads(out.stdout.strip().splitlines()[-1])
+                results[f"{mode}_{size_mb}mb"] = result
+                print(f"{size_mb:>6}MB {mode:<9} {result['peak_growth_mb']:>13.1f} MB {result['seconds']:>8.2f}s")
+            os.remove(path)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,173 @@
+"""Check that gunicorn workers share one VirusTotal quota, poller set and job table.
+
+Usage: python benchmarks/check_vt_workers.py [--workers 2] [--files 6] [--rate 60]
+
+Starts the VirusTotal stub (vt_stub_server.py, answering each request after
+--delay seconds) in this process and serve.py with --workers processes
+pointed at it, then uploads --files distinct samples to /virusTotal. The stub
+is slower than VT_WAIT_SECONDS, so each upload returns a job id, which is then
+polled through /status on new connections until it completes. It fails
+(exit status 1) if:
+  - a /status lookup answers 404, i.e. a worker did not know a job id another worker issued
+  - a job does not complete
+  - the stub received more requests than one client's bucket allows: burst + rate * elapsed
+  - the requests never reached more than one worker, so nothing was checked
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import ThreadingHTTPServer
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.join(HERE, '..')
+sys.path.insert(0, ROOT)
+from vt_stub_server import StubHandler  # noqa: E402
+
+BURST = 4  # VirusTotalClient's default bucket capacity
+
+
+class QuietStubHandler(StubHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def call(url, data=None, headers=None):
+    """(status, parsed JSON or text) over a new connection, so gunicorn may hand it to any worker."""
+    request = urllib.request.Request(url, data=data, headers=headers or {'Connection': 'close'})
+    try:
+        with urllib.request.urlopen(request, timeout=60) as response:
+            status, body = response.status, response.read().decode()
+    except urllib.error.HTTPError as e:
+        status, body = e.code, e.read().decode()
+    try:
+        return status, json.loads(body)
+    except ValueError:
+        return status, body
+
+
+def upload(url, name, data):
+    boundary = 'check-vt-workers'
+    body = (f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="{name}"\r\n'
+            f'Content-Type: application/octet-stream\r\n\r\n').encode() + data + f'\r\n--{boundary}--\r\n'.encode()
+    return call(url, body, {'Content-Type': f'multipart/form-data; boundary={boundary}', 'Connection': 'close'})
+
+
+def wait_until_up(url, process, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"serve.py exited with status {process.returncode}")
+        try:
+            call(url)
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError("serve.py did not start listening")
+
+
+def several_workers_answered(base, probes=40):
+    """Each worker keeps its own http_requests_total, so a /status/stats count that does not rise by
+    one from the previous call's came from another worker."""
+    pattern = re.compile(r'http_requests_total\{route="/status/stats",method="GET",status="200"\} (\d+)')
+    counts = []
+    for _ in range(probes):
+        call(f'{base}/status/stats')
+        _, text = call(f'{base}/metrics')
+        match = pattern.search(text)
+        counts.append(int(match.group(1)) if match else 0)
+    return any(b != a + 1 for a, b in zip(counts, counts[1:]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check VirusTotal state is shared across gunicorn workers.')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--files', type=int, default=6, help='Distinct samples to upload.')
+    parser.add_argument('--rate', type=int, default=60, help='VT_REQUESTS_PER_MINUTE for the server.')
+    parser.add_argument('--delay', type=float, default=0.5, help='Seconds the stub waits before each answer.')
+    args = parser.parse_args()
+
+    StubHandler.delay = args.delay
+    stub = ThreadingHTTPServer(('127.0.0.1', 0), QuietStubHandler)
+    threading.Thread(target=stub.serve_forever, daemon=True).start()
+
+    port = free_port()
+    base = f'http://127.0.0.1:{port}'
+    env = dict(os.environ, VT_BASE_URL=f'http://127.0.0.1:{stub.server_address[1]}/api/v3',
+               VT_API_KEY='check', VT_WAIT_SECONDS='0.1', VT_REQUESTS_PER_MINUTE=str(args.rate),
+               VT_POLL_INTERVAL='0.5', ANALYSIS_WORKERS='0', COMPILED_MODEL='0')
+    failures = []
+    with tempfile.TemporaryDirectory() as tmp:
+        process = subprocess.Popen([sys.executable, os.path.join(ROOT, 'serve.py'), '--bind', f'127.0.0.1:{port}',
+                                    '--workers', str(args.workers), '--threads', '4',
+                                    '--compiled-model', os.path.join(tmp, 'compiled')],
+                                   env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            wait_until_up(f'{base}/status/stats', process)
+            start = time.monotonic()
+            jobs = []
+            for i in range(args.files):
+                data = f'check-vt-workers sample {i}'.encode() * 64
+                status, body = upload(f'{base}/virusTotal', f'sample{i}.bin', data)
+                if status != 202:
+                    failures.append(f"upload {i}: expected 202, got {status} {body}")
+                    continue
+                if body['file_id'] != f"job-{hashlib.md5(data).hexdigest()}":
+                    failures.append(f"upload {i}: expected a job id, got {body['file_id']}")
+                jobs.append(body['file_id'])
+
+            deadline = time.monotonic() + 30 + args.files * 4 * 60 / args.rate
+            pending = set(jobs)
+            while pending and time.monotonic() < deadline:
+                for job_id in sorted(pending):
+                    status, body = call(f'{base}/status/{job_id}')
+                    if status == 404:
+                        failures.append(f"{job_id}: unknown to the worker that answered /status")
+                        pending.discard(job_id)
+                    elif status != 200:
+                        failures.append(f"{job_id}: /status answered {status} {body}")
+                        pending.discard(job_id)
+                    elif body['data']['attributes']['status'] == 'completed':
+                        pending.discard(job_id)
+                time.sleep(0.2)
+            failures.extend(f"{job_id}: did not complete" for job_id in sorted(pending))
+            elapsed = time.monotonic() - start
+
+            allowed = BURST + args.rate / 60 * elapsed
+            upstream = StubHandler._requests
+            print(f"{len(jobs)} jobs, {upstream} upstream requests in {elapsed:.1f}s (one bucket allows {allowed:.1f})")
+            if upstream > allowed:
+                failures.append(f"{upstream} upstream requests exceed one bucket's {allowed:.1f}")
+            several = several_workers_answered(base)
+            print(f"requests answered by {'several workers' if several else 'one worker'}")
+            if args.workers > 1 and not several:
+                failures.append("every request reached the same worker; nothing was shared")
+        finally:
+            process.terminate()
+            process.wait(timeout=30)
+            stub.shutdown()
+
+    for failure in failures:
+        print("FAIL", failure)
+    if failures:
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == '__main__':
+    main()
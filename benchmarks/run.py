@@ -0,0 +1,206 @@
+"""Benchmark suite over a synthetic PE corpus.
+
+Usage:
+  python benchmarks/run.py [--corpus DIR] [--count N] [--seed S] [--output results.json]
+  python benchmarks/run.py --compare baseline.json results.json [--tolerance 0.10]
+
+Times shannon_entropy, the fused sample_scan pass (against entropy, pefile's
+checksum and three hashlib digests computed separately), is_pe_file, analyze_file, the per-file extraction of
+both dataset generators, a full generator run over the corpus, and the
+end-to-end /upload route through the Flask test client. Each benchmark reports
+throughput and p50/p99 latency; results are written as JSON so two commits can
+be compared with --compare, which exits non-zero on regressions.
+"""
+import argparse
+import contextlib
+import importlib.util
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.join(HERE, '..')
+SCRIPTS = os.path.join(ROOT, 'python utlilty scripts')
+sys.path.insert(0, ROOT)
+sys.path.insert(0, HERE)
+from synthetic_pe import generate_corpus  # noqa: E402
+
+GENERATORS = {
+    'generator_all_features': 'dataset generator extract all featues 2 folders.py',
+    'generator_optimal_features': 'dataset generator extract optimal features only 2 folders.py',
+}
+
+
+def load_script(name, filename):
+    spec = importlib.util.spec_from_file_location(name, os.path.join(SCRIPTS, filename))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def summarize(latencies, total_bytes):
+    """Throughput and latency percentiles from per-item timings in seconds."""
+    latencies = np.asarray(latencies)
+    total = float(latencies.sum())
+    return {
+        "count": int(len(latencies)),
+        "total_s": round(total, 6),
+        "items_per_s": round(len(latencies) / total, 3) if total else None,
+        "mb_per_s": round(total_bytes / total / 1e6, 3) if total else None,
+        "p50_ms": round(float(np.percentile(latencies, 50)) * 1e3, 4),
+        "p99_ms": round(float(np.percentile(latencies, 99)) * 1e3, 4),
+    }
+
+
+def time_each(fn, items, sizes):
+    latencies = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for item in items:
+            start = time.perf_counter()
+            fn(item)
+            latencies.append(time.perf_counter() - start)
+    return summarize(latencies, sum(sizes))
+
+
+def run_suite(corpus_dir, only=None):
+    with open(os.path.join(corpus_dir, 'manifest.json')) as f:
+        manifest = json.load(f)
+    samples = manifest['samples']
+    paths = [os.path.join(corpus_dir, s['path']) for s in samples]
+    sizes = [os.path.getsize(p) for p in paths]
+    contents = [open(p, 'rb').read() for p in paths]
+    results = {}
+
+    def wanted(name):
+        return only is None or any(name.startswith(prefix) for prefix in only)
+
+    if wanted('shannon_entropy'):
+        from entropy import shannon_entropy
+        results['shannon_entropy'] = time_each(shannon_entropy, contents, sizes)
+
+    if wanted('scan'):
+        import hashlib
+        import pefile
+        from entropy import shannon_entropy
+        from sample_scan import DIGESTS, scan
+
+        def separate(content):
+            shannon_entropy(content)
+            with contextlib.suppress(pefile.PEFormatError):
+                pefile.PE(data=content, fast_load=True).verify_checksum()
+            for name in DIGESTS:
+                hashlib.new(name, content).digest()
+        results['scan_separate'] = time_each(separate, contents, sizes)
+        results['scan_fused'] = time_each(scan, contents, sizes)
+
+    for name, filename in GENERATORS.items():
+        if not wanted(name):
+            continue
+        module = load_script(name, filename)
+        results[name] = time_each(module.calculate_entropy_and_pe_features, paths, sizes)
+        import corpus
+        with tempfile.TemporaryDirectory() as tmp:
+            folders = [(os.path.join(corpus_dir, 'benign'), 0), (os.path.join(corpus_dir, 'malicious'), 1)]
+            with contextlib.redirect_stdout(io.StringIO()):
+                start = time.perf_counter()
+                corpus.extract_folders(folders, module.calculate_entropy_and_pe_features,
+                                       os.path.join(tmp, 'out.csv'), ['malware'])
+                elapsed = time.perf_counter() - start
+        results[name + '_folder_run'] = {"count": len(paths), "total_s": round(elapsed, 6),
+                                         "items_per_s": round(len(paths) / elapsed, 3),
+                                         "mb_per_s": round(sum(sizes) / elapsed / 1e6, 3)}
+
+    if any(wanted(name) for name in ('is_pe_file', 'analyze_file', 'upload')):
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                os.chdir(ROOT)
+                import server
+        except Exception as e:
+            print(f"Skipping server benchmarks, server.py could not be loaded: {e}")
+            return results
+        if wanted('is_pe_file'):
+            results['is_pe_file'] = time_each(server.is_pe_file, paths, sizes)
+        valid = [(p, size) for p, size, s in zip(paths, sizes, samples) if not s['malformed']]
+        if wanted('analyze_file'):
+            server.verdict_cache.clear()
+            results['analyze_file'] = time_each(server.analyze_file, [p for p, _ in valid], [s for _, s in valid])
+        if wanted('upload'):
+            client = server.app.test_client()
+            by_path = dict(zip(paths, contents))
+
+            def upload(path):
+                server.verdict_cache.clear()  # measure the full pipeline, not cache hits
+                client.post('/upload', data={'file': (io.BytesIO(by_path[path]), os.path.basename(path))})
+            results['upload'] = time_each(upload, paths, sizes)
+    return results
+
+
+def environment(corpus_dir):
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    with open(os.path.join(corpus_dir, 'manifest.json')) as f:
+        manifest = json.load(f)
+    return {"commit": commit, "python": platform.python_version(), "platform": platform.platform(),
+            "cpus": os.cpu_count(), "corpus_seed": manifest['seed'], "corpus_count": manifest['count']}
+
+
+def compare(baseline_path, current_path, tolerance):
+    with open(baseline_path) as f:
+        baseline = json.load(f)['results']
+    with open(current_path) as f:
+        current = json.load(f)['results']
+    regressions = 0
+    print(f"{'benchmark':<38} {'metric':<12} {'baseline':>12} {'current':>12} {'change':>9}")
+    for name in sorted(set(baseline) & set(current)):
+        for metric, higher_is_better in (('items_per_s', True), ('p50_ms', False), ('p99_ms', False)):
+            old, new = baseline[name].get(metric), current[name].get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            worse = -change if higher_is_better else change
+            flag = ' REGRESSION' if worse > tolerance else ''
+            regressions += bool(flag)
+            print(f"{name:<38} {metric:<12} {old:>12.3f} {new:>12.3f} {change:>+8.1%}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the analysis pipeline on a synthetic PE corpus.')
+    parser.add_argument('--corpus', help='Corpus directory (generated there if it has no manifest).')
+    parser.add_argument('--count', type=int, default=200, help='Samples to generate (default: 200).')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--only', nargs='+', help='Run only benchmarks whose name starts with one of these.')
+    parser.add_argument('--output', default='bench_results.json', help='JSON results file.')
+    parser.add_argument('--compare', nargs=2, metavar=('BASELINE', 'CURRENT'), help='Diff two results files.')
+    parser.add_argument('--tolerance', type=float, default=0.10, help='Allowed slowdown before flagging (default: 0.10).')
+    args = parser.parse_args()
+
+    if args.compare:
+        sys.exit(1 if compare(*args.compare, args.tolerance) else 0)
+
+    corpus_dir = args.corpus or os.path.join(tempfile.gettempdir(), f"synthetic_pe_{args.seed}_{args.count}")
+    if not os.path.exists(os.path.join(corpus_dir, 'manifest.json')):
+        print(f"Generating {args.count} synthetic samples in {corpus_dir}")
+        generate_corpus(corpus_dir, args.count, args.seed)
+
+    results = run_suite(corpus_dir, args.only)
+    print(f"{'benchmark':<38} {'items/s':>10} {'MB/s':>10} {'p50 ms':>10} {'p99 ms':>10}")
+    for name, r in results.items():
+        print(f"{name:<38} {r['items_per_s'] or 0:>10.2f} {r['mb_per_s'] or 0:>10.2f} "
+              f"{r.get('p50_ms', float('nan')):>10.3f} {r.get('p99_ms', float('nan')):>10.3f}")
+    with open(args.output, 'w') as f:
+        json.dump({"environment": environment(corpus_dir), "results": results}, f, indent=2)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
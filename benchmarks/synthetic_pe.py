@@ -0,0 +1,255 @@
+"""Reproducible synthetic PE corpus for benchmarks.
+
+Usage: python benchmarks/synthetic_pe.py <output_dir> [--count N] [--seed S]
+
+Writes <output_dir>/benign and <output_dir>/malicious (random labels, so the
+folders can be fed straight to the dataset generators) plus manifest.json
+describing every sample. Samples vary in size, section count, PE32/PE32+,
+import tables (named and ordinal imports) and checksum validity; a share of
+them are deliberately malformed (truncated, bad e_lfanew, bad signature,
+sections past EOF, corrupt import directory, not a PE at all).
+"""
+import argparse
+import json
+import os
+import struct
+
+import numpy as np
+
+FILE_ALIGNMENT = 0x200
+SECTION_ALIGNMENT = 0x1000
+PE_OFFSET = 0x80
+NORMAL_SECTIONS = [b'.text', b'.rdata', b'.data', b'.pdata', b'.rsrc', b'.bss', b'.code', b'.edata']
+ODD_SECTIONS = [b'UPX0', b'UPX1', b'.packed', b'.vmp0', b'.x', b'']
+DLLS = {
+    b'KERNEL32.dll': [b'CreateFileA', b'ReadFile', b'WriteFile', b'CloseHandle', b'VirtualAlloc', b'VirtualProtect',
+                      b'GetProcAddress', b'LoadLibraryA', b'ExitProcess', b'GetModuleHandleA', b'Sleep'],
+    b'USER32.dll': [b'MessageBoxA', b'GetWindowTextA', b'SetWindowsHookExA', b'GetAsyncKeyState', b'FindWindowA'],
+    b'ADVAPI32.dll': [b'RegOpenKeyExA', b'RegSetValueExA', b'OpenProcessToken', b'CryptAcquireContextA'],
+    b'WS2_32.dll': [b'socket', b'connect', b'send', b'recv', b'WSAStartup'],
+    b'msvcrt.dll': [b'malloc', b'free', b'memcpy', b'printf', b'strlen', b'_initterm'],
+    b'ntdll.dll': [b'NtQueryInformationProcess', b'RtlMoveMemory', b'NtUnmapViewOfSection'],
+}
+MALFORMED_KINDS = ['truncated', 'bad_lfanew', 'bad_signature', 'sections_past_eof', 'bad_imports', 'not_pe']
+
+
+def align(value, alignment):
+    return (value + alignment - 1) // alignment * alignment
+
+
+def pe_checksum(data, checksum_offset):
+    """PE optional-header checksum of data (the CheckSum field itself is skipped)."""
+    padded = bytes(data) + b'\0' * (-len(data) % 4)
+    words = np.frombuffer(padded, dtype='<u4').astype(np.uint64)
+    words[checksum_offset // 4] = 0
+    total = int(words.sum())
+    while total >> 32:
+        total = (total & 0xFFFFFFFF) + (total >> 32)
+    total = (total & 0xFFFF) + (total >> 16)
+    total = (total + (total >> 16)) & 0xFFFF
+    return total + len(data)
+
+
+def section_content(rng, size):
+    """Bytes with a mix of low- and high-entropy regions."""
+    kind = rng.integers(4)
+    if kind == 0:
+        return rng.integers(0, 256, size, dtype=np.uint8).tobytes()
+    if kind == 1:
+        return bytes(size)
+    if kind == 2:
+        alphabet = np.frombuffer(b'\x00\x8b\x89\x48\xe8\xc3\xff\x55', dtype=np.uint8)
+        return rng.choice(alphabet, size).tobytes()
+    return rng.geometric(0.08, size).clip(0, 255).astype(np.uint8).tobytes()
+
+
+def build_imports(rng, rva, pe32plus, n_dlls):
+    """Import directory bytes laid out at `rva`, and the descriptor table size."""
+    names = rng.choice(len(DLLS), size=min(n_dlls, len(DLLS)), replace=False)
+    chosen = [(list(DLLS)[i], list(DLLS.values())[i]) for i in names]
+    thunk_size = 8 if pe32plus else 4
+    ordinal_flag = 1 << 63 if pe32plus else 1 << 31
+    thunk_fmt = '<Q' if pe32plus else '<I'
+
+    imports = []
+    for dll, funcs in chosen:
+        count = int(rng.integers(1, len(funcs) + 1))
+        picked = [funcs[i] for i in rng.choice(len(funcs), size=count, replace=False)]
+        if rng.random() < 0.2:
+            picked.append(int(rng.integers(1, 500)))  # import by ordinal
+        imports.append((dll, picked))
+
+    descriptors_size = (len(imports) + 1) * 20
+    cursor = descriptors_size
+    thunk_tables = []
+    for dll, picked in imports:
+        table_size = (len(picked) + 1) * thunk_size
+        thunk_tables.append((cursor, cursor + table_size))  # ILT, IAT
+        cursor += 2 * table_size
+    hint_names = {}
+    blob = bytearray()
+    for _, picked in imports:
+        for func in picked:
+            if isinstance(func, bytes) and func not in hint_names:
+                hint_names[func] = cursor + len(blob)
+                entry = struct.pack('<H', 0) + func + b'\0'
+                blob += entry + b'\0' * (len(entry) % 2)
+    dll_names = {}
+    for dll, _ in imports:
+        dll_names[dll] = cursor + len(blob)
+        blob += dll + b'\0'
+
+    data = bytearray(cursor)
+    for i, ((dll, picked), (ilt, iat)) in enumerate(zip(imports, thunk_tables)):
+        struct.pack_into('<IIIII', data, i * 20, rva + ilt, 0, 0, rva + dll_names[dll], rva + iat)
+        for j, func in enumerate(picked):
+            value = ordinal_flag | func if isinstance(func, int) else rva + hint_names[func]
+            struct.pack_into(thunk_fmt, data, ilt + j * thunk_size, value)
+            struct.pack_into(thunk_fmt, data, iat + j * thunk_size, value)
+    return bytes(data + blob), descriptors_size
+
+
+def build_pe(rng, size, n_sections, n_dlls, pe32plus=False, valid_checksum=False):
+    """A structurally valid PE of roughly `size` bytes."""
+    opt_size = 0xF0 if pe32plus else 0xE0
+    headers_size = align(PE_OFFSET + 24 + opt_size + 40 * n_sections, FILE_ALIGNMENT)
+    names = [NORMAL_SECTIONS[0]] + [
+        (NORMAL_SECTIONS if rng.random() < 0.7 else ODD_SECTIONS)[rng.integers(6)] for _ in range(n_sections - 1)]
+    if n_dlls:
+        names[-1] = b'.idata'
+    body = max(size - headers_size, n_sections * FILE_ALIGNMENT)
+    weights = rng.dirichlet(np.ones(n_sections))
+    raw_sizes = [align(max(int(body * w), 1), FILE_ALIGNMENT) for w in weights]
+
+    sections, import_dir = [], (0, 0)
+    raw_pointer, rva = headers_size, SECTION_ALIGNMENT
+    for name, raw_size in zip(names, raw_sizes):
+        if name == b'.idata':
+            content, descriptors_size = build_imports(rng, rva, pe32plus, n_dlls)
+            raw_size = align(len(content), FILE_ALIGNMENT)
+            content += bytes(raw_size - len(content))
+            import_dir = (rva, descriptors_size)
+        else:
+            content = section_content(rng, raw_size)
+        uninitialized = name == b'.bss'
+        characteristics = 0x60000020 if name in (b'.text', b'.code') else 0xC0000040
+        sections.append((name, rva, raw_size, raw_pointer, characteristics | (0x80 if uninitialized else 0), content))
+        raw_pointer += raw_size
+        rva += align(raw_size, SECTION_ALIGNMENT)
+    size_of_image = rva
+
+    out = bytearray(raw_pointer)
+    out[0:2] = b'MZ'
+    struct.pack_into('<I', out, 0x3C, PE_OFFSET)
+    machine = 0x8664 if pe32plus else 0x14C
+    characteristics = int(rng.choice([0x0102, 0x0122, 0x2102, 0x010F, 0x0022]))
+    timestamp = int(rng.integers(0, 2 ** 32))
+    out[PE_OFFSET:PE_OFFSET + 4] = b'PE\0\0'
+    struct.pack_into('<HHIIIHH', out, PE_OFFSET + 4, machine, n_sections, timestamp, 0, 0, opt_size, characteristics)
+
+    opt = PE_OFFSET + 24
+    code_size = sum(s[2] for s in sections if s[4] & 0x20)
+    init_size = sum(s[2] for s in sections if s[4] & 0x40)
+    uninit_size = sum(s[2] for s in sections if s[4] & 0x80)
+    dll_characteristics = int(rng.choice([0, 0x8140, 0x8160, 0x0140, 0x8000, 0x0400]))
+    image_version = int(rng.integers(0, 11))
+    if pe32plus:
+        struct.pack_into('<HBBIIIIIQIIHHHHHHIIIIHHQQQQII', out, opt, 0x20B, 14, 0, code_size, init_size, uninit_size,
+                         SECTION_ALIGNMENT, SECTION_ALIGNMENT, 0x140000000, SECTION_ALIGNMENT, FILE_ALIGNMENT,
+                         6, 0, image_version, 0, 6, 0, 0, size_of_image, headers_size, 0, 2, dll_characteristics,
+                         0x100000, 0x1000, 0x100000, 0x1000, 0, 16)
+        directories = opt + 112
+    else:
+        struct.pack_into('<HBBIIIIIIIIIHHHHHHIIIIHHIIIIII', out, opt, 0x10B, 14, 0, code_size, init_size, uninit_size,
+                         SECTION_ALIGNMENT, SECTION_ALIGNMENT, SECTION_ALIGNMENT * 2, 0x400000, SECTION_ALIGNMENT,
+                         FILE_ALIGNMENT, 6, 0, image_version, 0, 6, 0, 0, size_of_image, headers_size, 0, 2,
+                         dll_characteristics, 0x100000, 0x1000, 0x100000, 0x1000, 0, 16)
+        directories = opt + 96
+    struct.pack_into('<II', out, directories + 8, *import_dir)
+
+    table = opt + opt_size
+    for i, (name, rva, raw_size, pointer, flags, content) in enumerate(sections):
+        struct.pack_into('<8sIIIIIIHHI', out, table + 40 * i, name, raw_size, rva, raw_size, pointer, 0, 0, 0, 0, flags)
+        out[pointer:pointer + raw_size] = content
+
+    checksum_offset = opt + 64
+    checksum = pe_checksum(out, checksum_offset) if valid_checksum else int(rng.integers(0, 2 ** 32))
+    struct.pack_into('<I', out, checksum_offset, checksum)
+    return bytes(out)
+
+
+def malform(rng, data, kind):
+    data = bytearray(data)
+    if kind == 'truncated':
+        return bytes(data[:int(rng.integers(2, min(len(data), 0x400)))])
+    if kind == 'bad_lfanew':
+        struct.pack_into('<I', data, 0x3C, len(data) + int(rng.integers(1, 1 << 20)))
+    elif kind == 'bad_signature':
+        data[PE_OFFSET:PE_OFFSET + 4] = b'PX\0\0'
+    elif kind == 'sections_past_eof':
+        n_sections, opt_size = struct.unpack_from('<H', data, PE_OFFSET + 6)[0], struct.unpack_from('<H', data, PE_OFFSET + 20)[0]
+        table = PE_OFFSET + 24 + opt_size
+        for i in range(n_sections):
+            struct.pack_into('<I', data, table + 40 * i + 20, len(data) * 4 + 0x200 * i)
+    elif kind == 'bad_imports':
+        opt_size = struct.unpack_from('<H', data, PE_OFFSET + 20)[0]
+        directories = PE_OFFSET + 24 + (112 if opt_size == 0xF0 else 96)
+        struct.pack_into('<II', data, directories + 8, int(rng.integers(0x100, 0x7FFFFFFF)), 0x1000)
+    elif kind == 'not_pe':
+        return b'MZ' + rng.integers(0, 256, len(data) - 2, dtype=np.uint8).tobytes()
+    return bytes(data)
+
+
+def sample_spec(rng, index, malformed_share=0.1, max_size=8 << 20):
+    size = int(np.exp(rng.uniform(np.log(4 << 10), np.log(max_size))))
+    spec = {
+        "name": f"sample_{index:06d}.exe",
+        "size": size,
+        "sections": int(rng.integers(1, 13)),
+        "dlls": int(rng.integers(0, len(DLLS) + 1)),
+        "pe32plus": bool(rng.random() < 0.4),
+        "valid_checksum": bool(rng.random() < 0.5),
+        "malicious": bool(rng.random() < 0.5),
+        "malformed": None,
+    }
+    if rng.random() < malformed_share:
+        spec["malformed"] = MALFORMED_KINDS[int(rng.integers(len(MALFORMED_KINDS)))]
+    return spec
+
+
+def build_sample(spec, seed):
+    rng = np.random.default_rng([seed, int(spec["name"][7:13])])
+    data = build_pe(rng, spec["size"], spec["sections"], spec["dlls"], spec["pe32plus"], spec["valid_checksum"])
+    if spec["malformed"]:
+        data = malform(rng, data, spec["malformed"])
+    return data
+
+
+def generate_corpus(output_dir, count=200, seed=0, malformed_share=0.1, max_size=8 << 20):
+    """Write the corpus and its manifest; the same seed always produces identical bytes."""
+    rng = np.random.default_rng(seed)
+    specs = [sample_spec(rng, i, malformed_share, max_size) for i in range(count)]
+    for label in ('benign', 'malicious'):
+        os.makedirs(os.path.join(output_dir, label), exist_ok=True)
+    for spec in specs:
+        spec["path"] = os.path.join('malicious' if spec["malicious"] else 'benign', spec["name"])
+        with open(os.path.join(output_dir, spec["path"]), 'wb') as f:
+            f.write(build_sample(spec, seed))
+    with open(os.path.join(output_dir, 'manifest.json'), 'w') as f:
+        json.dump({"seed": seed, "count": count, "samples": specs}, f, indent=1)
+    return specs
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a reproducible synthetic PE corpus.')
+    parser.add_argument('output_dir')
+    parser.add_argument('--count', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--malformed-share', type=float, default=0.1)
+    parser.add_argument('--max-size', type=int, default=8 << 20, help='Largest sample size in bytes.')
+    args = parser.parse_args()
+    generate_corpus(args.output_dir, args.count, args.seed, args.malformed_share, args.max_size)
+
+
+if __name__ == '__main__':
+    main()
@@ -42,6 +42,8 @@ from sklearn.metrics import roc_curve, auc, precision_recall_curve, f1_score, pr
 
 df = pd.read_csv('final.csv') #down scaled big dataset
 test2 = pd.read_csv('final_external_test.csv') #dikie benigns and virusshare malwares combined (2k total)
+#from feature_store import FeatureStore #alternative: memory-mapped columnar store written by the generators with --format store
+#df = FeatureStore.open('final.store').to_pandas() #pass a list of column names to load only those
 
 df
 
@@ -0,0 +1,184 @@
+"""Array-backed random forest for low-latency inference without scikit-learn dispatch.
+
+CompiledForest.from_sklearn() flattens every tree of a fitted
+RandomForestClassifier into a few NumPy arrays and folds the StandardScaler
+into the split thresholds, so raw (unscaled) feature rows are compared
+directly. scikit-learn compares float32(scaled value) against each threshold;
+because that transform is monotone, each split is equivalent to raw <= T for
+a single float64 T, which is found exactly by bisection over the float64 bit
+patterns. Predictions and probabilities are therefore identical to
+model.predict_proba(scaler.transform(X)).
+
+Usage: python compiled_forest.py <model.joblib> <scaler.joblib> <output_dir>
+"""
+import json
+import os
+import sys
+
+import numpy as np
+
+ARRAYS = ('children', 'feature', 'threshold', 'value', 'roots', 'classes')
+_SIGN = np.int64(-0x8000000000000000)
+_MAGNITUDE = np.int64(0x7FFFFFFFFFFFFFFF)
+
+
+def _float_to_key(x):
+    """Map float64 to int64 so that integer order equals float order."""
+    bits = np.asarray(x, dtype=np.float64).view(np.int64)
+    return np.where(bits >= 0, bits, -(bits & _MAGNITUDE))
+
+
+def _key_to_float(key):
+    bits = np.where(key >= 0, key, (-key) | _SIGN)
+    return bits.astype(np.int64).view(np.float64)
+
+
+def fold_thresholds(threshold, mean, scale):
+    """Largest raw float64 x per split with float32((x - mean) / scale) <= threshold."""
+    def goes_left(key):
+        with np.errstate(over='ignore', invalid='ignore'):
+            scaled = ((_key_to_float(key) - mean) / scale).astype(np.float32)
+        return scaled.astype(np.float64) <= threshold
+
+    lo = np.full(threshold.shape, _float_to_key(-np.finfo(np.float64).max), dtype=np.int64)
+    hi = np.full(threshold.shape, _float_to_key(np.finfo(np.float64).max), dtype=np.int64)
+    never = ~goes_left(lo)
+    always = goes_left(hi)
+    # Invariant: goes_left(lo) is true and goes_left(hi) is false (or hi is the top of the range).
+    for _ in range(64):
+        mid = (lo >> 1) + (hi >> 1) + (lo & hi & 1)
+        left = goes_left(mid)
+        lo = np.where(left, mid, lo)
+        hi = np.where(left, hi, mid)
+    folded = _key_to_float(np.where(goes_left(hi), hi, lo))
+    folded[never] = -np.inf
+    folded[always] = np.inf
+    return folded
+
+
+class CompiledForest:
+    def __init__(self, children, feature, threshold, value, roots, classes, max_depth, n_features):
+        self.children = children  # (n_nodes, 2) left/right child; leaves point at themselves
+        self.is_leaf = children[:, 0] == np.arange(len(children))
+        self.feature = feature
+        self.threshold = threshold
+        self.value = value
+        self.roots = roots
+        self.classes = classes
+        self.max_depth = max_depth
+        self.n_features = n_features
+
+    @classmethod
+    def from_sklearn(cls, model, scaler=None):
+        """Flatten a fitted RandomForestClassifier (and optional StandardScaler) into arrays."""
+        n_features = model.n_features_in_
+        mean = np.zeros(n_features)
+        scale = np.ones(n_features)
+        if scaler is not None:
+            if getattr(scaler, 'mean_', None) is not None:
+                mean = np.asarray(scaler.mean_, dtype=np.float64)
+            if getattr(scaler, 'scale_', None) is not None:
+                scale = np.asarray(scaler.scale_, dtype=np.float64)
+
+        left, right, feature, threshold, value, roots = [], [], [], [], [], []
+        offset = 0
+        for estimator in model.estimators_:
+            tree = estimator.tree_
+            n = tree.node_count
+            is_leaf = tree.children_left == -1
+            ids = np.arange(offset, offset + n)
+            left.append(np.where(is_leaf, ids, tree.children_left + offset))
+            right.append(np.where(is_leaf, ids, tree.children_right + offset))
+            feat = np.where(is_leaf, 0, tree.feature)
+            feature.append(feat)
+            # Same normalisation DecisionTreeClassifier.predict_proba applies to each leaf
+            proba = tree.value[:, 0, :len(model.classes_)].astype(np.float64)
+            normalizer = proba.sum(axis=1)[:, np.newaxis]
+            normalizer[normalizer == 0.0] = 1.0
+            value.append(proba / normalizer)
+            thr = fold_thresholds(tree.threshold.astype(np.float64), mean[feat], scale[feat])
+            threshold.append(np.where(is_leaf, np.inf, thr))
+            roots.append(offset)
+            offset += n
+
+        children = np.stack([np.concatenate(left), np.concatenate(right)], axis=1).astype(np.intp)
+        return cls(children, np.concatenate(feature).astype(np.int32), np.concatenate(threshold),
+                   np.concatenate(value), np.array(roots, dtype=np.int32), np.asarray(model.classes_),
+                   max(estimator.tree_.max_depth for estimator in model.estimators_), n_features)
+
+    def apply(self, X):
+        """Leaf node index reached in every tree, shape (n_samples, n_trees)."""
+        X = np.asarray(X, dtype=np.float64).reshape(-1, self.n_features)
+        n_trees = len(self.roots)
+        flat_x = X.ravel()
+        nodes = np.tile(self.roots.astype(np.intp), len(X))
+        row_base = np.repeat(np.arange(len(X)) * self.n_features, n_trees)
+        children = self.children.ravel()
+        # Walk all (sample, tree) pairs together, dropping each one as soon as it reaches a leaf.
+        active = np.flatnonzero(~self.is_leaf[nodes])
+        while active.size:
+            current = nodes[active]
+            go_right = ~(flat_x[row_base[active] + self.feature[current]] <= self.threshold[current])
+            current = children[2 * current + go_right]
+            nodes[active] = current
+            active = active[~self.is_leaf[current]]
+        return nodes.reshape(len(X), n_trees)
+
+    def predict_proba(self, X):
+        leaves = self.apply(X)
+        # Sum tree by tree in estimator order, as RandomForestClassifier does, then average.
+        return np.cumsum(self.value[leaves], axis=1)[:, -1] / len(self.roots)
+
+    def predict(self, X):
+        return self.classes.take(np.argmax(self.predict_proba(X), axis=1), axis=0)
+
+    def save(self, directory, source=None):
+        """Write one .npy per array so the forest can later be loaded with mmap_mode='r'.
+
+        source is the artifact_version() of the model and scaler files the forest
+        was compiled from, recorded so a stale directory can be detected.
+        """
+        os.makedirs(directory, exist_ok=True)
+        for name in ARRAYS:
+            np.save(os.path.join(directory, f"{name}.npy"), getattr(self, name))
+        with open(os.path.join(directory, 'meta.json'), 'w') as f:
+            json.dump({"max_depth": int(self.max_depth), "n_features": int(self.n_features), "source": source}, f)
+
+    @staticmethod
+    def source(directory):
+        """The source fingerprint save() recorded in a compiled directory, or None if there is none."""
+        try:
+            with open(os.path.join(directory, 'meta.json')) as f:
+                return json.load(f).get("source")
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def files(directory):
+        """Paths of every file save() writes, e.g. to fingerprint a saved forest."""
+        return [os.path.join(directory, f"{name}.npy") for name in ARRAYS] + [os.path.join(directory, 'meta.json')]
+
+    @classmethod
+    def load(cls, directory, mmap_mode=None):
+        with open(os.path.join(directory, 'meta.json')) as f:
+            meta = json.load(f)
+        meta.pop("source", None)
+        arrays = {name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode=mmap_mode, allow_pickle=False)
+                  for name in ARRAYS}
+        return cls(**arrays, **meta)
+
+
+def is_forest(model):
+    """True for fitted models CompiledForest can represent (RandomForest/ExtraTrees classifiers)."""
+    estimators = getattr(model, 'estimators_', None)
+    return (hasattr(model, 'classes_') and isinstance(estimators, list) and len(estimators) > 0
+            and all(hasattr(e, 'tree_') for e in estimators))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 4:
+        print("Usage: python compiled_forest.py <model.joblib> <scaler.joblib> <output_dir>")
+        sys.exit(1)
+    from joblib import load
+    from verdict_cache import artifact_version
+    CompiledForest.from_sklearn(load(sys.argv[1]), load(sys.argv[2])).save(sys.argv[3], artifact_version(*sys.argv[1:3]))
@@ -0,0 +1,316 @@
+"""Parallel, ordered and resumable feature extraction over labelled sample folders.
+
+Both dataset generators hand their per-file extraction function to
+extract_folders(). Files are listed once in sorted order and fanned out to a
+process pool in chunks; results come back in listing order, so the output is
+identical for any worker count. Progress is checkpointed next to the output
+file, and a rerun after a crash continues from the last checkpoint. Output is
+either a CSV or a columnar feature store (see feature_store.py).
+"""
+import csv
+import hashlib
+import json
+import multiprocessing
+import os
+import shutil
+
+from feature_store import FeatureStore
+from manifest import Manifest, report_duplicates
+from sample_scan import scan
+
+DEFAULT_CHUNKSIZE = 64
+DEFAULT_CHECKPOINT_EVERY = 1000
+# Root modules the generators' extraction functions call into; editing any of them invalidates manifest rows
+EXTRACTION_MODULES = ('entropy', 'sample_scan', 'pe_headers', 'pe_analysis')
+
+
+def list_samples(folder_path):
+    """Sorted names of the regular files in a folder."""
+    with os.scandir(folder_path) as entries:
+        return sorted(entry.name for entry in entries if entry.is_file())
+
+
+def list_corpus(folders):
+    """Flatten [(folder_path, label), ...] into an ordered list of (file_path, label)."""
+    items = []
+    for folder_path, label in folders:
+        items.extend((os.path.join(folder_path, name), label) for name in list_samples(folder_path))
+    return items
+
+
+def listing_digest(items):
+    """Fingerprint of the work list, used to refuse resuming against a different corpus."""
+    digest = hashlib.sha256()
+    for file_path, label in items:
+        digest.update(f"{label}\0{file_path}\n".encode('utf-8', 'surrogateescape'))
+    return digest.hexdigest()
+
+
+def iter_features(paths, extract_fn, workers=1, chunksize=DEFAULT_CHUNKSIZE):
+    """Yield extract_fn(path) for every path, in order, using up to `workers` processes."""
+    if workers <= 1:
+        yield from map(extract_fn, paths)
+        return
+    with multiprocessing.Pool(workers) as pool:
+        yield from pool.imap(extract_fn, paths, chunksize)
+
+
+def checkpoint_path(output_file):
+    return output_file + '.ckpt'
+
+
+def _load_checkpoint(output_file, digest):
+    path = checkpoint_path(output_file)
+    if not os.path.exists(path) or not os.path.exists(output_file):
+        return None
+    with open(path) as f:
+        state = json.load(f)
+    if state['listing'] != digest:
+        raise ValueError(f"Checkpoint {path} was written for a different set of input files; "
+                         "delete it to start over.")
+    return state
+
+
+def _save_checkpoint(output_file, state):
+    path = checkpoint_path(output_file)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class _CsvSink:
+    """Rows as CSV text; the checkpoint offset is the file size in bytes."""
+
+    def __init__(self, output_file, fieldnames, offset=None):
+        if offset is not None:
+            # Drop any rows written after the last checkpoint; they will be produced again.
+            with open(output_file, 'r+b') as f:
+                f.truncate(offset)
+        self.file = open(output_file, 'w' if offset is None else 'a', newline='')
+        self.writer = csv.writer(self.file)
+        if offset is None:
+            self.writer.writerow(fieldnames)
+
+    def write(self, label, features, key=None):
+        self.writer.writerow([label] + list(features))
+
+    def commit(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        return os.fstat(self.file.fileno()).st_size
+
+    def close(self):
+        self.file.close()
+
+
+class _StoreSink:
+    """Rows buffered into feature store row groups; the checkpoint offset is the committed row count."""
+
+    def __init__(self, output_file, fieldnames, dtypes, offset=None):
+        if offset is None:
+            columns = [(name, (dtypes or {}).get(name, 'int64')) for name in fieldnames]
+            self.store = FeatureStore.create(output_file, columns, label=fieldnames[0])
+        else:
+            self.store = FeatureStore.open(output_file)
+            self.store.truncate(offset)
+        self.pending = []
+
+    def write(self, label, features, key=None):
+        self.pending.append((key, label) + tuple(features))
+
+    def commit(self):
+        self.store.append(self.pending)
+        self.pending = []
+        return self.store.rows
+
+    def close(self):
+        self.commit()
+
+
+# Set by _Keyed while its extract_fn runs in this process: None until scan_sample() reports the digest
+_keyed_digest = False
+
+
+def scan_sample(data, digests=(), **kwargs):
+    """sample_scan.scan() for extract functions given a sample's full contents.
+
+    When the sample's SHA-256 key is wanted (feature store or manifest output),
+    the digest is computed in the same pass and handed to _Keyed, which then
+    does not read the file a second time.
+    """
+    global _keyed_digest
+    if _keyed_digest is not False and 'sha256' not in digests:
+        digests = tuple(digests) + ('sha256',)
+    result = scan(data, digests=digests, **kwargs)
+    if _keyed_digest is not False:
+        _keyed_digest = bytes.fromhex(result.digests['sha256'])
+    return result
+
+
+class _Keyed:
+    """Picklable wrapper returning (sha256 digest, extract_fn(path)) for feature store rows.
+
+    The digest comes from the extract function's scan_sample() call, or from
+    reading the file again if it made none (or skipped the file before scanning).
+    """
+
+    def __init__(self, extract_fn):
+        self.extract_fn = extract_fn
+
+    def __call__(self, file_path):
+        global _keyed_digest
+        _keyed_digest = None
+        try:
+            features = self.extract_fn(file_path)
+            key = _keyed_digest
+        finally:
+            _keyed_digest = False
+        if key is None:
+            digest = hashlib.sha256()
+            with open(file_path, 'rb') as f:
+                for block in iter(lambda: f.read(1 << 20), b''):
+                    digest.update(block)
+            key = digest.digest()
+        return key, features
+
+
+def extract_folders(folders, extract_fn, output_file, fieldnames, workers=1,
+                    chunksize=DEFAULT_CHUNKSIZE, checkpoint_every=DEFAULT_CHECKPOINT_EVERY, resume=True,
+                    output_format='csv', dtypes=None, manifest=None):
+    """Extract features for every file of every (folder_path, label) pair into a CSV or a feature store.
+
+    extract_fn(file_path) returns a feature tuple, or None to skip the file. It
+    must be a module-level function so it can be sent to worker processes.
+    Each row is [label] + features, written under `fieldnames`. With
+    output_format='store', output_file is a FeatureStore directory, each row
+    also gets the sample's SHA-256 key, and `dtypes` maps column names to
+    dtypes (columns not listed are int64); every checkpoint is one row group.
+    With `manifest` (a SQLite path) extraction is incremental instead, see
+    extract_incremental().
+    """
+    if manifest is not None:
+        return extract_incremental(folders, extract_fn, output_file, fieldnames, manifest, workers, chunksize,
+                                   checkpoint_every, output_format, dtypes, reset=not resume)
+    items = list_corpus(folders)
+    digest = listing_digest(items)
+    state = _load_checkpoint(output_file, digest) if resume else None
+
+    if state is None:
+        state = {'listing': digest, 'done': 0, 'offset': 0}
+        offset = None
+    else:
+        offset = state['offset']
+        print(f"Resuming from checkpoint: {state['done']}/{len(items)} files already processed")
+
+    if output_format == 'store':
+        sink = _StoreSink(output_file, fieldnames, dtypes, offset)
+        extract_fn = _Keyed(extract_fn)
+    else:
+        sink = _CsvSink(output_file, fieldnames, offset)
+
+    remaining = items[state['done']:]
+    try:
+        results = iter_features([file_path for file_path, _ in remaining], extract_fn, workers, chunksize)
+        for (file_path, label), result in zip(remaining, results):
+            key, features = result if output_format == 'store' else (None, result)
+            if features is not None:  # Only write rows for successfully processed files or those with recoverable errors
+                sink.write(label, features, key)
+            state['done'] += 1
+            if state['done'] % checkpoint_every == 0:
+                state['offset'] = sink.commit()
+                _save_checkpoint(output_file, state)
+    finally:
+        sink.close()
+
+    if os.path.exists(checkpoint_path(output_file)):
+        os.remove(checkpoint_path(output_file))
+    return state['done']
+
+
+def extractor_version(extract_fn, fieldnames):
+    """Fingerprint of the output columns, the source file defining extract_fn and the shared extraction modules."""
+    digest = hashlib.sha256('\0'.join(fieldnames).encode())
+    here = os.path.dirname(os.path.abspath(__file__))
+    sources = [extract_fn.__code__.co_filename] + [os.path.join(here, name + '.py') for name in EXTRACTION_MODULES]
+    for path in sources:
+        with open(path, 'rb') as f:
+            digest.update(f.read())
+    import pefile  # pe_headers falls back to it for the samples its own parser does not handle
+    digest.update(pefile.__version__.encode())
+    return digest.hexdigest()[:16]
+
+
+def extract_incremental(folders, extract_fn, output_file, fieldnames, manifest_path, workers=1,
+                        chunksize=DEFAULT_CHUNKSIZE, checkpoint_every=DEFAULT_CHECKPOINT_EVERY,
+                        output_format='csv', dtypes=None, reset=False):
+    """Re-extract only new or changed files, then rewrite the output from the manifest.
+
+    A file is reused when its path, label, size and mtime match its manifest
+    row; rows of files no longer listed are dropped. The manifest is committed
+    every `checkpoint_every` extracted files, so an interrupted run loses at
+    most that much work. Identical samples are reported at the end.
+    """
+    items = [(os.path.abspath(file_path), label) for file_path, label in list_corpus(folders)]
+    extractor = extractor_version(extract_fn, fieldnames)
+    with Manifest(manifest_path, extractor, reset) as manifest:
+        known = manifest.entries()
+        listed = {file_path for file_path, _ in items}
+        removed = [file_path for file_path in known if file_path not in listed]
+        manifest.remove(removed)
+
+        todo = []
+        for file_path, label in items:
+            st = os.stat(file_path)
+            entry = known.get(file_path)
+            if entry is None or entry[:3] != (label, st.st_size, st.st_mtime_ns):
+                todo.append((file_path, label, st))
+        print(f"{len(items) - len(todo)} files unchanged, {len(todo)} to extract, {len(removed)} removed")
+
+        results = iter_features([file_path for file_path, _, _ in todo], _Keyed(extract_fn), workers, chunksize)
+        for done, ((file_path, label, st), (digest, features)) in enumerate(zip(todo, results), 1):
+            manifest.record(file_path, label, st.st_size, st.st_mtime_ns, digest.hex(), features)
+            if done % checkpoint_every == 0:
+                manifest.commit()
+        manifest.commit()
+
+        entries = manifest.entries()
+        if output_format == 'store':
+            if os.path.exists(output_file):
+                shutil.rmtree(output_file)
+            sink = _StoreSink(output_file, fieldnames, dtypes)
+        else:
+            sink = _CsvSink(output_file, fieldnames)
+        try:
+            for written, (file_path, label) in enumerate(items, 1):
+                _, _, _, sha256, features = entries[file_path]
+                if features is not None:
+                    sink.write(label, features, bytes.fromhex(sha256))
+                if written % checkpoint_every == 0 and output_format == 'store':
+                    sink.commit()
+        finally:
+            sink.close()
+        report_duplicates(manifest)
+    return len(items)
+
+
+def add_arguments(parser):
+    """Register the engine's command line options on an argparse parser."""
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Number of worker processes (default: 1, 0 = one per CPU core).')
+    parser.add_argument('--chunksize', type=int, default=DEFAULT_CHUNKSIZE,
+                        help=f'Files handed to a worker at a time (default: {DEFAULT_CHUNKSIZE}).')
+    parser.add_argument('--checkpoint-every', type=int, default=DEFAULT_CHECKPOINT_EVERY,
+                        help=f'Checkpoint progress every N files (default: {DEFAULT_CHECKPOINT_EVERY}).')
+    parser.add_argument('--restart', action='store_true',
+                        help='Ignore an existing checkpoint (or empty the manifest) and start from the beginning.')
+    parser.add_argument('--manifest', metavar='DB',
+                        help='SQLite manifest enabling incremental runs: only new or changed files are extracted.')
+    parser.add_argument('--format', choices=['csv', 'store'], default='csv',
+                        help='Write a CSV (default) or a columnar feature store directory.')
+
+
+def worker_count(workers):
+    return workers if workers > 0 else os.cpu_count() or 1
@@ -0,0 +1,120 @@
+"""Shared Shannon entropy engine used by the server and the dataset generators.
+
+Byte frequencies are counted with NumPy in fixed-size chunks, so the whole
+file never has to be copied into a Python object. The final sum walks the
+byte values in order of first appearance, exactly like the original
+dict-based implementation, so results are bit-identical to it.
+"""
+import math
+import mmap
+import os
+
+import numpy as np
+
+CHUNK_SIZE = 1 << 20  # bytes handed to np.bincount at a time
+
+
+def _as_uint8(data):
+    """Zero-copy uint8 view over bytes, bytearray, memoryview, mmap or ndarray."""
+    if isinstance(data, np.ndarray):
+        return data.reshape(-1).view(np.uint8)
+    return np.frombuffer(data, dtype=np.uint8)
+
+
+class EntropyAccumulator:
+    """Incremental byte histogram; feed chunks with update() and read entropy()."""
+
+    def __init__(self):
+        self.counts = np.zeros(256, dtype=np.int64)
+        self.total = 0
+        self._order = []  # byte values in order of first appearance
+        self._seen = np.zeros(256, dtype=bool)
+
+    def update(self, chunk):
+        arr = _as_uint8(chunk)
+        for start in range(0, len(arr), CHUNK_SIZE):
+            self._update_block(arr[start:start + CHUNK_SIZE])
+        return self
+
+    def _update_block(self, arr):
+        if not len(arr):
+            return
+        counts = np.bincount(arr, minlength=256)
+        self.counts += counts
+        self.total += len(arr)
+        if len(self._order) == 256:
+            return
+        new = (counts > 0) & ~self._seen
+        if not new.any():
+            return
+        # Order the newly seen byte values by first position, scanning doubling prefixes of the block.
+        start, size = 0, 4096
+        while new.any():
+            block = arr[start:start + size]
+            hits = block[new[block]]
+            if len(hits):
+                values, first = np.unique(hits, return_index=True)
+                self._order.extend(int(v) for v in values[np.argsort(first, kind='stable')])
+                new[values] = False
+            start, size = start + size, size * 2
+        self._seen = self.counts > 0
+
+    def ordered_counts(self):
+        """Counts of the byte values seen, in order of first appearance."""
+        return [int(self.counts[b]) for b in self._order]
+
+    def entropy(self):
+        total = self.total
+        if total == 0:
+            return 0.0
+        return -sum((count / total) * math.log2(count / total) for count in self.ordered_counts())
+
+
+def byte_histogram(data):
+    """Return the 256-bin byte count histogram of data."""
+    return EntropyAccumulator().update(data).counts
+
+
+def shannon_entropy(data):
+    """Calculate the Shannon entropy of a block of data (bytes-like, mmap or ndarray)."""
+    return EntropyAccumulator().update(data).entropy()
+
+
+def file_entropy(path, chunk_size=CHUNK_SIZE):
+    """Calculate the entropy of a file through a read-only mmap, keeping memory flat."""
+    acc = EntropyAccumulator()
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return 0.0
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            view = memoryview(mm)
+            try:
+                for start in range(0, len(view), chunk_size):
+                    acc.update(view[start:start + chunk_size])
+            finally:
+                view.release()
+    return acc.entropy()
+
+
+def entropy_profile(data, window=256, step=None, batch=4096):
+    """Return the entropy of each sliding window of data as a float64 array.
+
+    Windows are `window` bytes wide and start every `step` bytes (defaults to
+    non-overlapping). Histograms are built `batch` windows at a time so memory
+    stays bounded regardless of input size.
+    """
+    step = step or window
+    arr = _as_uint8(data)
+    if len(arr) < window:
+        return np.zeros(0, dtype=np.float64)
+    windows = np.lib.stride_tricks.sliding_window_view(arr, window)[::step]
+    out = np.empty(len(windows), dtype=np.float64)
+    for start in range(0, len(windows), batch):
+        block = windows[start:start + batch]
+        rows = np.arange(len(block), dtype=np.int64)[:, None] * 256
+        hist = np.bincount((rows + block).ravel(), minlength=len(block) * 256).reshape(len(block), 256)
+        p = hist / window
+        with np.errstate(divide='ignore', invalid='ignore'):
+            terms = np.where(hist > 0, p * np.log2(p), 0.0)
+        out[start:start + len(block)] = -terms.sum(axis=1)
+    return out
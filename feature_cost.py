@@ -0,0 +1,264 @@
+"""Cost-aware feature selection for the server model.
+
+The server's eight features were chosen from a correlation heatmap in final.py
+without regard to what each one costs to extract. This tool times every feature
+of the all-features dataset generator (pe_analysis.FEATURES) over a corpus and
+weighs that cost against what the feature is worth to the model:
+
+  cost_ms      per-sample extraction time. Every subset pays for the header parse
+               (the server validates uploads with it). Features that read the
+               bytes share one scan: entropy needs a histogram pass,
+               checksum_invalid a word-sum pass, and both together one fused
+               pass. Each feature then adds its own mean time on top.
+  importance   impurity importance in a Random Forest trained on every feature
+  ablation     cross-validated score (train.py's folds, fold cache and Random
+               Forest) along a greedy backward elimination. Each step drops the
+               feature whose removal leaves the best score per millisecond.
+
+The recommended subset has the best score per millisecond of extraction among
+the subsets on the path that score within --tolerance of the best one. Its
+extraction time is then measured on the corpus to check the cost model. Unless
+--no-save is given, a Random Forest trained on the subset is written to
+--model-dir as the server's model and scaler. features.json goes next to them;
+server.py reads it to extract exactly those features, in that order.
+
+Usage:
+  python feature_cost.py <benign_folder> <malicious_folder> [--dataset all_features.csv] [--limit 0]
+                         [--metric accuracy] [--tolerance 0.005] [--folds 5] [--n-jobs -1]
+                         [--cache-dir .train_cache] [--report feature_cost.json]
+                         [--model-dir model] [--no-save]
+
+--dataset scores the features on a dataset written by the all-features generator
+instead of the features extracted from the two folders, which are then only timed.
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+
+import corpus
+import metrics
+from pe_analysis import DEFAULT_FEATURES, FEATURES, FeatureContext, extract_features, parse_pe, scan_needs
+from train import cross_validate, fit_final, load_dataset, save_artifacts
+
+CLASSIFIER = "Random Forest"  # the model server.py serves
+METRICS = ['accuracy', 'auc', 'f1', 'precision', 'recall', 'specificity']
+SCANS = [('histogram',), ('word_sum',), ('histogram', 'word_sum')]
+
+
+def _ms(start):
+    return (time.perf_counter() - start) * 1000
+
+
+def profile_sample(path):
+    """(values of every feature in FEATURES order, timings in ms) of one file, or None if it is not a PE."""
+    with open(path, 'rb') as f:
+        data = f.read()
+    start = time.perf_counter()
+    headers = parse_pe(data)
+    timings = {"parse": _ms(start)}
+    if headers is None:
+        return None
+    for needs in SCANS:
+        start = time.perf_counter()
+        context = FeatureContext(data, headers, needs)
+        timings['+'.join(needs)] = _ms(start)
+    values = []
+    for name, feature in FEATURES.items():  # context holds the fused scan, so no feature pays for it again
+        start = time.perf_counter()
+        values.append(feature.extract(context))
+        timings[name] = _ms(start)
+    return values, timings
+
+
+def subset_cost(features, costs):
+    """Predicted per-sample extraction time in ms: the parse, the scan the features need and each feature's own time."""
+    needs = scan_needs(features)
+    total = costs["parse"] + (costs["scan"]['+'.join(needs)] if needs else 0.0)
+    return total + sum(costs["features"][name] for name in features)
+
+
+def measure_subset(paths, features):
+    """Mean measured ms to parse a file and extract the features, as the server does."""
+    total = 0.0
+    for path in paths:
+        with open(path, 'rb') as f:
+            data = f.read()
+        start = time.perf_counter()
+        headers = parse_pe(data)
+        extract_features(data, headers, features)
+        total += _ms(start)
+    return total / len(paths)
+
+
+def score(result, metric):
+    if metric == 'accuracy':
+        cm = np.array(result["confusion_matrix"])
+        return float(np.trace(cm) / cm.sum())
+    return result[metric]
+
+
+class Evaluator:
+    """Cross-validated score of feature subsets, each subset fitted once."""
+
+    def __init__(self, X, t, names, metric, folds, n_jobs, cache_dir):
+        self.X, self.t, self.names = X, t, names
+        self.metric, self.folds, self.n_jobs, self.cache_dir = metric, folds, n_jobs, cache_dir
+        self._scores = {}
+
+    def __call__(self, features):
+        key = tuple(sorted(features))
+        if key not in self._scores:
+            columns = [self.names.index(name) for name in features]
+            result = cross_validate([CLASSIFIER], self.X[:, columns], self.t, self.folds, self.n_jobs,
+                                    self.cache_dir)[CLASSIFIER]
+            self._scores[key] = score(result, self.metric)
+        return self._scores[key]
+
+
+def backward_elimination(features, evaluate, cost):
+    """Greedy path from all features down to one, dropping the feature that leaves the best score per ms each step.
+
+    Returns the path (one entry per subset) and the score without each feature at the first step.
+    """
+    current = list(features)
+    path = [{"features": list(current), "removed": None, "score": evaluate(current), "cost_ms": cost(current)}]
+    without = {}
+    while len(current) > 1:
+        best = None
+        for name in current:
+            rest = [other for other in current if other != name]
+            rest_score, rest_cost = evaluate(rest), cost(rest)
+            if len(current) == len(features):
+                without[name] = rest_score
+            if best is None or rest_score / rest_cost > best[1] / best[2]:
+                best = (name, rest_score, rest_cost)
+        current.remove(best[0])
+        path.append({"features": list(current), "removed": best[0], "score": best[1], "cost_ms": best[2]})
+    for step in path:
+        step["score_per_ms"] = step["score"] / step["cost_ms"]
+    return path, without
+
+
+def recommend(path, tolerance):
+    """The subset with the best score per ms among those within tolerance of the best score on the path."""
+    best_score = max(step["score"] for step in path)
+    eligible = [step for step in path if step["score"] >= best_score - tolerance]
+    return max(eligible, key=lambda step: step["score_per_ms"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Recommend the PE feature subset with the best accuracy per millisecond '
+                                                 'of extraction, and train the server model on it.')
+    parser.add_argument('benign_folder', help='Folder of benign samples (label 0).')
+    parser.add_argument('malicious_folder', help='Folder of malicious samples (label 1).')
+    parser.add_argument('--dataset', help='All-features generator CSV or feature store to score the features on.')
+    parser.add_argument('--limit', type=int, default=0, help='Profile at most this many files per folder (0 = all).')
+    parser.add_argument('--metric', choices=METRICS, default='accuracy', help='Cross-validated score (default: accuracy).')
+    parser.add_argument('--tolerance', type=float, default=0.005,
+                        help='Score the recommended subset may give up against the best subset (default: 0.005).')
+    parser.add_argument('--folds', type=int, default=5)
+    parser.add_argument('--n-jobs', type=int, default=-1, help='Parallel fold fits (default: -1, one per CPU core).')
+    parser.add_argument('--cache-dir', help='Fitted fold model cache shared with train.py (default: no cache).')
+    parser.add_argument('--report', default='feature_cost.json', help='Where to write the full report.')
+    parser.add_argument('--model-dir', default='model', help='Where to save the model, scaler and features.json.')
+    parser.add_argument('--no-save', action='store_true', help='Only report; leave the model directory alone.')
+    args = parser.parse_args()
+
+    metrics.enable(False)
+    folders = [(args.benign_folder, 0), (args.malicious_folder, 1)]
+    items = []
+    for folder_path, label in folders:
+        folder_items = corpus.list_corpus([(folder_path, label)])
+        items.extend(folder_items[:args.limit] if args.limit else folder_items)
+
+    # Timings are taken in this process, one file at a time, so samples do not compete for the CPU
+    paths, labels, rows, timings = [], [], [], []
+    for file_path, label in items:
+        profiled = profile_sample(file_path)
+        if profiled is None:
+            continue
+        paths.append(file_path)
+        labels.append(label)
+        rows.append(profiled[0])
+        timings.append(profiled[1])
+    if not paths:
+        parser.error('no PE files found in the two folders')
+    print(f"Profiled {len(paths)} PE files ({len(items) - len(paths)} skipped)")
+
+    mean = {key: float(np.mean([timing[key] for timing in timings])) for key in timings[0]}
+    costs = {"parse": mean["parse"], "scan": {'+'.join(needs): mean['+'.join(needs)] for needs in SCANS},
+             "features": {name: mean[name] for name in FEATURES}}
+
+    if args.dataset:
+        X, t, dataset_names = load_dataset(args.dataset)
+        names = [name for name in FEATURES if name in dataset_names]
+        missing = [name for name in FEATURES if name not in dataset_names]
+        if missing:
+            print(f"{args.dataset} has no column for {missing}; selecting among the other features")
+        X = X[:, [dataset_names.index(name) for name in names]]
+    else:
+        X, t, names = np.array(rows, dtype=np.float64), np.array(labels), list(FEATURES)
+    X = np.nan_to_num(X, nan=0.0)  # the generator leaves text_section_entropy empty where the server extracts 0.0
+    if len(np.unique(t)) < 2:
+        parser.error('scoring needs samples of both classes')
+
+    def cost(features):
+        return subset_cost(features, costs)
+
+    evaluate = Evaluator(X, t, names, args.metric, args.folds, args.n_jobs, args.cache_dir)
+    _, fitted = fit_final([CLASSIFIER], X, t, n_jobs=args.n_jobs, cache_dir=args.cache_dir)
+    importance = dict(zip(names, fitted[CLASSIFIER][0].feature_importances_.tolist()))
+    print(f"Greedy backward elimination over {len(names)} features ({args.folds}-fold {args.metric})")
+    path, without = backward_elimination(names, evaluate, cost)
+    chosen = recommend(path, args.tolerance)
+    full = path[0]
+
+    print(f"\n{'feature':<28} {'own ms':>8} {'scan':<19} {'importance':>10} {args.metric + ' without':>18}")
+    for name in sorted(names, key=lambda name: -importance[name]):
+        needs = '+'.join(FEATURES[name].needs) or '-'
+        print(f"{name:<28} {costs['features'][name]:>8.4f} {needs:<19} {importance[name]:>10.4f} "
+              f"{without.get(name, float('nan')):>18.4f}")
+    print(f"\nparse {costs['parse']:.4f} ms/sample; scans: " +
+          ', '.join(f"{key} {value:.4f} ms" for key, value in costs["scan"].items()))
+
+    print(f"\n{'n':>3} {'removed':<28} {args.metric:>9} {'cost ms':>9} {args.metric + '/ms':>13}")
+    for step in path:
+        mark = ' *' if step is chosen else ''
+        print(f"{len(step['features']):>3} {step['removed'] or '-':<28} {step['score']:>9.4f} {step['cost_ms']:>9.4f} "
+              f"{step['score_per_ms']:>13.4f}{mark}")
+
+    current = None
+    if all(name in names for name in DEFAULT_FEATURES):
+        current = {"features": list(DEFAULT_FEATURES), "score": evaluate(DEFAULT_FEATURES),
+                   "cost_ms": cost(DEFAULT_FEATURES), "measured_ms": measure_subset(paths, DEFAULT_FEATURES)}
+    chosen["measured_ms"] = measure_subset(paths, chosen["features"])
+    full["measured_ms"] = measure_subset(paths, full["features"])
+
+    print(f"\n{'subset':<12} {args.metric:>9} {'predicted ms':>13} {'measured ms':>12}")
+    for label, subset in [("all", full), ("current", current), ("recommended", chosen)]:
+        if subset is not None:
+            print(f"{label:<12} {subset['score']:>9.4f} {subset['cost_ms']:>13.4f} {subset['measured_ms']:>12.4f}")
+    print(f"\nRecommended features: {chosen['features']}")
+
+    report = {"corpus": [folder for folder, _ in folders], "dataset": args.dataset, "samples": len(paths),
+              "metric": args.metric, "tolerance": args.tolerance, "folds": args.folds, "costs_ms": costs,
+              "features": {name: {"needs": list(FEATURES[name].needs), "own_ms": costs["features"][name],
+                                  "importance": importance[name], "score_without": without.get(name)}
+                           for name in names},
+              "path": path, "current": current, "recommended": chosen}
+    if not args.no_save:
+        columns = [names.index(name) for name in chosen["features"]]
+        scaler, fitted = fit_final([CLASSIFIER], X[:, columns], t, n_jobs=args.n_jobs, cache_dir=args.cache_dir)
+        save_artifacts(fitted[CLASSIFIER][0], scaler, args.model_dir, chosen["features"],
+                       {"metric": args.metric, "score": chosen["score"], "cost_ms": chosen["cost_ms"],
+                        "measured_ms": chosen["measured_ms"]})
+        report["model_dir"] = args.model_dir
+        print(f"Model, scaler and features.json saved to {args.model_dir}/; server.py extracts these features")
+    with open(args.report, 'w') as f:
+        json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
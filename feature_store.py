@@ -0,0 +1,229 @@
+"""Binary columnar feature store, used in place of the generators' CSV output.
+
+A store is a directory holding schema.json and one raw little-endian file per
+column (<name>.bin). schema.json fixes every column's dtype and records how
+many rows are committed. Rows are appended in row groups: every column file is
+written first and schema.json is replaced last, so a crash never exposes a
+partial row group. Readers memory-map only the columns they ask for.
+
+Each store has a 'sha256' key column (the 32 raw digest bytes of the sample)
+and a label column. Missing integer values are stored as -1, missing floats
+as NaN; export_csv() writes both back as empty fields.
+
+Usage:
+  python feature_store.py info <store>
+  python feature_store.py export <store> <output.csv> [--columns NAME ...] [--with-key]
+  python feature_store.py from-csv <input.csv> <store> [--label malware]
+"""
+import argparse
+import csv
+import json
+import os
+
+import numpy as np
+
+FORMAT = 1
+SCHEMA_FILE = 'schema.json'
+KEY_COLUMN = 'sha256'
+KEY_DTYPE = 'S32'
+EXPORT_CHUNK_ROWS = 65536
+
+
+def null_value(dtype):
+    """Sentinel stored for a missing value of this dtype."""
+    kind = np.dtype(dtype).kind
+    if kind == 'f':
+        return np.nan
+    if kind == 'i':
+        return -1
+    raise ValueError(f"Column dtype {dtype} has no null sentinel")
+
+
+class FeatureStore:
+    def __init__(self, path, columns, label, rows):
+        self.path = path
+        self.columns = [(name, np.dtype(dtype)) for name, dtype in columns]
+        self.label = label
+        self.rows = rows
+
+    @classmethod
+    def create(cls, path, columns, label='malware'):
+        """Create an empty store (replacing any existing one) for [(name, dtype), ...] feature/label columns."""
+        columns = [(KEY_COLUMN, KEY_DTYPE)] + [(name, dtype) for name, dtype in columns if name != KEY_COLUMN]
+        if label not in {name for name, _ in columns}:
+            raise ValueError(f"Label column {label!r} is not in the schema")
+        os.makedirs(path, exist_ok=True)
+        store = cls(path, columns, label, 0)
+        for name, _ in store.columns:
+            open(store._column_path(name), 'wb').close()
+        store._write_schema()
+        return store
+
+    @classmethod
+    def open(cls, path):
+        with open(os.path.join(path, SCHEMA_FILE)) as f:
+            schema = json.load(f)
+        if schema.get('format') != FORMAT:
+            raise ValueError(f"Unsupported feature store format: {schema.get('format')}")
+        columns = [(column['name'], column['dtype']) for column in schema['columns']]
+        return cls(path, columns, schema['label'], schema['rows'])
+
+    @property
+    def names(self):
+        return [name for name, _ in self.columns]
+
+    @property
+    def feature_names(self):
+        """Columns other than the key and the label, in schema order."""
+        return [name for name in self.names if name not in (KEY_COLUMN, self.label)]
+
+    def dtype(self, name):
+        return dict(self.columns)[name]
+
+    def _column_path(self, name):
+        return os.path.join(self.path, f"{name}.bin")
+
+    def _write_schema(self):
+        schema = {"format": FORMAT, "rows": self.rows, "label": self.label, "key": KEY_COLUMN,
+                  "columns": [{"name": name, "dtype": dtype.str} for name, dtype in self.columns]}
+        tmp_path = os.path.join(self.path, SCHEMA_FILE + '.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(schema, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, os.path.join(self.path, SCHEMA_FILE))
+
+    def _to_array(self, values, dtype):
+        if dtype.kind == 'S':
+            return np.array(values, dtype=dtype)
+        sentinel = null_value(dtype)
+        return np.array([sentinel if value is None else value for value in values], dtype=dtype)
+
+    def append(self, rows):
+        """Append one row group; each row is a tuple of values in schema order (key first)."""
+        if not rows:
+            return
+        columns = list(zip(*rows))
+        if len(columns) != len(self.columns):
+            raise ValueError(f"Expected {len(self.columns)} values per row, got {len(columns)}")
+        for (name, dtype), values in zip(self.columns, columns):
+            array = self._to_array(values, dtype)
+            with open(self._column_path(name), 'r+b') as f:
+                # Overwrites anything a crashed writer left past the committed rows
+                f.seek(self.rows * dtype.itemsize)
+                f.write(array.astype(dtype.newbyteorder('<'), copy=False).tobytes())
+                f.truncate()
+                f.flush()
+                os.fsync(f.fileno())
+        self.rows += len(rows)
+        self._write_schema()
+
+    def truncate(self, rows):
+        """Drop every row after the first `rows` (used when resuming from a checkpoint)."""
+        if rows > self.rows:
+            raise ValueError(f"Cannot truncate a store of {self.rows} rows to {rows}")
+        for name, dtype in self.columns:
+            with open(self._column_path(name), 'r+b') as f:
+                f.truncate(rows * dtype.itemsize)
+        self.rows = rows
+        self._write_schema()
+
+    def column(self, name, mmap=True):
+        """One column as an array, memory-mapped read-only by default."""
+        dtype = self.dtype(name).newbyteorder('<')
+        if self.rows == 0:
+            return np.empty(0, dtype=dtype)
+        if mmap:
+            return np.memmap(self._column_path(name), dtype=dtype, mode='r', shape=(self.rows,))
+        return np.fromfile(self._column_path(name), dtype=dtype, count=self.rows)
+
+    def load(self, columns=None, mmap=True):
+        """Dict of name -> array for the requested columns (all of them by default)."""
+        return {name: self.column(name, mmap) for name in (columns or self.names)}
+
+    def to_pandas(self, columns=None, mmap=True):
+        import pandas as pd
+        columns = columns or [name for name in self.names if name != KEY_COLUMN]
+        return pd.DataFrame(self.load(columns, mmap), columns=columns)
+
+    def keys(self):
+        """Hex SHA-256 of every row."""
+        return [key.hex() for key in self.column(KEY_COLUMN).tolist()]
+
+    def export_csv(self, output_file, columns=None, with_key=False):
+        """Write the store as the generators' CSV (label then features); nulls become empty fields."""
+        columns = list(columns or [self.label] + self.feature_names)
+        if with_key:
+            columns = [KEY_COLUMN] + columns
+        arrays = self.load(columns)
+        with open(output_file, 'w', newline='') as csvfile:
+            writer = csv.writer(csvfile)
+            writer.writerow(columns)
+            for start in range(0, self.rows, EXPORT_CHUNK_ROWS):
+                stop = min(start + EXPORT_CHUNK_ROWS, self.rows)
+                chunk = [self._export_values(name, arrays[name][start:stop]) for name in columns]
+                writer.writerows(zip(*chunk))
+
+    def _export_values(self, name, values):
+        dtype = self.dtype(name)
+        if dtype.kind == 'S':
+            return [value.hex() for value in values.tolist()]
+        if dtype.kind == 'f':
+            return [None if value != value else value for value in values.tolist()]
+        return [None if value == -1 else value for value in values.tolist()]
+
+
+def from_csv(input_csv, path, label='malware'):
+    """Convert a generator CSV into a store; columns with any fractional value become float64, the rest int64.
+
+    CSVs carry no sample hashes, so the key column is left zeroed.
+    """
+    with open(input_csv, newline='') as csvfile:
+        reader = csv.reader(csvfile)
+        header = next(reader)
+        rows = [[None if value == '' else value for value in row] for row in reader if row]
+    columns = []
+    for i, name in enumerate(header):
+        values = [row[i] for row in rows if row[i] is not None]
+        is_float = any(not value.lstrip('-').isdigit() for value in values)
+        columns.append((name, 'float64' if is_float else 'int64'))
+    parse = [float if dtype == 'float64' else int for _, dtype in columns]
+    store = FeatureStore.create(path, columns, label)
+    order = [header.index(name) for name in store.names[1:]]
+    for start in range(0, len(rows), EXPORT_CHUNK_ROWS):
+        group = rows[start:start + EXPORT_CHUNK_ROWS]
+        store.append([(bytes(32),) + tuple(None if row[i] is None else parse[i](row[i]) for i in order)
+                      for row in group])
+    return store
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Inspect, export or build a columnar feature store.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    info = commands.add_parser('info', help='Print the schema and row count of a store.')
+    info.add_argument('store')
+    export = commands.add_parser('export', help='Write a store as a CSV in the generators\' layout.')
+    export.add_argument('store')
+    export.add_argument('output_csv')
+    export.add_argument('--columns', nargs='+', help='Columns to export (default: label then features).')
+    export.add_argument('--with-key', action='store_true', help='Add the hex sha256 of each sample as the first column.')
+    convert = commands.add_parser('from-csv', help='Build a store from an existing dataset CSV.')
+    convert.add_argument('input_csv')
+    convert.add_argument('store')
+    convert.add_argument('--label', default='malware', help='Label column (default: malware).')
+    args = parser.parse_args()
+
+    if args.command == 'info':
+        store = FeatureStore.open(args.store)
+        print(f"{store.rows} rows, label column {store.label!r}")
+        for name, dtype in store.columns:
+            print(f"  {name:<32} {dtype}")
+    elif args.command == 'export':
+        FeatureStore.open(args.store).export_csv(args.output_csv, args.columns, args.with_key)
+    else:
+        store = from_csv(args.input_csv, args.store, args.label)
+        print(f"Wrote {store.rows} rows to {args.store}")
+
+
+if __name__ == '__main__':
+    main()
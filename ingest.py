@@ -0,0 +1,129 @@
+"""Streaming upload ingestion.
+
+HashingRequest replaces Flask's request class so that every uploaded file is
+written into a DigestingFile while the multipart body is being parsed. MD5,
+SHA-1 and SHA-256 are updated on each chunk as it arrives, so the digests are
+ready as soon as request.files is, and the bytes are never read back just to
+hash them. Files larger than SPOOL_THRESHOLD roll over to a temp file, which
+read_upload() memory-maps in place instead of copying it again.
+
+MAX_CONTENT_LENGTH (enforced by Werkzeug on the raw body) and MAX_FILE_SIZE
+(enforced here, per file) reject oversized uploads with 413 as soon as the
+limit is crossed, before the rest of the body is received.
+
+Members of an uploaded ZIP archive go through the same DigestingFile with
+read_zip_member(), so they are hashed as they are decompressed and large ones
+are mapped from a temp file rather than held in memory.
+"""
+import hashlib
+import mmap
+import shutil
+from tempfile import SpooledTemporaryFile
+
+from flask import Request, current_app
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.formparser import FormDataParser, MultiPartParser
+
+from pe_analysis import Sample, SPOOL_THRESHOLD, read_sample
+
+UPLOAD_BUFFER_SIZE = 256 * 1024  # bytes read from the socket per multipart parser step (Werkzeug's default is 64KB)
+
+
+class DigestingFile(SpooledTemporaryFile):
+    """Spooled upload buffer that hashes and size-checks every chunk written to it."""
+
+    def __init__(self, max_size=SPOOL_THRESHOLD, limit=None):
+        super().__init__(max_size=max_size, mode='w+b')
+        self.limit = limit
+        self.size = 0
+        self.md5 = hashlib.md5()
+        self.sha1 = hashlib.sha1()
+        self.sha256 = hashlib.sha256()
+
+    def write(self, data):
+        self.size += len(data)
+        if self.limit is not None and self.size > self.limit:
+            raise RequestEntityTooLarge(f"File exceeds the {self.limit} byte limit")
+        self.md5.update(data)
+        self.sha1.update(data)
+        self.sha256.update(data)
+        return super().write(data)
+
+    def digests(self):
+        return {"md5": self.md5.hexdigest(), "sha1": self.sha1.hexdigest(), "sha256": self.sha256.hexdigest()}
+
+    def sample(self, owned=False):
+        """The uploaded bytes as a Sample: in memory, or an mmap of the rolled-over temp file.
+
+        With owned=True this file is closed with the Sample (or right away when the bytes are in memory).
+        """
+        if self._rolled and self.size:
+            self.flush()
+            return Sample(mmap.mmap(self.fileno(), 0, access=mmap.ACCESS_READ), self if owned else None, self.fileno())
+        sample = Sample(self._file.getvalue())
+        if owned:
+            self.close()
+        return sample
+
+
+class _LargeBufferFormDataParser(FormDataParser):
+    def _parse_multipart(self, stream, mimetype, content_length, options):
+        buffer_size = UPLOAD_BUFFER_SIZE
+        if self.max_form_memory_size is not None:
+            # The multipart decoder rejects any single read larger than the form memory limit
+            buffer_size = min(buffer_size, self.max_form_memory_size // 2)
+        parser = MultiPartParser(stream_factory=self.stream_factory, max_form_memory_size=self.max_form_memory_size,
+                                 max_form_parts=self.max_form_parts, cls=self.cls, buffer_size=buffer_size)
+        boundary = options.get("boundary", "").encode("ascii")
+        if not boundary:
+            raise ValueError("Missing boundary")
+        form, files = parser.parse(stream, boundary, content_length)
+        return stream, form, files
+
+
+class HashingRequest(Request):
+    form_data_parser_class = _LargeBufferFormDataParser
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        limit = current_app.config.get('MAX_FILE_SIZE')
+        if limit is not None and content_length is not None and content_length > limit:
+            raise RequestEntityTooLarge(f"File exceeds the {limit} byte limit")
+        return DigestingFile(limit=limit)
+
+
+def file_digests(file):
+    """{"md5", "sha1", "sha256"} of an uploaded FileStorage, hashing it only if it was not streamed through a DigestingFile."""
+    if isinstance(file.stream, DigestingFile):
+        return file.stream.digests()
+    hashers = {name: hashlib.new(name) for name in ("md5", "sha1", "sha256")}
+    position = file.stream.tell()
+    for chunk in iter(lambda: file.stream.read(UPLOAD_BUFFER_SIZE), b""):
+        for hasher in hashers.values():
+            hasher.update(chunk)
+    file.stream.seek(position)
+    return {name: hasher.hexdigest() for name, hasher in hashers.items()}
+
+
+def read_zip_member(archive, info, limit=None, spool_threshold=SPOOL_THRESHOLD):
+    """(Sample, sha256) of one member of an open ZipFile, decompressed once into a DigestingFile.
+
+    Members declaring more than `limit` bytes are rejected before any is read;
+    zipfile stops at the declared size, so the limit holds for what is read too.
+    """
+    if limit is not None and info.file_size > limit:
+        raise RequestEntityTooLarge(f"{info.filename} exceeds the {limit} byte limit")
+    buffer = DigestingFile(max_size=max(1, spool_threshold), limit=limit)  # max_size=0 would never roll over
+    try:
+        with archive.open(info) as member:
+            shutil.copyfileobj(member, buffer, UPLOAD_BUFFER_SIZE)
+        return buffer.sample(owned=True), buffer.sha256.hexdigest()
+    except BaseException:
+        buffer.close()
+        raise
+
+
+def read_upload(file):
+    """Open an uploaded FileStorage as a Sample without reading it a second time when possible."""
+    if isinstance(file.stream, DigestingFile):
+        return file.stream.sample()
+    return read_sample(file.stream)
@@ -0,0 +1,112 @@
+"""SQLite manifest of extracted samples for incremental dataset regeneration.
+
+Every sample the generators have processed is recorded with its path, label,
+size, modification time, SHA-256 and extracted feature row (NULL when the
+extractor skipped the file). On a rerun only files whose size or mtime
+changed, or that are new, are extracted again; rows of files that disappeared
+are dropped. The manifest is tied to an extractor version, and opening it
+with a different version empties it.
+
+Usage: python manifest.py <manifest.db> [--output duplicates.csv]
+prints (or writes) every group of identical samples, marking groups that
+appear under more than one label.
+"""
+import argparse
+import csv
+import json
+import sqlite3
+
+
+class Manifest:
+    def __init__(self, db_path, extractor=None, reset=False):
+        self.db_path = db_path
+        self._db = sqlite3.connect(db_path)
+        self._db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS samples ("
+                         "path TEXT PRIMARY KEY, label INTEGER NOT NULL, size INTEGER NOT NULL, "
+                         "mtime_ns INTEGER NOT NULL, sha256 TEXT NOT NULL, features TEXT)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS samples_sha256 ON samples (sha256)")
+        row = self._db.execute("SELECT value FROM meta WHERE key = 'extractor'").fetchone()
+        if reset or (extractor is not None and (row is None or row[0] != extractor)):
+            # Rows from another extractor (or another version of it) cannot be reused.
+            self._db.execute("DELETE FROM samples")
+            self._db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('extractor', ?)", (extractor,))
+        self._db.commit()
+
+    def entries(self):
+        """Dict of path -> (label, size, mtime_ns, sha256, features or None)."""
+        rows = self._db.execute("SELECT path, label, size, mtime_ns, sha256, features FROM samples")
+        return {path: (label, size, mtime_ns, sha256, None if features is None else json.loads(features))
+                for path, label, size, mtime_ns, sha256, features in rows}
+
+    def record(self, path, label, size, mtime_ns, sha256, features):
+        self._db.execute("INSERT OR REPLACE INTO samples (path, label, size, mtime_ns, sha256, features) "
+                         "VALUES (?, ?, ?, ?, ?, ?)",
+                         (path, label, size, mtime_ns, sha256, None if features is None else json.dumps(list(features))))
+
+    def remove(self, paths):
+        self._db.executemany("DELETE FROM samples WHERE path = ?", ((path,) for path in paths))
+
+    def commit(self):
+        self._db.commit()
+
+    def duplicates(self):
+        """Groups of paths sharing one SHA-256: [(sha256, [(label, path), ...]), ...], most copies first."""
+        rows = self._db.execute("SELECT sha256, label, path FROM samples WHERE sha256 IN "
+                                "(SELECT sha256 FROM samples GROUP BY sha256 HAVING COUNT(*) > 1) "
+                                "ORDER BY sha256, label, path")
+        groups = {}
+        for sha256, label, path in rows:
+            groups.setdefault(sha256, []).append((label, path))
+        return sorted(groups.items(), key=lambda group: len(group[1]), reverse=True)
+
+    def close(self):
+        self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def is_cross_label(group):
+    """True if one content hash appears under more than one label (e.g. both benign and malicious)."""
+    return len({label for label, _ in group}) > 1
+
+
+def report_duplicates(manifest, limit=10):
+    """Print a short summary of duplicate content, listing cross-label groups first."""
+    groups = manifest.duplicates()
+    if not groups:
+        return
+    cross = [group for group in groups if is_cross_label(group[1])]
+    copies = sum(len(paths) - 1 for _, paths in groups)
+    print(f"{len(groups)} duplicate content groups ({copies} redundant files), {len(cross)} found under more than one label")
+    for sha256, paths in (cross + [group for group in groups if not is_cross_label(group[1])])[:limit]:
+        marker = " [labels differ]" if is_cross_label(paths) else ""
+        print(f"  {sha256}{marker}")
+        for label, path in paths:
+            print(f"    {label} {path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Report identical samples recorded in a dataset manifest.')
+    parser.add_argument('manifest', help='Manifest database written by a dataset generator run with --manifest.')
+    parser.add_argument('--output', help='Write every duplicate as sha256,label,path,cross_label rows to this CSV.')
+    args = parser.parse_args()
+
+    with Manifest(args.manifest) as manifest:
+        if args.output is None:
+            report_duplicates(manifest, limit=None)
+            return
+        with open(args.output, 'w', newline='') as csvfile:
+            writer = csv.writer(csvfile)
+            writer.writerow(['sha256', 'label', 'path', 'cross_label'])
+            for sha256, paths in manifest.duplicates():
+                cross = int(is_cross_label(paths))
+                writer.writerows([sha256, label, path, cross] for label, path in paths)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,217 @@
+"""In-process metrics exposed in the Prometheus text format.
+
+Counters, gauges and histograms live in one registry and are rendered by
+render() for the server's /metrics route. stage(name) times one step of the
+analysis pipeline into the analysis_stage_seconds histogram and, when a
+request breakdown is active, appends it there too so the server can return it
+in a Server-Timing header. With metrics disabled, stage() hands back a shared
+no-op context manager and nothing is recorded.
+"""
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import nullcontext
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_enabled = True
+_NOOP = nullcontext()
+_breakdown = contextvars.ContextVar('metrics_breakdown', default=None)
+
+
+def _format_labels(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(v).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n') for _, v in pairs)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.extend(self._render_sample(key, value))
+        return lines
+
+    def _render_sample(self, key, value):
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"]
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def _render_sample(self, key, state):
+        counts, total, count = state
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += bucket_count
+            labels = _format_labels(self.labelnames, key, [('le', _format_value(bound))])
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = _format_labels(self.labelnames, key)
+        lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+        lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name, documentation, labelnames, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, documentation, labelnames, **kwargs)
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._get(Counter, name, documentation, labelnames)
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._get(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._get(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def render(self, only=None, skip=()):
+        """Text exposition of every metric, or of those whose name starts with one of `only` and none of `skip`."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            if (only is not None and not metric.name.startswith(tuple(only))) or metric.name.startswith(tuple(skip)):
+                continue
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+STAGE_SECONDS = REGISTRY.histogram('analysis_stage_seconds', 'Time spent in each analysis pipeline stage.', ['stage'])
+
+
+def enable(flag=True):
+    global _enabled
+    _enabled = bool(flag)
+
+
+def enabled():
+    return _enabled
+
+
+def render(only=None, skip=()):
+    return REGISTRY.render(only, skip)
+
+
+class _Stage:
+    __slots__ = ('name', 'start')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        record_stage(self.name, time.perf_counter() - self.start)
+
+
+def record_stage(name, seconds):
+    """Record a stage timed elsewhere, e.g. in an analysis worker process, as stage() would have."""
+    if not _enabled:
+        return
+    STAGE_SECONDS.observe(seconds, stage=name)
+    breakdown = _breakdown.get()
+    if breakdown is not None:
+        breakdown.append((name, seconds))
+
+
+def stage(name):
+    """Context manager timing one pipeline stage; a shared no-op while metrics are disabled."""
+    if not _enabled:
+        return _NOOP
+    return _Stage(name)
+
+
+def begin_breakdown():
+    """Start collecting the stages run by the current request (thread/context local)."""
+    return _breakdown.set([])
+
+
+def end_breakdown(token):
+    """Stop collecting and return [(stage, seconds), ...] with repeated stages summed, in first-seen order."""
+    stages = _breakdown.get() or []
+    _breakdown.reset(token)
+    totals = {}
+    for name, elapsed in stages:
+        totals[name] = totals.get(name, 0.0) + elapsed
+    return list(totals.items())
+
+
+def server_timing(breakdown):
+    """Format a stage breakdown as a Server-Timing header value (durations in milliseconds)."""
+    return ', '.join(f"{name};dur={elapsed * 1000:.3f}" for name, elapsed in breakdown)
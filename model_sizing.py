@@ -0,0 +1,201 @@
+"""Latency-versus-accuracy sweep over model sizes.
+
+Trains random forests across tree counts, depths and leaf limits, plus the
+XGBoost and LogisticRegression models from final.py, on the training set
+(scaled as train.py does). Each candidate gets:
+
+  AUC, FPR            on the external test set
+  latency_ms          median single-sample predict() (compiled forest for forests, as server.py serves them)
+  rows_per_s          batch throughput predicting the whole test set at once
+  size_kb             serialized joblib size
+  rss_mb              resident memory added by loading the model in a fresh process
+
+The Pareto-optimal candidates (no other candidate is at least as good on AUC,
+FPR, latency and memory and better on one) are exported as drop-in model
+directories for server.py: <output>/<name>/random_forest_model.joblib and
+scaler.joblib, plus compiled/ arrays for forests.
+
+Usage:
+  python model_sizing.py <train> <test> [--trees 10 25 50 100 200] [--depths 0 8 12 16]
+                         [--leaves 0 64 256] [--output sizing] [--n-jobs -1]
+(0 means unlimited for --depths and --leaves)
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+from joblib import Parallel, delayed, dump
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.linear_model import LogisticRegression
+from sklearn.preprocessing import StandardScaler
+
+from compiled_forest import CompiledForest, is_forest
+from pe_analysis import serving_features
+from train import binary_metrics, load_dataset, save_artifacts
+
+LATENCY_REPEATS = 1000
+_RSS_PROBE = """
+import sys, joblib
+def rss():
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * 4096
+joblib.load(sys.argv[2])  # import the model's modules first so only the model is counted
+before = rss()
+model = joblib.load(sys.argv[1])
+print(rss() - before)
+"""
+
+
+def candidates(trees, depths, leaves):
+    """(name, factory) for every model in the sweep."""
+    specs = []
+    for n in trees:
+        for depth in depths:
+            for leaf in leaves:
+                specs.append((f"rf-t{n}-d{depth or 'max'}-l{leaf or 'max'}",
+                              lambda n=n, depth=depth, leaf=leaf: RandomForestClassifier(
+                                  n_estimators=n, max_depth=depth or None, max_leaf_nodes=leaf or None, random_state=0)))
+    try:
+        import xgboost as xgb
+        for n in (50, 100, 200):
+            for depth in (3, 6):
+                specs.append((f"xgb-t{n}-d{depth}", lambda n=n, depth=depth: xgb.XGBClassifier(
+                    n_estimators=n, max_depth=depth, eval_metric='logloss')))
+    except ImportError:
+        print("Skipping XGBoost variants: xgboost is not installed")
+    specs.append(("logreg", lambda: LogisticRegression(random_state=0)))
+    return specs
+
+
+def _fit(name, factory, X, t):
+    return name, factory().fit(X, t)
+
+
+def resident_bytes(model):
+    """Memory added by joblib.load of this model in a fresh interpreter (Linux /proc; None elsewhere)."""
+    if not os.path.exists('/proc/self/statm'):
+        return None
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'model.joblib')
+        dump(model, path)
+        # A throwaway model of the same type makes the probe import the same modules before measuring
+        warm = os.path.join(tmp, 'warm.joblib')
+        dump(type(model)(), warm)
+        output = subprocess.check_output([sys.executable, '-c', _RSS_PROBE, path, warm], text=True)
+    return int(output.strip().splitlines()[-1])
+
+
+def measure(name, model, scaler, X_test, t_test):
+    """Accuracy, latency, throughput and footprint of one fitted model."""
+    compiled = CompiledForest.from_sklearn(model, scaler) if is_forest(model) else None
+
+    def predict_raw(rows):
+        if compiled is not None:
+            return compiled.predict_proba(rows)
+        return model.predict_proba(scaler.transform(rows))
+
+    proba = predict_raw(X_test)
+    result = {"name": name, **{k: v for k, v in binary_metrics(t_test, proba, model.classes_).items()
+                               if k in ("auc", "fpr", "precision", "recall", "f1")}}
+
+    row = X_test[:1]
+    predict_raw(row)
+    timings = []
+    for _ in range(LATENCY_REPEATS):
+        start = time.perf_counter()
+        predict_raw(row)
+        timings.append(time.perf_counter() - start)
+    result["latency_ms"] = round(float(np.median(timings)) * 1000, 4)
+
+    start = time.perf_counter()
+    predict_raw(X_test)
+    result["rows_per_s"] = round(len(X_test) / (time.perf_counter() - start), 1)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'model.joblib')
+        dump(model, path)
+        result["size_kb"] = round(os.path.getsize(path) / 1024, 1)
+    rss = resident_bytes(model)
+    result["rss_mb"] = None if rss is None else round(rss / 2 ** 20, 2)
+    if compiled is not None:
+        result["compiled_kb"] = round(sum(getattr(compiled, array).nbytes for array in
+                                          ('children', 'feature', 'threshold', 'value')) / 1024, 1)
+    return result
+
+
+OBJECTIVES = (("auc", max), ("fpr", min), ("latency_ms", min), ("rss_mb", min))
+
+
+def dominates(a, b):
+    """True if a is at least as good as b on every objective and strictly better on one."""
+    better = False
+    for key, best in OBJECTIVES:
+        if a[key] is None or b[key] is None:
+            continue
+        if a[key] == b[key]:
+            continue
+        if best(a[key], b[key]) != a[key]:
+            return False
+        better = True
+    return better
+
+
+def pareto_front(results):
+    return [r for r in results if not any(dominates(other, r) for other in results if other is not r)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Sweep model sizes and export the latency/accuracy Pareto front.')
+    parser.add_argument('train', help='Training set (CSV or feature store), e.g. final.csv.')
+    parser.add_argument('test', help='External test set, e.g. final_external_test.csv.')
+    parser.add_argument('--trees', type=int, nargs='+', default=[10, 25, 50, 100, 200])
+    parser.add_argument('--depths', type=int, nargs='+', default=[0, 8, 12, 16], help='0 = unlimited.')
+    parser.add_argument('--leaves', type=int, nargs='+', default=[0, 64, 256], help='0 = unlimited.')
+    parser.add_argument('--output', default='sizing', help='Directory for results.json and the exported models.')
+    parser.add_argument('--n-jobs', type=int, default=-1, help='Parallel fits (default: -1, one per CPU core).')
+    args = parser.parse_args()
+
+    X, t, features = load_dataset(args.train)
+    if serving_features(features) is None:
+        parser.error(f"server.py cannot extract the columns {features}")
+    X_test, t_test, test_features = load_dataset(args.test)
+    if test_features != features:
+        parser.error(f"Test set columns {test_features} do not match the training columns {features}")
+    scaler = StandardScaler().fit(X)
+    X_scaled = scaler.transform(X)
+
+    specs = candidates(args.trees, args.depths, args.leaves)
+    print(f"Training {len(specs)} candidates")
+    fitted = Parallel(n_jobs=args.n_jobs)(delayed(_fit)(name, factory, X_scaled, t) for name, factory in specs)
+    # Timings are taken one model at a time so candidates do not compete for the CPU
+    results = [measure(name, model, scaler, X_test, t_test) for name, model in fitted]
+    models = dict(fitted)
+
+    front = pareto_front(results)
+    os.makedirs(args.output, exist_ok=True)
+    for result in front:
+        directory = os.path.join(args.output, result["name"])
+        os.makedirs(os.path.join(directory, 'compiled'), exist_ok=True)  # save_artifacts refreshes it for forests
+        save_artifacts(models[result["name"]], scaler, directory, features)
+        result["pareto"] = True
+        result["artifacts"] = directory
+    with open(os.path.join(args.output, 'results.json'), 'w') as f:
+        json.dump({"train": args.train, "test": args.test, "objectives": [key for key, _ in OBJECTIVES],
+                   "results": results}, f, indent=2)
+
+    print(f"{'model':<24} {'AUC':>6} {'FPR':>6} {'lat ms':>8} {'rows/s':>10} {'KB':>8} {'RSS MB':>7}")
+    for r in sorted(results, key=lambda r: r["latency_ms"]):
+        mark = ' *' if r.get("pareto") else ''
+        print(f"{r['name']:<24} {r['auc']:>6.3f} {r['fpr']:>6.3f} {r['latency_ms']:>8.3f} {r['rows_per_s']:>10.0f} "
+              f"{r['size_kb']:>8.0f} {r['rss_mb'] if r['rss_mb'] is not None else float('nan'):>7.2f}{mark}")
+    print(f"\n{len(front)} Pareto-optimal models (*) exported to {args.output}/; "
+          f"point server.py at one by copying its files into model/.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,233 @@
+"""Single-pass PE analysis shared by the server routes.
+
+An upload is read once into a buffer (or an mmap over a spooled temp file for
+large uploads), its headers, section table and import directory are parsed
+once (see pe_headers.py), and every feature is taken from that one buffer and
+that one parse.
+
+Large samples stay on disk: files are mapped read-only where they are, the
+analysis pool hands workers the file descriptor instead of the bytes, and the
+fused scan releases each chunk's pages once it has been read, so peak memory
+does not grow with the size of the sample (see benchmarks/bench_memory.py).
+
+Features are looked up by name in FEATURES, so the server can run a model
+trained on any subset of them (see feature_cost.py); the scan over the bytes
+only computes the parts the requested features need.
+"""
+import json
+import mmap
+import os
+import shutil
+import tempfile
+from collections import namedtuple
+
+import metrics
+from pe_headers import read_headers, section_entropy, verify_checksum
+from sample_scan import scan
+
+SPOOL_THRESHOLD = 16 * 1024 * 1024  # uploads above this size are spooled to a temp file and mmapped
+COPY_BUFSIZE = 1024 * 1024
+
+INVALID_PE_ERROR = "SUSPICIOUS FILE ALERT: File has an executable signature but an invalid PE header."
+
+# Column order expected by model/scaler.joblib.
+# The server has always filled the import_count slot with the number of imported DLLs.
+FEATURE_NAMES = ['entropy', 'length', 'number_of_sections', 'time_date_stamp',
+                 'characteristics', 'dll_characteristics', 'import_count', 'checksum_invalid']
+
+# Section names counted as nonsuspicious, as in the all-features dataset generator
+NORMAL_SECTION_NAMES = [b'.text', b'.rdata', b'.data', b'.pdata', b'.rsrc', b'.idata', b'.bss', b'.code', b'.edata']
+
+# needs names the parts of the byte scan a feature reads: 'histogram' and/or 'word_sum'
+Feature = namedtuple('Feature', ['name', 'needs', 'extract'])
+
+
+class FeatureContext:
+    """One sample's bytes, its parse and the single scan the requested features share."""
+
+    def __init__(self, data, headers, needs=()):
+        self.data = data
+        self.headers = headers
+        self.scan = None
+        if needs:
+            self.scan = scan(data, digests=(), histogram='histogram' in needs, word_sum='word_sum' in needs)
+
+
+def _checksum_invalid(context):
+    return 0 if verify_checksum(context.data, context.headers, context.scan) else 1
+
+
+def _text_section_entropy(context):
+    """Entropy of the first section named .text; 0.0 if there is none (the generator leaves it empty)."""
+    for section in context.headers.sections:
+        if b'.text' in section.name:
+            return section_entropy(context.headers.section_data(context.data, section))
+    return 0.0
+
+
+def _normal_section_names(context):
+    return sum(name.strip(b'\x00') in NORMAL_SECTION_NAMES for name in context.headers.section_names)
+
+
+def _header(field):
+    return lambda context: getattr(context.headers, field)
+
+
+# Every feature of the all-features dataset generator, under its column name
+FEATURES = {feature.name: feature for feature in [
+    Feature('entropy', ('histogram',), lambda context: context.scan.entropy),
+    Feature('length', (), lambda context: len(context.data)),
+    Feature('number_of_sections', (), _header('number_of_sections')),
+    Feature('time_date_stamp', (), _header('time_date_stamp')),
+    Feature('characteristics', (), _header('characteristics')),
+    Feature('major_image_version', (), _header('major_image_version')),
+    Feature('dll_characteristics', (), _header('dll_characteristics')),
+    Feature('dll_count', (), _header('dll_count')),
+    Feature('import_count', (), _header('import_count')),
+    Feature('checksum_invalid', ('word_sum',), _checksum_invalid),
+    Feature('text_section_entropy', (), _text_section_entropy),
+    Feature('suspicious_section_names', (),
+            lambda context: len(context.headers.section_names) - _normal_section_names(context)),
+    Feature('nonsuspicious_section_names', (), _normal_section_names),
+    Feature('size_of_uninitialized_data', (), _header('size_of_uninitialized_data')),
+    Feature('size_of_initialized_data', (), _header('size_of_initialized_data')),
+]}
+
+# The features behind FEATURE_NAMES, i.e. what the server extracts without a feature list
+DEFAULT_FEATURES = ['entropy', 'length', 'number_of_sections', 'time_date_stamp',
+                    'characteristics', 'dll_characteristics', 'dll_count', 'checksum_invalid']
+
+
+def scan_needs(features):
+    """The scan parts the named features need, as a sorted tuple."""
+    return tuple(sorted({need for name in features for need in FEATURES[name].needs}))
+
+
+def serving_features(columns):
+    """The FEATURES names behind a dataset's feature columns, or None if the server cannot extract them.
+
+    Columns are served as the generators wrote them. In particular a model
+    trained on the optimal-features generator's columns (FEATURE_NAMES) gets the
+    real import_count, the number of imported functions; only the shipped model,
+    which has no features.json, is served dll_count in that slot.
+    """
+    columns = list(columns)
+    if columns and all(name in FEATURES for name in columns):
+        return columns
+    return None
+
+
+def save_feature_list(path, features, info=None):
+    """Write the features.json load_feature_list() reads, or remove it when features are the DEFAULT_FEATURES."""
+    if list(features) == DEFAULT_FEATURES:
+        if os.path.exists(path):
+            os.remove(path)
+        return
+    with open(path, 'w') as f:
+        json.dump({"features": list(features), **(info or {})}, f, indent=2)
+
+
+def load_feature_list(path):
+    """The feature names in a features.json written by feature_cost.py, or DEFAULT_FEATURES if there is no such file."""
+    if not os.path.exists(path):
+        return list(DEFAULT_FEATURES)
+    with open(path) as f:
+        features = json.load(f)["features"]
+    unknown = [name for name in features if name not in FEATURES]
+    if unknown or not features:
+        raise ValueError(f"{path}: unknown or missing features {unknown}; choose from {list(FEATURES)}")
+    return features
+
+
+class Sample:
+    """The bytes of one uploaded file, held in memory or mapped from a spool file.
+
+    fileno is the descriptor of the file an mmapped sample is mapped from, or None
+    for samples held in memory. The spool file, if given, is closed with the sample.
+    """
+
+    def __init__(self, data, spool=None, fileno=None):
+        self.data = data
+        self.size = len(data)
+        self._spool = spool
+        if fileno is None and spool is not None:
+            fileno = spool.fileno()
+        self.fileno = fileno
+
+    def close(self):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+        if self._spool is not None:
+            self._spool.close()
+            self._spool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def read_sample(stream, spool_threshold=SPOOL_THRESHOLD):
+    """Read a file-like stream exactly once into a Sample."""
+    head = stream.read(spool_threshold + 1)
+    if len(head) <= spool_threshold:
+        return Sample(head)
+    spool = tempfile.TemporaryFile()
+    spool.write(head)
+    del head
+    shutil.copyfileobj(stream, spool, COPY_BUFSIZE)
+    spool.flush()
+    return Sample(mmap.mmap(spool.fileno(), 0, access=mmap.ACCESS_READ), spool)
+
+
+def read_sample_file(file_path, spool_threshold=SPOOL_THRESHOLD):
+    """Open a file on disk as a Sample, mapping files above spool_threshold in place instead of copying them."""
+    f = open(file_path, 'rb')
+    try:
+        if os.fstat(f.fileno()).st_size <= spool_threshold:
+            with f:
+                return Sample(f.read())
+        return Sample(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ), f)
+    except BaseException:
+        f.close()
+        raise
+
+
+def parse_pe(data):
+    """Parse data as a Portable Executable, returning its PEHeaders or None if it is not a valid PE.
+
+    Only the headers, the section table and the import directory are read; no
+    feature needs the resource, relocation or debug directories. Samples the
+    struct parser does not handle are parsed with pefile.
+    """
+    try:
+        with metrics.stage('parse'):
+            return read_headers(data)
+    except MemoryError:
+        raise  # a memory budget overrun, not a malformed sample (see analysis_pool.py)
+    except Exception as e:
+        print(f"Failed to validate PE file: {e}")
+        return None
+
+
+def extract_features(data, headers, features=DEFAULT_FEATURES):
+    """Build the model's feature vector, the named features in order, from the sample bytes and their single parse."""
+    # Entropy and the checksum come from one pass over the bytes, which computes only what the features read
+    with metrics.stage('scan'):
+        context = FeatureContext(data, headers, scan_needs(features))
+    return [FEATURES[name].extract(context) for name in features]
+
+
+def features_from_bytes(data, features=DEFAULT_FEATURES):
+    """Parse and extract one sample, returning (features, error); safe to run in a worker process."""
+    headers = parse_pe(data)
+    if headers is None:
+        return None, INVALID_PE_ERROR
+    try:
+        return extract_features(data, headers, features), None
+    except MemoryError:
+        raise
+    except Exception as e:
+        print(f"Error processing file: {e}")
+        return None, "Error processing file"
@@ -0,0 +1,409 @@
+"""Header-only PE parsing with struct, for buffers and memory-mapped files.
+
+Every feature the server and the dataset generators use comes from the DOS and
+NT headers, the section table and the import directory. parse_headers()
+unpacks exactly those structures and nothing else: no resource, relocation or
+debug directory is touched, so the cost does not grow with the size of the
+binary. It only handles the common layout (aligned sections, tables inside
+section raw data, well-formed import thunks) and returns None for anything
+else, in which case read_headers() parses the sample with pefile instead.
+Either way the caller gets a PEHeaders with the values pefile would report.
+
+Usage: python pe_headers.py <folder> [<folder> ...] [--limit N]
+checks the struct parser against pefile on every file and reports the
+mismatches, the fallback rate and the parse times.
+"""
+import argparse
+import math
+import mmap
+import os
+import statistics
+import struct
+import time
+from collections import namedtuple
+
+import pefile
+
+from entropy import EntropyAccumulator
+from sample_scan import scan
+
+IMPORT_DIRECTORY = pefile.DIRECTORY_ENTRY['IMAGE_DIRECTORY_ENTRY_IMPORT']
+CHECKSUM_FIELD = 0x40  # offset of CheckSum in the optional header, for PE32 and PE32+
+MAX_SECTIONS = 96  # the Windows loader limit; larger tables go to pefile
+MAX_DESCRIPTORS = 4096
+
+_FILE_HEADER = struct.Struct('<HHIIIHH')
+_SECTION = struct.Struct('<8sIIII12xI')
+_DESCRIPTOR = struct.Struct('<IIIII')
+_OPTIONAL = {  # Magic -> (size without data directories, thunk format, ordinal flag, address mask)
+    0x10b: (96, struct.Struct('<I'), 1 << 31, 0x7FFFFFFF),
+    0x20b: (112, struct.Struct('<Q'), 1 << 63, 0x7FFFFFFFFFFFFFFF),
+}
+
+Section = namedtuple('Section', 'name virtual_address virtual_size pointer_to_raw_data size_of_raw_data')
+
+
+class PEHeaders:
+    """The header fields, section table and import counts of one PE file."""
+
+    def __init__(self, machine, time_date_stamp, characteristics, magic, major_image_version,
+                 size_of_initialized_data, size_of_uninitialized_data, dll_characteristics, section_alignment,
+                 checksum, checksum_offset, sections, imports, source):
+        self.machine = machine
+        self.time_date_stamp = time_date_stamp
+        self.characteristics = characteristics
+        self.magic = magic
+        self.major_image_version = major_image_version
+        self.size_of_initialized_data = size_of_initialized_data
+        self.size_of_uninitialized_data = size_of_uninitialized_data
+        self.dll_characteristics = dll_characteristics
+        self.section_alignment = section_alignment
+        self.checksum = checksum
+        self.checksum_offset = checksum_offset
+        self.sections = sections  # ordered by VirtualAddress, as pefile orders them
+        self.imports = imports  # [(dll name, number of imported symbols), ...]
+        self.source = source  # 'struct' or 'pefile'
+
+    @property
+    def number_of_sections(self):
+        return len(self.sections)
+
+    @property
+    def section_names(self):
+        return [section.name for section in self.sections]
+
+    @property
+    def dll_count(self):
+        return len(self.imports)
+
+    @property
+    def import_count(self):
+        return sum(count for _, count in self.imports)
+
+    def section_data(self, data, section):
+        """The raw bytes of a section, as pefile's SectionStructure.get_data() returns them."""
+        start = section.pointer_to_raw_data & ~0x1FF
+        if self.section_alignment < 0x1000 and section.pointer_to_raw_data == section.virtual_address:
+            start = section.virtual_address
+        end = min(start + section.size_of_raw_data, section.pointer_to_raw_data + section.size_of_raw_data)
+        return data[start:end]
+
+    @classmethod
+    def from_pefile(cls, pe):
+        optional = pe.OPTIONAL_HEADER
+        sections = [Section(s.Name, s.VirtualAddress, s.Misc_VirtualSize, s.PointerToRawData, s.SizeOfRawData)
+                    for s in pe.sections]
+        imports = [(entry.dll, len(entry.imports)) for entry in getattr(pe, 'DIRECTORY_ENTRY_IMPORT', [])]
+        return cls(pe.FILE_HEADER.Machine, pe.FILE_HEADER.TimeDateStamp, pe.FILE_HEADER.Characteristics,
+                   optional.Magic, optional.MajorImageVersion, optional.SizeOfInitializedData,
+                   optional.SizeOfUninitializedData, optional.DllCharacteristics, optional.SectionAlignment,
+                   optional.CheckSum, optional.get_file_offset() + CHECKSUM_FIELD, sections, imports, 'pefile')
+
+
+class _Unusual(Exception):
+    """Raised inside the struct parser when pefile's heuristics could apply; the caller falls back to pefile."""
+
+
+class _Image:
+    """RVA lookups over the raw data of the sections, limited to the layouts where pefile reads the same bytes."""
+
+    def __init__(self, data, sections):
+        self.data = data
+        self.ranges = []
+        for i, section in enumerate(sections):
+            start = section.virtual_address
+            end = start + max(section.size_of_raw_data, section.virtual_size)
+            if i + 1 < len(sections):
+                following = sections[i + 1].virtual_address
+                if following <= start:
+                    raise _Unusual("sections share a virtual address")
+                end = min(end, following)
+            self.ranges.append((start, end, section))
+
+    def offset(self, rva, length):
+        for start, end, section in self.ranges:
+            if start <= rva < end:
+                if rva + length > start + section.size_of_raw_data:
+                    raise _Unusual("data outside the section's raw data")
+                return rva - start + section.pointer_to_raw_data
+        raise _Unusual("RVA outside every section")
+
+    def string(self, rva, max_length=512):
+        for start, end, section in self.ranges:
+            if start <= rva < end:
+                offset = rva - start + section.pointer_to_raw_data
+                limit = min(offset + max_length, section.pointer_to_raw_data + section.size_of_raw_data)
+                terminator = self.data.find(b'\0', offset, limit)
+                if terminator < 0:
+                    raise _Unusual("unterminated string")
+                return self.data[offset:terminator]
+        raise _Unusual("RVA outside every section")
+
+
+def _thunks(image, rva, max_length, thunk, ordinal_flag, budget):
+    """AddressOfData values of one thunk array, mirroring pefile's get_import_table() on a well-formed table."""
+    values = []
+    seen = set()
+    start = rva
+    while rva:
+        if rva >= start + max_length:
+            raise _Unusual("thunk array runs past its bounds")
+        budget[0] -= 1
+        if budget[0] < 0:
+            raise _Unusual("too many import symbols")
+        value, = thunk.unpack_from(image.data, image.offset(rva, thunk.size))
+        if start <= value <= rva:
+            raise _Unusual("AddressOfData overlaps the thunk array")
+        if not value:
+            break
+        if value & ordinal_flag:
+            if value & 0x7FFFFFFF > 0xFFFF:
+                raise _Unusual("ordinal out of range")
+        elif value >= 1 << 32 or value in seen:
+            raise _Unusual("implausible hint/name RVA")
+        seen.add(value)
+        values.append(value)
+        rva += thunk.size
+    names = [value for value in values if not value & ordinal_flag]
+    if names and max(names) - min(names) > 128 * 2 ** 20:
+        raise _Unusual("hint/name RVAs spread too far")
+    return values
+
+
+def _imports(image, rva, thunk, ordinal_flag, address_mask):
+    imports = []
+    budget = [pefile.MAX_IMPORT_SYMBOLS]
+    for _ in range(MAX_DESCRIPTORS):
+        offset = image.offset(rva, _DESCRIPTOR.size)
+        original_first_thunk, _, _, name_rva, first_thunk = _DESCRIPTOR.unpack_from(image.data, offset)
+        if not any(image.data[offset:offset + _DESCRIPTOR.size]):
+            return imports
+        rva += _DESCRIPTOR.size
+        max_length = len(image.data) - offset
+        if rva > original_first_thunk or rva > first_thunk:
+            max_length = max(rva - original_first_thunk, rva - first_thunk)
+        lookup = _thunks(image, original_first_thunk, max_length, thunk, ordinal_flag, budget)
+        table = lookup or _thunks(image, first_thunk, max_length, thunk, ordinal_flag, budget)
+        if lookup:
+            _thunks(image, first_thunk, max_length, thunk, ordinal_flag, budget)  # pefile walks the IAT too
+        if not table:
+            raise _Unusual("descriptor without imports")
+        for value in table:
+            if value & ordinal_flag:
+                if not value & 0xFFFF:
+                    raise _Unusual("ordinal 0")
+                continue
+            image.offset(value & address_mask, 2)
+            name = image.string(value + 2)
+            if not name or not pefile.is_valid_function_name(name):
+                raise _Unusual("invalid import name")
+        dll = image.string(name_rva)
+        if not dll or not pefile.is_valid_dos_filename(dll):
+            raise _Unusual("invalid DLL name")
+        imports.append((dll, len(table)))
+    raise _Unusual("too many import descriptors")
+
+
+def parse_headers(data):
+    """PEHeaders for data (bytes or mmap) using struct alone, or None if the file needs pefile."""
+    try:
+        return _parse(data)
+    except (_Unusual, struct.error):
+        return None
+
+
+def _parse(data):
+    size = len(data)
+    if size < 64 or data[:2] != b'MZ':
+        raise _Unusual("no DOS header")
+    nt_offset, = struct.unpack_from('<I', data, 0x3C)
+    if nt_offset + 24 > size or data[nt_offset:nt_offset + 4] != b'PE\0\0':
+        raise _Unusual("no NT headers")
+    machine, section_count, time_date_stamp, _, _, optional_size, characteristics = \
+        _FILE_HEADER.unpack_from(data, nt_offset + 4)
+    optional_offset = nt_offset + 24
+    magic, = struct.unpack_from('<H', data, optional_offset)
+    if magic not in _OPTIONAL:
+        raise _Unusual("unknown optional header magic")
+    optional_length, thunk, ordinal_flag, address_mask = _OPTIONAL[magic]
+    size_of_initialized_data, size_of_uninitialized_data = struct.unpack_from('<II', data, optional_offset + 8)
+    section_alignment, file_alignment = struct.unpack_from('<II', data, optional_offset + 32)
+    major_image_version, = struct.unpack_from('<H', data, optional_offset + 44)
+    checksum, = struct.unpack_from('<I', data, optional_offset + CHECKSUM_FIELD)
+    dll_characteristics, = struct.unpack_from('<H', data, optional_offset + 70)
+    directory_count, = struct.unpack_from('<I', data, optional_offset + optional_length - 4)
+    directory_count = min(directory_count & 0x7FFFFFFF, 16)
+    directories_offset = optional_offset + optional_length
+    if directories_offset + 8 * directory_count > size:
+        raise _Unusual("truncated data directories")
+
+    # pefile warns about (and may stop at) anything outside this layout; those files take the pefile path
+    if not 0 < section_count <= MAX_SECTIONS or file_alignment < 0x200 or file_alignment & (file_alignment - 1):
+        raise _Unusual("unusual section layout")
+    # Below the page size the loader aligns sections to FileAlignment; aligned addresses need no adjusting
+    alignment = section_alignment if section_alignment >= 0x1000 else file_alignment
+    table_offset = optional_offset + optional_size
+    if table_offset + _SECTION.size * section_count > size:
+        raise _Unusual("truncated section table")
+    sections = []
+    for i in range(section_count):
+        offset = table_offset + _SECTION.size * i
+        if not any(data[offset:offset + _SECTION.size]):
+            raise _Unusual("empty section header")
+        name, virtual_size, virtual_address, raw_size, raw_pointer, _ = _SECTION.unpack_from(data, offset)
+        if raw_pointer + raw_size > size or raw_pointer % file_alignment or virtual_address % alignment \
+                or virtual_size > 0x10000000 or virtual_address > 0x10000000:
+            raise _Unusual("unusual section")
+        sections.append(Section(name, virtual_address, virtual_size, raw_pointer, raw_size))
+    sections.sort(key=lambda section: section.virtual_address)
+
+    imports = []
+    if directory_count > IMPORT_DIRECTORY:
+        import_rva, _ = struct.unpack_from('<II', data, directories_offset + 8 * IMPORT_DIRECTORY)
+        if import_rva:
+            imports = _imports(_Image(data, sections), import_rva, thunk, ordinal_flag, address_mask)
+    return PEHeaders(machine, time_date_stamp, characteristics, magic, major_image_version,
+                     size_of_initialized_data, size_of_uninitialized_data, dll_characteristics, section_alignment,
+                     checksum, optional_offset + CHECKSUM_FIELD, sections, imports, 'struct')
+
+
+def parse_with_pefile(data):
+    """PEHeaders from a pefile parse of the headers and import directory; raises pefile.PEFormatError if data is not a PE."""
+    pe = pefile.PE(data=data, fast_load=True)
+    pe.parse_data_directories(directories=[IMPORT_DIRECTORY])
+    return PEHeaders.from_pefile(pe)
+
+
+def read_headers(data):
+    """PEHeaders for data, from the struct parser when it can, otherwise from pefile."""
+    return parse_headers(data) or parse_with_pefile(data)
+
+
+def verify_checksum(data, headers, scan_result=None):
+    """True if the optional header CheckSum matches the data, computed as pefile's generate_checksum() does.
+
+    Pass the ScanResult of a sample_scan.scan() over data to reuse its word sum
+    instead of reading the data again.
+    """
+    if scan_result is None:
+        scan_result = scan(data, digests=(), histogram=False)
+    return headers.checksum == scan_result.pe_checksum(data, headers.checksum_offset)
+
+
+def section_entropy(data):
+    """Entropy of a section's bytes exactly as pefile's SectionStructure.get_entropy() computes it."""
+    if not len(data):
+        return 0.0
+    acc = EntropyAccumulator().update(data)
+    entropy = 0
+    for count in acc.ordered_counts():
+        p_x = float(count) / acc.total
+        entropy -= p_x * math.log(p_x, 2)
+    return entropy
+
+
+def _features(data, headers):
+    """Every value the generators take from a parse, for comparing the two parsers."""
+    text = next((section for section in headers.sections if b'.text' in section.name), None)
+    return {
+        "number_of_sections": headers.number_of_sections,
+        "time_date_stamp": headers.time_date_stamp,
+        "characteristics": headers.characteristics,
+        "major_image_version": headers.major_image_version,
+        "dll_characteristics": headers.dll_characteristics,
+        "size_of_initialized_data": headers.size_of_initialized_data,
+        "size_of_uninitialized_data": headers.size_of_uninitialized_data,
+        "section_names": headers.section_names,
+        "dll_count": headers.dll_count,
+        "import_count": headers.import_count,
+        "text_section_entropy": None if text is None else section_entropy(headers.section_data(data, text)),
+        "checksum_valid": verify_checksum(data, headers),
+    }
+
+
+def _pefile_features(data, pe):
+    """The same values, read from a full pefile parse the way the generators used to."""
+    text = next((section for section in pe.sections if b'.text' in section.Name), None)
+    imports = getattr(pe, 'DIRECTORY_ENTRY_IMPORT', [])
+    return {
+        "number_of_sections": len(pe.sections),
+        "time_date_stamp": pe.FILE_HEADER.TimeDateStamp,
+        "characteristics": pe.FILE_HEADER.Characteristics,
+        "major_image_version": pe.OPTIONAL_HEADER.MajorImageVersion,
+        "dll_characteristics": pe.OPTIONAL_HEADER.DllCharacteristics,
+        "size_of_initialized_data": pe.OPTIONAL_HEADER.SizeOfInitializedData,
+        "size_of_uninitialized_data": pe.OPTIONAL_HEADER.SizeOfUninitializedData,
+        "section_names": [section.Name for section in pe.sections],
+        "dll_count": len(imports),
+        "import_count": sum(len(dll.imports) for dll in imports),
+        "text_section_entropy": None if text is None else text.get_entropy(),
+        "checksum_valid": pe.verify_checksum(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check the struct header parser against pefile on a corpus.')
+    parser.add_argument('folders', nargs='+', help='Folders of samples to check.')
+    parser.add_argument('--limit', type=int, help='Check at most this many files per folder.')
+    parser.add_argument('--large', type=int, default=1 << 20, help='Size in bytes from which a file counts as large (default: 1MB).')
+    args = parser.parse_args()
+
+    timings = {"struct": [], "pefile fast_load": [], "pefile": []}
+    large = {name: [] for name in timings}
+    checked = fallbacks = not_pe = 0
+    mismatches = []
+    for folder in args.folders:
+        names = sorted(entry.name for entry in os.scandir(folder) if entry.is_file())[:args.limit]
+        for name in names:
+            path = os.path.join(folder, name)
+            with open(path, 'rb') as f:
+                if os.fstat(f.fileno()).st_size == 0:
+                    continue
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                    start = time.perf_counter()
+                    headers = parse_headers(data)
+                    struct_seconds = time.perf_counter() - start
+                    try:
+                        start = time.perf_counter()
+                        parse_with_pefile(data)
+                        fast_seconds = time.perf_counter() - start
+                        start = time.perf_counter()
+                        pe = pefile.PE(data=data)
+                        full_seconds = time.perf_counter() - start
+                    except pefile.PEFormatError:
+                        not_pe += 1
+                        if headers is not None:
+                            mismatches.append((path, "parsed by struct but rejected by pefile"))
+                        continue
+                    checked += 1
+                    if headers is None:
+                        fallbacks += 1
+                        headers = parse_with_pefile(data)
+                    expected = _pefile_features(data, pe)
+                    actual = _features(data, headers)
+                    differing = [key for key in expected if expected[key] != actual[key]]
+                    if differing:
+                        mismatches.append((path, ", ".join(f"{key}: {actual[key]!r} != {expected[key]!r}"
+                                                           for key in differing)))
+                    pe.close()
+                    for timing, seconds in zip(timings, (struct_seconds, fast_seconds, full_seconds)):
+                        timings[timing].append(seconds)
+                        if len(data) >= args.large:
+                            large[timing].append(seconds)
+
+    print(f"{checked} PE files checked ({not_pe} rejected by pefile), {fallbacks} fell back to pefile, "
+          f"{len(mismatches)} mismatches")
+    for path, reason in mismatches[:20]:
+        print(f"  {path}: {reason}")
+    for label, group in (("all files", timings), (f"files >= {args.large} bytes", large)):
+        if not group["struct"]:
+            continue
+        print(f"\n{label} ({len(group['struct'])}): median ms per file")
+        base = statistics.median(group["struct"])
+        for timing, seconds in group.items():
+            median = statistics.median(seconds)
+            print(f"  {timing:<18} {median * 1000:>9.3f}  ({median / base:.1f}x struct)")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,37 +1,94 @@
 import os
 import sys
+import json
+import zlib
+import argparse
 import pefile
 import csv
-from collections import defaultdict
+from collections import Counter
 
+# Shared modules live in the repository root
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import corpus  # noqa: E402
 
-def count_imported_functions(directory, output_csv):
-    # Dictionary to store the count of files importing each function
-    function_count = defaultdict(int)
+IMPORT_DIRECTORY = pefile.DIRECTORY_ENTRY['IMAGE_DIRECTORY_ENTRY_IMPORT']
+SHARD_FORMAT = 1
 
-    # Iterate through all files in the given directory
-    for filename in os.listdir(directory):
-        filepath = os.path.join(directory, filename)
 
-        try:
-            # Attempt to load the PE file
-            pe = pefile.PE(filepath)
+def imported_functions(filepath):
+    """ Count the named imports of one PE file as 'dll!function' keys, or return None if it is not a PE. """
+    try:
+        # Only the headers and the import directory are needed
+        pe = pefile.PE(filepath, fast_load=True)
+        pe.parse_data_directories(directories=[IMPORT_DIRECTORY])
+    except (OSError, pefile.PEFormatError):
+        # Skip files that are not PE files or are corrupted
+        return None
 
-            # Check if the PE file has imports
-            if hasattr(pe, 'DIRECTORY_ENTRY_IMPORT'):
-                # Iterate through each import entry
-                for entry in pe.DIRECTORY_ENTRY_IMPORT:
-                    for imp in entry.imports:
-                        if imp.name is not None:
-                            # Increment the count for this function
-                            function_count[imp.name.decode()] += 1
+    counts = Counter()
+    for entry in getattr(pe, 'DIRECTORY_ENTRY_IMPORT', []):
+        dll = entry.dll.decode(errors='replace').lower()
+        for imp in entry.imports:
+            if imp.name is not None:
+                counts[f"{dll}!{imp.name.decode(errors='replace')}"] += 1
+    pe.close()
+    return counts
 
-        except OSError:
-            # Skip files that are not PE files or are corrupted
-            continue
-        except pefile.PEFormatError:
-            # Handle PE format errors
-            continue
+
+def in_shard(filename, shard_index, shard_count):
+    """ Stable file-to-shard assignment that does not depend on listing order or machine. """
+    return zlib.crc32(filename.encode('utf-8', 'surrogateescape')) % shard_count == shard_index
+
+
+def count_shard(directory, shard_index=0, shard_count=1, workers=1, chunksize=corpus.DEFAULT_CHUNKSIZE):
+    """ Partial census of the files of `directory` that fall in one shard. """
+    names = [name for name in corpus.list_samples(directory) if in_shard(name, shard_index, shard_count)]
+    paths = [os.path.join(directory, name) for name in names]
+    counts = Counter()
+    failed = 0
+    for file_counts in corpus.iter_features(paths, imported_functions, workers, chunksize):
+        if file_counts is None:
+            failed += 1
+        else:
+            counts.update(file_counts)
+    return {"format": SHARD_FORMAT, "files": len(paths) - failed, "failed": failed, "counts": dict(counts)}
+
+
+def merge_shards(shards):
+    """ Sum partial censuses; the merge is associative, so shards can be combined in any grouping. """
+    merged = {"format": SHARD_FORMAT, "files": 0, "failed": 0, "counts": Counter()}
+    for shard in shards:
+        if shard.get("format") != SHARD_FORMAT:
+            raise ValueError(f"Unsupported shard format: {shard.get('format')}")
+        merged["files"] += shard["files"]
+        merged["failed"] += shard["failed"]
+        merged["counts"].update(shard["counts"])
+    merged["counts"] = dict(merged["counts"])
+    return merged
+
+
+def load_shard(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def write_shard(shard, path):
+    with open(path, 'w') as f:
+        json.dump(shard, f)
+
+
+def write_counts_csv(counts, output_csv, keys='function'):
+    """ Write the census as the Function,Count CSV read by the comparison script.
+
+    keys='function' sums the DLL-qualified counts per function name (the
+    original output); keys='dll' keeps the 'dll!function' keys.
+    """
+    if keys == 'function':
+        function_count = Counter()
+        for key, count in counts.items():
+            function_count[key.split('!', 1)[1]] += count
+    else:
+        function_count = counts
 
     # Sort the dictionary by count in descending order
     sorted_function_count = sorted(function_count.items(), key=lambda item: item[1], reverse=True)
@@ -44,18 +101,59 @@ def count_imported_functions(directory, output_csv):
             writer.writerow([func, count])
 
 
-if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        print("Usage: python script.py <directory> [output_csv_path]")
-        sys.exit(1)
+def count_imported_functions(directory, output_csv, workers=1):
+    # Count how often each function is imported across all PE files of the directory
+    shard = count_shard(directory, workers=workers)
+    write_counts_csv(shard["counts"], output_csv)
+
 
-    # Directory to analyze
-    directory = sys.argv[1]
+def main():
+    parser = argparse.ArgumentParser(
+        description='Count imported functions over a folder of PE files. Large corpora can be split into '
+                    'shards (--shard-index/--shard-count, written with --shard) and combined with --merge.')
+    parser.add_argument('directory', nargs='?', help='Folder of PE files to analyze.')
+    parser.add_argument('output_csv', nargs='?', default='imported_functions_count.csv',
+                        help='CSV file to write (default: imported_functions_count.csv).')
+    parser.add_argument('--workers', type=int, default=1, help='Number of worker processes (default: 1, 0 = one per CPU core).')
+    parser.add_argument('--chunksize', type=int, default=corpus.DEFAULT_CHUNKSIZE,
+                        help=f'Files handed to a worker at a time (default: {corpus.DEFAULT_CHUNKSIZE}).')
+    parser.add_argument('--shard-index', type=int, default=0, help='Which shard of the folder to count (default: 0).')
+    parser.add_argument('--shard-count', type=int, default=1, help='Number of shards the folder is split into (default: 1).')
+    parser.add_argument('--shard', metavar='JSON', help='Write the partial counts to this JSON shard instead of a CSV.')
+    parser.add_argument('--merge', nargs='+', metavar='JSON', help='Merge JSON shards instead of scanning a folder.')
+    parser.add_argument('--output', metavar='CSV',
+                        help='CSV file to write; the way to name it after --merge (default: the output_csv argument).')
+    parser.add_argument('--keys', choices=['function', 'dll'], default='function',
+                        help="CSV keys: plain function names (default) or 'dll!function'.")
+    args = parser.parse_args()
 
-    # CSV output path (optional argument)
-    if len(sys.argv) > 2:
-        output_csv = sys.argv[2]
+    if args.output is not None:
+        if args.output_csv != parser.get_default('output_csv'):
+            parser.error('give the CSV file either as output_csv or with --output, not both')
+        args.output_csv = args.output
+    if args.merge:
+        csv_paths = [path for path in args.merge if path.lower().endswith('.csv')]
+        if csv_paths:
+            parser.error(f'--merge takes JSON shards, not {", ".join(csv_paths)}; name the CSV with --output')
+        if args.directory is not None and args.output is None and args.output_csv == parser.get_default('output_csv'):
+            args.output_csv = args.directory  # only an output path was given, before --merge
+        elif args.directory is not None:
+            parser.error('a folder cannot be scanned together with --merge')
+        shard = merge_shards(load_shard(path) for path in args.merge)
     else:
-        output_csv = 'imported_functions_count.csv'  # Default CSV file path
+        if args.directory is None:
+            parser.error('a folder (or --merge) is required')
+        if not 0 <= args.shard_index < args.shard_count:
+            parser.error('--shard-index must be between 0 and --shard-count - 1')
+        shard = count_shard(args.directory, args.shard_index, args.shard_count,
+                            corpus.worker_count(args.workers), args.chunksize)
 
-    count_imported_functions(directory, output_csv)
+    print(f"{shard['files']} PE files, {shard['failed']} skipped, {len(shard['counts'])} distinct imports")
+    if args.shard:
+        write_shard(shard, args.shard)
+    else:
+        write_counts_csv(shard["counts"], args.output_csv, args.keys)
+
+
+if __name__ == "__main__":
+    main()
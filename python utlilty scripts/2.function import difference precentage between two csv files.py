@@ -1,55 +1,185 @@
-import csv
-from collections import defaultdict
-
-
-def compare_function_counts(csv_file1, csv_file2, output_csv):
-    # Load the function counts from both CSV files
-    def load_function_counts(filename):
-        counts = defaultdict(int)
-        with open(filename, newline='') as csvfile:
-            reader = csv.reader(csvfile)
-            next(reader)  # Skip the header row
-            for row in reader:
-                if row:
-                    function, count = row[0], int(row[1])
-                    counts[function] = count
-        return counts
-
-    counts1 = load_function_counts(csv_file1)
-    counts2 = load_function_counts(csv_file2)
-
-    # Compare function counts and calculate percentage differences
-    all_functions = set(counts1.keys()) | set(counts2.keys())
-    results = []
-    for func in all_functions:
-        count1 = counts1[func]
-        count2 = counts2[func]
-        total = count1 + count2
-        if total > 0:
-            percent_difference = ((count1 - count2) / total) * 100
-        else:
-            percent_difference = 0  # To handle cases where both counts are zero
-
-        # Append only if the percentage difference is negative
-        if percent_difference < 0:
-            results.append([func, count1, count2, percent_difference])
-
-    # Sort results by the maximum count from either file, descending
-    results.sort(key=lambda x: max(x[1], x[2]), reverse=True)
-
-    # Write the results to the output CSV file
-    with open(output_csv, 'w', newline='') as csvfile:
-        writer = csv.writer(csvfile)
-        writer.writerow(['Function', 'Count in File 1', 'Count in File 2', 'Percentage Difference'])
-        for result in results:
-            writer.writerow(result)
+import os
+import json
+import argparse
 
+import numpy as np
+import pandas as pd
 
-if __name__ == "__main__":
-    import sys
 
-    if len(sys.argv) < 4:
-        print("Usage: python script.py <csv_file1> <csv_file2> <output_csv>")
-        sys.exit(1)
+def read_census(path, keys=None):
+    """ (functions, counts, number of files or None) of a census CSV (Function,Count) or a JSON shard of script 1.
+
+    keys='function' sums 'dll!function' keys per function name, as script 1's
+    default CSV output does; otherwise the keys are returned as stored.
+    """
+    if path.endswith('.json'):
+        with open(path) as f:
+            shard = json.load(f)
+        functions = np.array(list(shard["counts"]), dtype=object)
+        counts = np.fromiter(shard["counts"].values(), dtype=np.int64, count=len(functions))
+        file_count = shard.get("files")
+    else:
+        df = pd.read_csv(path, usecols=[0, 1], dtype={0: object}, keep_default_na=False, engine='c')
+        functions, counts, file_count = df.iloc[:, 0].to_numpy(dtype=object), df.iloc[:, 1].to_numpy(dtype=np.int64), None
+    if keys == 'function' and census_keys(path) == 'dll':
+        codes, functions = pd.factorize(np.array([key.split('!', 1)[-1] for key in functions], dtype=object))
+        counts = np.bincount(codes, weights=counts, minlength=len(functions)).astype(np.int64)
+    return functions, counts, file_count
+
+
+def census_keys(path):
+    """ 'dll' if a census is keyed by 'dll!function' (JSON shards, script 1's --keys dll), 'function'
+    for plain function names (script 1's default CSV), None for an empty CSV. """
+    if path.endswith('.json'):
+        return 'dll'
+    first = pd.read_csv(path, usecols=[0], dtype=object, keep_default_na=False, nrows=1)
+    if first.empty:
+        return None
+    return 'dll' if '!' in first.iloc[0, 0] else 'function'
+
+
+def join_censuses(paths, keys=None):
+    """ Outer join of census files on the function name.
+
+    Returns (functions, counts, files): the distinct functions in order of first
+    appearance, an int64 matrix with one column per census (0 where a corpus never
+    imports the function) and the number of files behind each census (None if unknown).
+    Each file is hashed once against the functions seen so far, so memory holds the
+    distinct functions plus a single census rather than all of them.
+
+    keys picks what is matched: 'function' names (DLL-qualified keys are summed per
+    name) or 'dll!function' keys, which raises ValueError if a census only has names.
+    By default the censuses are matched on 'dll!function' keys when all of them have
+    those, and on function names as soon as one does not.
+    """
+    styles = {path: census_keys(path) for path in paths}
+    if keys is None:
+        keys = 'function' if 'function' in styles.values() else 'dll'
+    elif keys == 'dll':
+        plain = [path for path, style in styles.items() if style == 'function']
+        if plain:
+            raise ValueError(f"{', '.join(plain)} list bare function names and cannot be matched on "
+                             f"'dll!function' keys; compare them on function names instead")
+    functions = np.array([], dtype=object)
+    columns = []
+    files = []
+    for path in paths:
+        names, counts, file_count = read_census(path, keys)
+        codes, functions = pd.factorize(np.concatenate([functions, names]))
+        # factorize keeps first-appearance order, so the known functions keep their codes
+        columns.append((codes[len(codes) - len(names):], counts))
+        files.append(file_count)
+    table = np.zeros((len(functions), len(paths)), dtype=np.int64)
+    for column, (codes, counts) in enumerate(columns):
+        table[codes, column] = counts  # a function listed twice keeps its last count, as the dict-based version did
+    return functions, table, files
+
+
+def compare_censuses(functions, table, names, files=None, reference=0):
+    """ N-way comparison of joined censuses, one row per function.
+
+    count_<name> is the function's count in each corpus. Against the reference
+    corpus, pct_diff_<name> is (ref - other) / (ref + other) * 100 on the counts,
+    as the original two-file comparison computed it, and log2_ratio_<name> the
+    log2 ratio of the prevalences: imports per file when every corpus has a file
+    count, otherwise share of the corpus' imports, add-one smoothed. score is the
+    log2 ratio between the highest and lowest prevalence over all corpora and
+    enriched_in the corpus it is highest in. Rows are sorted by their largest
+    count, descending.
+    """
+    counts = table.astype(np.float64)
+    if files is not None and all(files):
+        norms = np.array(files, dtype=np.float64)
+    else:
+        norms = counts.sum(axis=0)
+    prevalence = (counts + 1) / (norms + 1)
+    order = np.argsort(-table.max(axis=1), kind='stable')
+    counts, table, prevalence = counts[order], table[order], prevalence[order]
+
+    columns = {f'count_{name}': table[:, i] for i, name in enumerate(names)}
+    for i, name in enumerate(names):
+        if i == reference:
+            continue
+        total = counts[:, reference] + counts[:, i]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            columns[f'pct_diff_{name}'] = np.where(total > 0, (counts[:, reference] - counts[:, i]) / total * 100, 0.0)
+        columns[f'log2_ratio_{name}'] = np.log2(prevalence[:, i] / prevalence[:, reference])
+    columns['score'] = np.log2(prevalence.max(axis=1) / prevalence.min(axis=1))
+    columns['enriched_in'] = pd.Categorical.from_codes(prevalence.argmax(axis=1), categories=list(names))
+    return pd.DataFrame(columns, index=pd.Index(functions[order], name='function', dtype=object), copy=False)
 
-    compare_function_counts(sys.argv[1], sys.argv[2], sys.argv[3])
+
+def top_discriminative(comparison, k=50, min_count=5):
+    """ The k functions whose prevalence differs most between corpora, among those imported at least min_count times in total. """
+    count_columns = [column for column in comparison.columns if column.startswith('count_')]
+    supported = comparison[comparison[count_columns].sum(axis=1) >= min_count]
+    return supported.nlargest(k, 'score')
+
+
+def compare_function_counts(csv_file1, csv_file2, output_csv, only_negative=True):
+    """ The original two-file comparison, kept for existing callers.
+
+    Writes Function, Count in File 1, Count in File 2, Percentage Difference for
+    the functions imported relatively more in file 2 (negative differences), as
+    this function always has; pass only_negative=False to keep every function.
+    """
+    functions, table, _ = join_censuses([csv_file1, csv_file2])
+    comparison = compare_censuses(functions, table, ['1', '2'])
+    if only_negative:
+        comparison = comparison[comparison['pct_diff_2'] < 0]
+    out = pd.DataFrame({'Function': comparison.index, 'Count in File 1': comparison['count_1'].to_numpy(),
+                        'Count in File 2': comparison['count_2'].to_numpy(),
+                        'Percentage Difference': comparison['pct_diff_2'].to_numpy()})
+    out.to_csv(output_csv, index=False, lineterminator='\r\n')  # csv.writer's line endings, as before
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Compare imported-function censuses (script 1 CSVs or JSON shards) of any number of corpora.')
+    parser.add_argument('censuses', nargs='+', help='Census files, then the output CSV: <census> <census> [...] <output_csv>.')
+    parser.add_argument('--names', nargs='+', help='Corpus names used in the column headers (default: the file names).')
+    parser.add_argument('--files', type=int, nargs='+',
+                        help='Number of PE files behind each census, to compare imports per file (JSON shards carry it).')
+    parser.add_argument('--reference', help='Corpus the others are compared against (default: the first one).')
+    parser.add_argument('--keys', choices=['function', 'dll'],
+                        help="Match on function names or on 'dll!function' keys (default: 'dll' when every census "
+                             "has DLL-qualified keys, 'function' when any is a plain-name CSV; shards are then "
+                             "summed per function name).")
+    parser.add_argument('--min-count', type=int, default=1,
+                        help='Total imports a function needs to be listed and ranked (default: 1, every function).')
+    parser.add_argument('--top-k', type=int, default=0, help='Also write the K most discriminative functions.')
+    parser.add_argument('--top-output', default='top_imports.csv', help='Where --top-k writes (default: top_imports.csv).')
+    args = parser.parse_args()
+
+    if len(args.censuses) < 3:
+        parser.error('give at least two census files and the output CSV')
+    paths, output_csv = args.censuses[:-1], args.censuses[-1]
+    names = args.names or [os.path.splitext(os.path.basename(path))[0] for path in paths]
+    if len(names) != len(paths) or len(set(names)) != len(names):
+        parser.error('--names needs one distinct name per census file')
+    if args.files is not None and len(args.files) != len(paths):
+        parser.error('--files needs one count per census file')
+    if args.reference is not None and args.reference not in names:
+        parser.error(f'--reference must be one of {names}')
+
+    try:
+        functions, table, files = join_censuses(paths, args.keys)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.files is not None:
+        files = args.files
+    if args.min_count > 1:
+        supported = table.sum(axis=1) >= args.min_count
+        functions, table = functions[supported], table[supported]
+    reference = names.index(args.reference) if args.reference is not None else 0
+    comparison = compare_censuses(functions, table, names, files, reference)
+    comparison.to_csv(output_csv, float_format='%.6g')
+    print(f"{len(comparison)} distinct functions across {len(names)} corpora written to {output_csv}")
+    if args.top_k:
+        top = top_discriminative(comparison, args.top_k, args.min_count)
+        top.to_csv(args.top_output, float_format='%.6g')
+        print(f"Top {len(top)} discriminative functions written to {args.top_output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,22 +1,16 @@
 import sys
 import os
-import csv
+import argparse
 import pefile
 
+# Shared modules live in the repository root
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import corpus  # noqa: E402
+import pe_headers  # noqa: E402
+
 # List of known good section names as byte strings
 normal_section_names = [b'.text', b'.rdata', b'.data', b'.pdata', b'.rsrc', b'.idata', b'.bss', b'.code', b'.edata']
 
-def shannon_entropy(data):
-    """Calculate the Shannon entropy of a block of data."""
-    from math import log2
-    freq = {}
-    for byte in data:
-        freq[byte] = freq.get(byte, 0) + 1
-    total_bytes = len(data)
-    probabilities = [float(count) / total_bytes for count in freq.values()]
-    entropy = -sum(p * log2(p) for p in probabilities if p != 0)
-    return entropy
-
 def section_name_checker(section_names):
     """Check section names against a list of known good names, working with byte strings."""
     number_of_suspicious_names = 0
@@ -28,8 +22,8 @@ def section_name_checker(section_names):
             number_of_suspicious_names += 1
     return number_of_suspicious_names, number_of_nonsuspicious_names
 
-def pe_features(filename):
-    """Extract various features from the PE file, adjusted for byte string handling."""
+def pe_features(file_content, filename, scan_result=None):
+    """Extract various features from the PE file's bytes, adjusted for byte string handling."""
     # Initialize all values to None
     number_of_sections = None
     time_date_stamp = None
@@ -47,27 +41,28 @@ def pe_features(filename):
     import_count = 0
 
     try:
-        pe = pefile.PE(filename)
-        number_of_sections = len(pe.sections)
-        time_date_stamp = pe.FILE_HEADER.TimeDateStamp
-        characteristics = pe.FILE_HEADER.Characteristics
-        major_image_version = pe.OPTIONAL_HEADER.MajorImageVersion
-        dll_characteristics = pe.OPTIONAL_HEADER.DllCharacteristics
-        checksum_invalid = 0 if pe.verify_checksum() else 1
-        size_of_uninitialized_data = pe.OPTIONAL_HEADER.SizeOfUninitializedData
-        size_of_initialized_data = pe.OPTIONAL_HEADER.SizeOfInitializedData
-
-        section_names = [section.Name for section in pe.sections]
+        # Only the headers, section table and import directory are parsed
+        pe = pe_headers.read_headers(file_content)
+        number_of_sections = pe.number_of_sections
+        time_date_stamp = pe.time_date_stamp
+        characteristics = pe.characteristics
+        major_image_version = pe.major_image_version
+        dll_characteristics = pe.dll_characteristics
+        checksum_invalid = 0 if pe_headers.verify_checksum(file_content, pe, scan_result) else 1
+        size_of_uninitialized_data = pe.size_of_uninitialized_data
+        size_of_initialized_data = pe.size_of_initialized_data
+
+        section_names = pe.section_names
         suspicious, nonsuspicious = section_name_checker(section_names)
 
         text_section_entropy = None
         for section in pe.sections:
-            if b'.text' in section.Name:
-                text_section_entropy = section.get_entropy()
+            if b'.text' in section.name:
+                text_section_entropy = pe_headers.section_entropy(pe.section_data(file_content, section))
                 break
 
-        dll_count = len(pe.DIRECTORY_ENTRY_IMPORT) if hasattr(pe, 'DIRECTORY_ENTRY_IMPORT') else 0
-        import_count = sum(len(dll.imports) for dll in pe.DIRECTORY_ENTRY_IMPORT if hasattr(dll, 'imports')) if hasattr(pe, 'DIRECTORY_ENTRY_IMPORT') else 0
+        dll_count = pe.dll_count
+        import_count = pe.import_count
     except pefile.PEFormatError as e:
         print(f"Skipping file {filename} due to invalid NT headers: {e}")
         return None
@@ -83,44 +78,34 @@ def calculate_entropy_and_pe_features(filename):
     with open(filename, 'rb') as file:
         file_content = file.read()
     file_size = os.path.getsize(filename)
-    entropy = shannon_entropy(file_content)
-    pe_result = pe_features(filename)
+    scan_result = corpus.scan_sample(file_content)  # one pass for the entropy, the PE checksum and the sample's key
+    entropy = scan_result.entropy
+    pe_result = pe_features(file_content, filename, scan_result)
     if pe_result is None:  # Check if pe_features returned None and handle it
         return None  # Return None to signal that this file should be skipped
     return (entropy, file_size) + pe_result  # Only concatenate if pe_result is not None
 
 
-def calculate_features_for_folder(folder_path, malware_label, writer, fieldnames):
-    """Process each file in a folder and record their features to a CSV."""
-    for file_name in os.listdir(folder_path):
-        file_path = os.path.join(folder_path, file_name)
-        if os.path.isfile(file_path):
-            features = calculate_entropy_and_pe_features(file_path)
-            if features is not None:  # Only write rows for successfully processed files or those with recoverable errors
-                row = dict(zip(fieldnames, [malware_label] + list(features)))
-                writer.writerow(row)
-
-
 def main():
     """Main function to handle command line arguments and process folders."""
-    if len(sys.argv) != 4:
-        print("Usage: python script.py <benign_folder> <malicious_folder> <output_file>")
-        sys.exit(1)
-
-    benign_folder = sys.argv[1]
-    malicious_folder = sys.argv[2]
-    output_file = sys.argv[3]
+    parser = argparse.ArgumentParser(description='Extract all PE features from a benign and a malicious folder into a CSV dataset.')
+    parser.add_argument('benign_folder', help='Folder of benign samples (label 0).')
+    parser.add_argument('malicious_folder', help='Folder of malicious samples (label 1).')
+    parser.add_argument('output_file', help='CSV file (or feature store directory with --format store) to write.')
+    corpus.add_arguments(parser)
+    args = parser.parse_args()
 
     fieldnames = ['malware', 'entropy', 'length', 'number_of_sections', 'time_date_stamp',
                   'characteristics', 'major_image_version', 'dll_characteristics', 'dll_count',
                   'import_count', 'checksum_invalid', 'text_section_entropy', 'suspicious_section_names',
                   'nonsuspicious_section_names', 'size_of_uninitialized_data', 'size_of_initialized_data']
+    dtypes = {'malware': 'int8', 'entropy': 'float64', 'text_section_entropy': 'float64'}  # feature store types, the rest are int64
 
-    with open(output_file, 'w', newline='') as csvfile:
-        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-        writer.writeheader()
-        calculate_features_for_folder(benign_folder, 0, writer, fieldnames)  # Process benign files
-        calculate_features_for_folder(malicious_folder, 1, writer, fieldnames)  # Process malicious files
+    folders = [(args.benign_folder, 0), (args.malicious_folder, 1)]  # Benign files first, then malicious files
+    corpus.extract_folders(folders, calculate_entropy_and_pe_features, args.output_file, fieldnames,
+                           workers=corpus.worker_count(args.workers), chunksize=args.chunksize,
+                           checkpoint_every=args.checkpoint_every, resume=not args.restart,
+                           output_format=args.format, dtypes=dtypes, manifest=args.manifest)
 
 if __name__ == "__main__":
     main()
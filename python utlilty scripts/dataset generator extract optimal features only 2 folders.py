@@ -1,21 +1,19 @@
 import sys
 import os
-import math
-import csv
+import argparse
 import pefile
 
-def shannon_entropy(data):
-    """ Calculate the Shannon entropy of a block of data. """
-    freq = {}
-    for byte in data:
-        freq[byte] = freq.get(byte, 0) + 1
-    total_bytes = len(data)
-    probabilities = [count / total_bytes for count in freq.values()]
-    entropy = -sum(p * math.log2(p) for p in probabilities if p != 0)
-    return entropy
+# Shared modules live in the repository root
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import corpus  # noqa: E402
+import pe_headers  # noqa: E402
 
-def pe_features(filename):
-    """ Extract various features from the PE file, returning None for critical failures. """
+fieldnames = ['malware', 'entropy', 'length', 'number_of_sections', 'time_date_stamp',
+              'characteristics', 'dll_characteristics', 'import_count', 'checksum_invalid']
+dtypes = {'malware': 'int8', 'entropy': 'float64'}  # feature store types, the rest are int64
+
+def pe_features(file_content, filename, scan_result=None):
+    """ Extract various features from the PE file's bytes, returning None for critical failures. """
     # Initialize all attributes to None
     number_of_sections = None
     time_date_stamp = None
@@ -25,14 +23,14 @@ def pe_features(filename):
     import_count = 0
 
     try:
-        pe = pefile.PE(filename)
-        number_of_sections = len(pe.sections)
-        time_date_stamp = pe.FILE_HEADER.TimeDateStamp
-        characteristics = pe.FILE_HEADER.Characteristics
-        dll_characteristics = pe.OPTIONAL_HEADER.DllCharacteristics
-        checksum_invalid = 0 if pe.verify_checksum() else 1
-        if hasattr(pe, 'DIRECTORY_ENTRY_IMPORT'):
-            import_count = sum(len(dll.imports) for dll in pe.DIRECTORY_ENTRY_IMPORT if hasattr(dll, 'imports'))
+        # Only the headers, section table and import directory are parsed
+        pe = pe_headers.read_headers(file_content)
+        number_of_sections = pe.number_of_sections
+        time_date_stamp = pe.time_date_stamp
+        characteristics = pe.characteristics
+        dll_characteristics = pe.dll_characteristics
+        checksum_invalid = 0 if pe_headers.verify_checksum(file_content, pe, scan_result) else 1
+        import_count = pe.import_count
     except pefile.PEFormatError as e:
         print(f"Skipping file {filename} due to invalid NT headers: {e}")
         return None  # Critical failure, skip this file entirely
@@ -48,44 +46,27 @@ def calculate_entropy_and_pe_features(filename):
     with open(filename, 'rb') as file:
         file_content = file.read()
     file_size = os.path.getsize(filename)
-    entropy = shannon_entropy(file_content)
-    pe_result = pe_features(filename)
+    scan_result = corpus.scan_sample(file_content)  # one pass for the entropy, the PE checksum and the sample's key
+    entropy = scan_result.entropy
+    pe_result = pe_features(file_content, filename, scan_result)
     if pe_result is None:
         return None  # Skip this file completely if pe_features returned None
     return (entropy, file_size) + pe_result
 
-def calculate_features_for_folder(folder_path, output_file, malware_label):
-    """ Process each file in a folder and record their features to a CSV, handling errors appropriately. """
-    with open(output_file, 'a', newline='') as csvfile:
-        fieldnames = ['malware', 'entropy', 'length', 'number_of_sections', 'time_date_stamp',
-                      'characteristics', 'dll_characteristics', 'import_count', 'checksum_invalid']
-        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-        for file_name in os.listdir(folder_path):
-            file_path = os.path.join(folder_path, file_name)
-            if os.path.isfile(file_path):
-                features = calculate_entropy_and_pe_features(file_path)
-                if features is not None:
-                    row = dict(zip(fieldnames, [malware_label] + list(features)))
-                    writer.writerow(row)
-
 def main():
     """ Main function to handle command line arguments and process folders. """
-    if len(sys.argv) != 4:
-        print("Usage: python script.py <benign_folder> <malicious_folder> <output_file>")
-        sys.exit(1)
-
-    benign_folder = sys.argv[1]
-    malicious_folder = sys.argv[2]
-    output_file = sys.argv[3]
-
-    with open(output_file, 'w', newline='') as csvfile:
-        fieldnames = ['malware', 'entropy', 'length', 'number_of_sections', 'time_date_stamp',
-                      'characteristics', 'dll_characteristics', 'import_count', 'checksum_invalid']
-        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-        writer.writeheader()
+    parser = argparse.ArgumentParser(description='Extract the model features from a benign and a malicious folder into a CSV dataset.')
+    parser.add_argument('benign_folder', help='Folder of benign samples (label 0).')
+    parser.add_argument('malicious_folder', help='Folder of malicious samples (label 1).')
+    parser.add_argument('output_file', help='CSV file (or feature store directory with --format store) to write.')
+    corpus.add_arguments(parser)
+    args = parser.parse_args()
 
-    calculate_features_for_folder(benign_folder, output_file, 0)  # Benign files
-    calculate_features_for_folder(malicious_folder, output_file, 1)  # Malicious files
+    folders = [(args.benign_folder, 0), (args.malicious_folder, 1)]  # Benign files first, then malicious files
+    corpus.extract_folders(folders, calculate_entropy_and_pe_features, args.output_file, fieldnames,
+                           workers=corpus.worker_count(args.workers), chunksize=args.chunksize,
+                           checkpoint_every=args.checkpoint_every, resume=not args.restart,
+                           output_format=args.format, dtypes=dtypes, manifest=args.manifest)
 
 if __name__ == "__main__":
     main()
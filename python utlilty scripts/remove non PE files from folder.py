@@ -1,36 +1,133 @@
 import os
 import sys
+import json
+import time
+import mmap
+import shutil
+import struct
 import argparse
 import pefile
 
+# Shared modules live in the repository root
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import corpus  # noqa: E402
+from pe_headers import read_headers  # noqa: E402
 
-def delete_non_pe_files(directory):
-    # Iterate over the files in the specified directory
-    for filename in os.listdir(directory):
-        file_path = os.path.join(directory, filename)
+PREFILTER_BYTES = 4096  # the DOS header and, in practice, the PE signature fit in the first page
 
-        # Skip directories
-        if os.path.isdir(file_path):
-            continue
 
-        try:
-            # Attempt to parse the file as a PE file
-            pe = pefile.PE(file_path)
-        except pefile.PEFormatError:
-            # If a PEFormatError is raised, the file is not a PE file; delete it
-            print(f"Deleting non-PE file: {file_path}")
-            os.remove(file_path)
-        except Exception as e:
+def looks_like_pe(file_path):
+    """ Cheap check of the MZ magic, e_lfanew and the PE\\0\\0 signature; False means pefile would reject the file too. """
+    with open(file_path, 'rb') as f:
+        head = f.read(PREFILTER_BYTES)
+        if len(head) < 64 or head[:2] != b'MZ':
+            return False
+        e_lfanew, = struct.unpack_from('<I', head, 0x3C)
+        if e_lfanew + 4 <= len(head):
+            return head[e_lfanew:e_lfanew + 4] == b'PE\0\0'
+        # Rare: the NT headers start beyond the first page
+        f.seek(e_lfanew)
+        return f.read(4) == b'PE\0\0'
+
+
+def classify(file_path):
+    """ ('pe' | 'not_pe' | 'error', stage that decided, message) for one file; safe to run in a worker process. """
+    try:
+        if not looks_like_pe(file_path):
+            return 'not_pe', 'prefilter', None
+        # Only candidates get the full header parse
+        with open(file_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            read_headers(data)
+    except pefile.PEFormatError as e:
+        return 'not_pe', 'parse', str(e)
+    except Exception as e:
+        return 'error', 'parse', str(e)
+    return 'pe', 'parse', None
+
+
+def quarantine_path(quarantine_dir, filename):
+    """ A free path for filename in the quarantine folder, suffixed if a file of that name is already there. """
+    target = os.path.join(quarantine_dir, filename)
+    counter = 1
+    while os.path.exists(target):
+        target = os.path.join(quarantine_dir, f"{filename}.{counter}")
+        counter += 1
+    return target
+
+
+def delete_non_pe_files(directory, dry_run=False, quarantine_dir=None, workers=1,
+                        chunksize=corpus.DEFAULT_CHUNKSIZE, verbose=False):
+    """ Delete (or quarantine, or with dry_run only list) every non-PE file of directory; returns a summary dict. """
+    started = time.perf_counter()
+    names = corpus.list_samples(directory)
+    listed = time.perf_counter()
+    if quarantine_dir is not None and not dry_run:
+        os.makedirs(quarantine_dir, exist_ok=True)
+
+    summary = {"directory": directory, "files": len(names), "pe": 0, "not_pe": 0, "errors": 0,
+               "rejected_by_prefilter": 0, "parsed": 0, "removed": 0, "quarantined": 0,
+               "mode": "dry-run" if dry_run else "quarantine" if quarantine_dir is not None else "delete"}
+    paths = [os.path.join(directory, name) for name in names]
+    for name, file_path, (verdict, stage, message) in zip(
+            names, paths, corpus.iter_features(paths, classify, workers, chunksize)):
+        if stage == 'prefilter':
+            summary["rejected_by_prefilter"] += 1
+        else:
+            summary["parsed"] += 1
+        if verdict == 'error':
             # Handle unexpected errors
-            print(f"Error processing file {file_path}: {e}")
+            summary["errors"] += 1
+            print(f"Error processing file {file_path}: {message}")
+        elif verdict == 'pe':
+            summary["pe"] += 1
+            if verbose:
+                print(f"Keeping PE file: {file_path}")
         else:
-            # No error, so the file is a PE file
-            print(f"Keeping PE file: {file_path}")
+            summary["not_pe"] += 1
+            if dry_run:
+                print(f"Would remove non-PE file: {file_path}")
+            elif quarantine_dir is not None:
+                target = quarantine_path(quarantine_dir, name)
+                print(f"Quarantining non-PE file: {file_path} -> {target}")
+                shutil.move(file_path, target)
+                summary["quarantined"] += 1
+            else:
+                print(f"Deleting non-PE file: {file_path}")
+                os.remove(file_path)
+                summary["removed"] += 1
+
+    finished = time.perf_counter()
+    summary["seconds"] = {"listing": round(listed - started, 3), "classify_and_act": round(finished - listed, 3),
+                          "total": round(finished - started, 3)}
+    summary["files_per_second"] = round(len(names) / (finished - started), 1) if finished > started else None
+    return summary
+
+
+def print_summary(summary):
+    print(f"\n{summary['files']} files in {summary['directory']} ({summary['mode']}): "
+          f"{summary['pe']} PE, {summary['not_pe']} non-PE, {summary['errors']} errors")
+    print(f"  {summary['rejected_by_prefilter']} rejected by the magic-byte prefilter, "
+          f"{summary['parsed']} parsed")
+    if summary['mode'] == 'delete':
+        print(f"  {summary['removed']} deleted")
+    elif summary['mode'] == 'quarantine':
+        print(f"  {summary['quarantined']} moved to quarantine")
+    seconds = summary['seconds']
+    print(f"  listing {seconds['listing']}s, classification and actions {seconds['classify_and_act']}s, "
+          f"total {seconds['total']}s ({summary['files_per_second']} files/s)")
 
 
 def main():
     parser = argparse.ArgumentParser(description='Delete non-PE files from a directory.')
     parser.add_argument('directory', type=str, help='The directory to scan and delete non-PE files from.')
+    parser.add_argument('--dry-run', action='store_true', help='Only report what would be removed.')
+    parser.add_argument('--quarantine', metavar='DIR', help='Move non-PE files into DIR instead of deleting them.')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Number of worker processes (default: 1, 0 = one per CPU core).')
+    parser.add_argument('--chunksize', type=int, default=corpus.DEFAULT_CHUNKSIZE,
+                        help=f'Files handed to a worker at a time (default: {corpus.DEFAULT_CHUNKSIZE}).')
+    parser.add_argument('--report', help='Also write the summary as JSON to this file.')
+    parser.add_argument('--verbose', action='store_true', help='Also list the PE files that are kept.')
 
     args = parser.parse_args()
 
@@ -40,7 +137,12 @@ def main():
         sys.exit(1)
 
     # Call the function to delete non-PE files
-    delete_non_pe_files(args.directory)
+    summary = delete_non_pe_files(args.directory, args.dry_run, args.quarantine,
+                                  corpus.worker_count(args.workers), args.chunksize, args.verbose)
+    print_summary(summary)
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump(summary, f, indent=2)
 
 
 if __name__ == "__main__":
@@ -1,33 +1,160 @@
-import pandas as pd
-import shutil
 import os
+import sys
+import csv
+import time
+import errno
+import shutil
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+DEFAULT_MAPPING = ['Blacklist=mal']  # as before: blacklisted samples are malware, every other label is benign
+BATCH = 1000  # files handed to a thread at a time
+
+
+def parse_mapping(pairs):
+    """ {label: destination folder} from LABEL=FOLDER strings. """
+    mapping = {}
+    for pair in pairs:
+        label, sep, folder = pair.partition('=')
+        if not sep or not folder:
+            raise ValueError(f"Expected LABEL=FOLDER, got {pair!r}")
+        mapping[label] = folder
+    return mapping
+
+
+def plan(labels_csv, source_folder, mapping, default=None, id_column='id', label_column='list'):
+    """ Destination of every labelled sample, computed column-wise.
+
+    Returns (moves, missing, unknown, unlisted): a DataFrame of id/label/destination
+    for samples present in source_folder, DataFrames of the labelled samples that are
+    not in source_folder and of those whose label is not mapped, and the sorted names
+    of files in source_folder that have no label.
+    """
+    df = pd.read_csv(labels_csv, usecols=[id_column, label_column], dtype=str, keep_default_na=False)
+    df = df.rename(columns={id_column: 'id', label_column: 'label'}).drop_duplicates('id')
+    df['destination'] = df['label'].map(mapping)
+    if default is not None:
+        df['destination'] = df['destination'].fillna(default)
+    # One directory listing instead of one stat per sample
+    with os.scandir(source_folder) as entries:
+        listed = pd.Index([entry.name for entry in entries if entry.is_file()])
+    present = df['id'].isin(listed)
+    known = df['destination'].notna()
+    unlisted = sorted(listed.difference(pd.Index(df['id'])))
+    return df[present & known], df[~present], df[present & ~known], unlisted
+
+
+def _transfer(batch, mode):
+    """ Move or link a batch of (source, destination) pairs; returns (done, [(source, error), ...]). """
+    done = 0
+    failed = []
+    for source, destination in batch:
+        try:
+            if mode == 'move':
+                try:
+                    os.rename(source, destination)
+                except OSError as e:
+                    if e.errno != errno.EXDEV:
+                        raise
+                    shutil.move(source, destination)  # different filesystem: copy, then delete
+            else:
+                try:
+                    os.link(source, destination)
+                except OSError as e:
+                    if e.errno != errno.EXDEV:
+                        raise
+                    shutil.copy2(source, destination)
+            done += 1
+        except OSError as e:
+            failed.append((source, str(e)))
+    return done, failed
+
+
+def sort_samples(moves, source_folder, mode='move', threads=8):
+    """ Move (or hardlink with mode='link') every planned sample into its destination folder on a thread pool. """
+    for folder in moves['destination'].unique():
+        os.makedirs(folder, exist_ok=True)
+    sources = (source_folder + os.sep + moves['id']).tolist()
+    destinations = (moves['destination'] + os.sep + moves['id']).tolist()
+    pairs = list(zip(sources, destinations))
+    batches = [pairs[i:i + BATCH] for i in range(0, len(pairs), BATCH)]
+    done = 0
+    failed = []
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        for batch_done, batch_failed in executor.map(lambda batch: _transfer(batch, mode), batches):
+            done += batch_done
+            failed.extend(batch_failed)
+    return done, failed
+
+
+def write_report(path, missing, unknown, unlisted, failed):
+    """ One row per sample that was not sorted: id, label, status. """
+    with open(path, 'w', newline='') as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(['id', 'label', 'status'])
+        writer.writerows((sample_id, label, 'missing') for sample_id, label in zip(missing['id'], missing['label']))
+        writer.writerows((sample_id, label, 'unknown_label') for sample_id, label in zip(unknown['id'], unknown['label']))
+        writer.writerows((name, '', 'unlisted') for name in unlisted)
+        writer.writerows((os.path.basename(source), '', f'failed: {error}') for source, error in failed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Sort samples into per-label folders according to a labels CSV.')
+    parser.add_argument('labels_csv', help='CSV with one row per sample, e.g. samples.csv.')
+    parser.add_argument('source_folder', help='Folder holding all the samples.')
+    parser.add_argument('--output-root',
+                        help='Base of relative destination folders (default: the parent of the source folder).')
+    parser.add_argument('--id-column', default='id', help='Column with the sample file name (default: id).')
+    parser.add_argument('--label-column', default='list', help='Column with the label (default: list).')
+    parser.add_argument('--map', action='append', metavar='LABEL=FOLDER',
+                        help=f'Destination folder of a label; repeatable (default: {DEFAULT_MAPPING[0]}).')
+    parser.add_argument('--default', metavar='FOLDER',
+                        help='Destination of labels not given with --map; without it they are reported as unknown.')
+    parser.add_argument('--mode', choices=['move', 'link'], default='move',
+                        help='Rename samples into place (default) or hardlink them, leaving the source folder intact.')
+    parser.add_argument('--threads', type=int, default=8, help='Threads doing the file operations (default: 8).')
+    parser.add_argument('--dry-run', action='store_true', help='Only print the plan.')
+    parser.add_argument('--report', help='Write missing, unknown, unlisted and failed samples to this CSV.')
+    args = parser.parse_args()
+
+    if args.map is None and args.default is None:
+        args.map, args.default = DEFAULT_MAPPING, 'ben'
+    try:
+        mapping = parse_mapping(args.map or [])
+    except ValueError as e:
+        parser.error(str(e))
+    # Relative folders sit next to the source folder, like bigdataset/samples -> bigdataset/mal and bigdataset/ben
+    root = args.output_root or os.path.dirname(os.path.abspath(args.source_folder))
+    mapping = {label: os.path.join(root, folder) for label, folder in mapping.items()}
+    default = os.path.join(root, args.default) if args.default is not None else None
+
+    start = time.perf_counter()
+    moves, missing, unknown, unlisted = plan(args.labels_csv, args.source_folder, mapping, default,
+                                             args.id_column, args.label_column)
+    planned = time.perf_counter()
+    for folder, count in moves['destination'].value_counts().items():
+        print(f"{count} samples -> {folder}")
+    print(f"{len(missing)} labelled samples missing from {args.source_folder}, "
+          f"{len(unknown)} with an unmapped label, {len(unlisted)} files without a label "
+          f"(planned in {planned - start:.2f}s)")
+    if len(unknown):
+        print(f"Unmapped labels: {', '.join(repr(label) for label in sorted(unknown['label'].unique()))}")
+
+    failed = []
+    if not args.dry_run:
+        done, failed = sort_samples(moves, args.source_folder, args.mode, args.threads)
+        verb = 'Moved' if args.mode == 'move' else 'Linked'
+        print(f"{verb} {done} samples in {time.perf_counter() - planned:.2f}s, {len(failed)} failed")
+        for source, error in failed[:10]:
+            print(f"  {source}: {error}")
+    if args.report:
+        write_report(args.report, missing, unknown, unlisted, failed)
+        print(f"Report written to {args.report}")
+    if failed:
+        sys.exit(1)
+
 
-# Load your dataset
-df = pd.read_csv('D:/virus_folder/samples.csv')
-
-# Define your source folder where all files are currently stored
-source_folder = 'D:/virus_folder/bigdataset/samples'
-
-# Define the destination folders
-malware_folder = 'D:/virus_folder/bigdataset/mal'
-benign_folder = 'D:/virus_folder/bigdataset/ben'
-
-# Ensure destination folders exist
-os.makedirs(malware_folder, exist_ok=True)
-os.makedirs(benign_folder, exist_ok=True)
-
-# Iterate over the dataset and move files accordingly
-for index, row in df.iterrows():
-    source_file = os.path.join(source_folder, str(row['id']))
-    if row['list'] == "Blacklist":
-        # This is malware
-        destination_file = os.path.join(malware_folder, str(row['id']))
-    else:
-        # This is benign
-        destination_file = os.path.join(benign_folder, str(row['id']))
-
-    # Move the file
-    if os.path.exists(source_file):
-        shutil.move(source_file, destination_file)
-    else:
-        print(f"File {source_file} does not exist.")
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,156 @@
+"""One pass over a sample for its byte histogram, PE checksum sum and digests.
+
+The entropy, the PE optional-header checksum and the MD5/SHA-1/SHA-256 digests
+all need to read every byte of a sample. scan() walks a buffer or mmap once,
+in cache-sized chunks, and feeds each chunk to the byte histogram, to a
+NumPy sum of its 32-bit words and to the hashlib objects while it is still in
+the CPU cache. The checksum of any CheckSum field offset can then be derived
+from the word sum without reading the file again, which matters because the
+offset is only known once the headers are parsed.
+
+Entropy is bit-identical to entropy.shannon_entropy(), the checksum to
+pefile's generate_checksum() and the digests to hashlib's.
+
+Usage: python sample_scan.py <file> [<file> ...] [--verify]
+prints each file's digests, entropy and checksum validity; --verify also
+recomputes them with hashlib, shannon_entropy and pefile and reports any
+difference.
+"""
+import argparse
+import hashlib
+import mmap
+import os
+
+import numpy as np
+
+from entropy import EntropyAccumulator
+
+DIGESTS = ('md5', 'sha1', 'sha256')
+SCAN_CHUNK = 256 * 1024  # a multiple of 4, so every chunk but the last holds whole 32-bit words
+
+
+class ScanResult:
+    """What one pass over a sample produced."""
+
+    def __init__(self, size, histogram, word_sum, digests):
+        self.size = size
+        self.histogram = histogram  # EntropyAccumulator, or None if the histogram was skipped
+        self.word_sum = word_sum  # sum of the little-endian 32-bit words, the last one zero-padded (or None)
+        self.digests = digests  # {"md5": hexdigest, ...}
+
+    @property
+    def counts(self):
+        return self.histogram.counts
+
+    @property
+    def entropy(self):
+        return self.histogram.entropy()
+
+    def pe_checksum(self, data, checksum_offset):
+        """PE checksum of the scanned data, skipping the word at checksum_offset as pefile's generate_checksum() does."""
+        total = self.word_sum
+        skipped = checksum_offset // 4 * 4
+        if skipped < self.size:
+            total -= int.from_bytes(bytes(data[skipped:skipped + 4]).ljust(4, b'\0'), 'little')
+        # Adding 32-bit words with end-around carry is addition modulo 2**32 - 1
+        checksum = (total - 1) % 0xFFFFFFFF + 1 if total else 0
+        checksum = (checksum & 0xFFFF) + (checksum >> 16)
+        checksum = (checksum + (checksum >> 16)) & 0xFFFF
+        return checksum + self.size
+
+
+def scan(data, digests=DIGESTS, histogram=True, chunk_size=SCAN_CHUNK, word_sum=True):
+    """Histogram, word sum and digests of data (bytes, bytearray, memoryview or mmap) in a single pass.
+
+    histogram=False or word_sum=False skip that part of the pass (its field is None).
+
+    The pages of an mmap are dropped from the process once their chunk is done
+    (they stay in the page cache), so scanning a mapped file of any size keeps
+    resident memory at about one chunk.
+    """
+    accumulator = EntropyAccumulator() if histogram else None
+    hashers = [hashlib.new(name) for name in digests]
+    total = 0 if word_sum else None
+    release = (isinstance(data, mmap.mmap) and hasattr(mmap, 'MADV_DONTNEED')
+               and chunk_size % mmap.PAGESIZE == 0)
+    view = memoryview(data).cast('B')
+    try:
+        for start in range(0, len(view), chunk_size):
+            if release and start:
+                data.madvise(mmap.MADV_DONTNEED, start - chunk_size, chunk_size)
+            chunk = view[start:start + chunk_size]
+            if accumulator is not None:
+                accumulator.update(chunk)
+            for hasher in hashers:
+                hasher.update(chunk)
+            if total is None:
+                continue
+            whole = len(chunk) & ~3
+            total += int(np.frombuffer(chunk[:whole], dtype='<u4').sum(dtype=np.uint64))
+            if whole < len(chunk):
+                total += int.from_bytes(bytes(chunk[whole:]).ljust(4, b'\0'), 'little')
+    finally:
+        view.release()
+    return ScanResult(len(data), accumulator, total, {name: hasher.hexdigest()
+                                                      for name, hasher in zip(digests, hashers)})
+
+
+def scan_file(path, digests=DIGESTS, histogram=True):
+    """scan() over a read-only mmap of a file."""
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return scan(b'', digests, histogram)
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            return scan(data, digests, histogram)
+
+
+def _scan_with_checksum(path):
+    """(ScanResult, checksum validity or None if the file is not a PE) of one file, mapped once."""
+    from pe_headers import read_headers  # pe_headers itself builds on this module
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return scan(b''), None
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            result = scan(data)
+            try:
+                headers = read_headers(data)
+            except Exception:
+                return result, None
+            return result, headers.checksum == result.pe_checksum(data, headers.checksum_offset)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Digests, entropy and PE checksum validity of files in one pass each.')
+    parser.add_argument('files', nargs='+')
+    parser.add_argument('--verify', action='store_true', help='Check every value against hashlib, shannon_entropy and pefile.')
+    args = parser.parse_args()
+
+    differences = 0
+    for path in args.files:
+        result, checksum_valid = _scan_with_checksum(path)
+        print(f"{path}\n  md5 {result.digests['md5']}  sha1 {result.digests['sha1']}\n"
+              f"  sha256 {result.digests['sha256']}\n  entropy {result.entropy!r}  checksum_valid {checksum_valid}")
+        if not args.verify:
+            continue
+        import pefile
+        from entropy import shannon_entropy
+        with open(path, 'rb') as f:
+            content = f.read()
+        expected = {name: hashlib.new(name, content).hexdigest() for name in DIGESTS}
+        expected_entropy = shannon_entropy(content)
+        try:
+            expected_checksum = pefile.PE(data=content, fast_load=True).verify_checksum()
+        except pefile.PEFormatError:
+            expected_checksum = None
+        for label, ours, theirs in [*((name, result.digests[name], expected[name]) for name in DIGESTS),
+                                    ("entropy", result.entropy, expected_entropy),
+                                    ("checksum_valid", checksum_valid, expected_checksum)]:
+            if ours != theirs:
+                differences += 1
+                print(f"  MISMATCH {label}: {ours!r} != {theirs!r}")
+    if args.verify:
+        print(f"{differences} differences")
+
+
+if __name__ == '__main__':
+    main()
@@ -109,34 +109,59 @@ virusTotalButton.addEventListener('click', function() {
 });
 
 
-//recursive polling until completed status.
+//server pushes analysis updates over Server-Sent Events; falls back to long-polling when unavailable.
 function pollStatus(file_id) {
-    setTimeout(() => {
-        fetch(`http://localhost:5000/status/${file_id}`)
-            .then(response => {
-                if (response.ok)
-                    return response.json();
-                else
-                    return response.json().then(errorData => {
-                        throw errorData.error;
-                    });
-            })
-            .then(data => {
-                if (data.data.attributes.status === 'completed') {
-                    updateStats(data);
-                    successVtScheme();
-                } else {
-                    pollStatus(file_id);
-                }
-            })
-            .catch(error => {
-                failedVtScheme();
-                if (error instanceof TypeError)
-                    statusText.textContent = 'Network error, Could not complete the request.';
-                else
-                    statusText.textContent = error;
-            });
-    }, 15000);  // Poll every 15 seconds
+    if (!window.EventSource) {
+        longPollStatus(file_id, -1);
+        return;
+    }
+    const events = new EventSource(`http://localhost:5000/events/${file_id}`);
+    events.addEventListener('status', event => {
+        const data = JSON.parse(event.data);
+        if (data.data.attributes.status === 'completed') {
+            events.close();
+            updateStats(data);
+            successVtScheme();
+        }
+    });
+    events.addEventListener('failure', event => {
+        events.close();
+        failedVtScheme();
+        statusText.textContent = JSON.parse(event.data).error;
+    });
+    events.onerror = () => { //stream dropped, continue with long-polling
+        events.close();
+        longPollStatus(file_id, -1);
+    };
+}
+
+
+//each request is held by the server until a newer status than `version` exists.
+function longPollStatus(file_id, version) {
+    fetch(`http://localhost:5000/status/${file_id}?wait=30&version=${version}`)
+        .then(response => {
+            if (response.ok)
+                return response.json().then(data => [data, parseInt(response.headers.get('X-Status-Version'))]);
+            else
+                return response.json().then(errorData => {
+                    throw errorData.error;
+                });
+        })
+        .then(([data, newVersion]) => {
+            if (data.data.attributes.status === 'completed') {
+                updateStats(data);
+                successVtScheme();
+            } else {
+                longPollStatus(file_id, newVersion);
+            }
+        })
+        .catch(error => {
+            failedVtScheme();
+            if (error instanceof TypeError)
+                statusText.textContent = 'Network error, Could not complete the request.';
+            else
+                statusText.textContent = error;
+        });
 }
 
 
@@ -0,0 +1,146 @@
+"""Production entry point: gunicorn workers pre-forked after the model is loaded once.
+
+Usage:
+  pip install -r requierments   # pins gunicorn with the rest of the server's dependencies
+  python serve.py [--bind 127.0.0.1:5000] [--workers N] [--threads 8] [--compiled-model model/compiled]
+
+The random forest is served from a directory of .npy arrays written by
+compiled_forest.py (built here from model/*.joblib on first start if it is
+missing, or if its meta.json records other model files than the current
+ones). The master maps those arrays read-only with mmap_mode='r', runs one
+warm-up inference and then forks, so all workers share the model's pages
+through the page cache instead of each unpickling a private copy. Workers use
+threads (gthread) so long-polls and /events streams do not block a process.
+
+Memory, measured as proportional set size (PSS) on Linux with 4 workers, 4
+threads each and ANALYSIS_WORKERS=4 (one analysis process per worker), after
+40 /upload requests (100-tree forest, 2.6 MB of compiled arrays). Per worker
+is the gunicorn worker plus its forkserver and analysis process (and, under
+plain gunicorn, its own multiprocessing resource tracker); the host total
+adds the master and, for serve.py, the VirusTotal manager and the one
+resource tracker the workers share:
+                                                       per worker (private)   host total
+  each worker loading the model itself                  ~173 MB (145 MB)       ~706 MB
+    (plain `gunicorn server:app`)
+  preloaded joblib model, forked (COMPILED_MODEL=0)      ~65 MB  (24 MB)       ~357 MB
+  preloaded, memory-mapped compiled arrays (default)     ~45 MB  (22 MB)       ~229 MB
+The forkserver and the analysis process are ~13 MB and ~14 MB of that per
+worker, the same in every mode, since neither loads the model.
+Each worker keeps its own verdict cache LRU and /metrics counters.
+
+The VirusTotal client and analysis watcher run once, in a manager process
+started before the fork (vt_service.py), and every worker calls into it. The
+workers therefore share the VirusTotal request quota and one poller per
+analysis, and a job or analysis id returned by one worker can be looked up
+through any other.
+
+Samples are analysed by AnalysisPool processes (analysis_pool.py). Each
+gunicorn worker starts its own forkserver and pool on its first upload, so
+ANALYSIS_WORKERS and ANALYSIS_QUEUE are read here as totals for the host and
+divided among the --workers processes (at least one analysis process each).
+With the defaults on an N-core host (N gunicorn workers) that is:
+  master (model mapped) + 1 VirusTotal manager process + 1 resource tracker
+  N gunicorn workers, each with 1 forkserver and max(1, ANALYSIS_WORKERS // N) analysis processes
+so N analysis processes in all, each limited to ANALYSIS_MEMORY_MB on top of
+what it inherits, and at most ANALYSIS_QUEUE samples waiting on the host
+before uploads get 503 (each worker turns away past its own share).
+"""
+import argparse
+import os
+import sys
+
+DEFAULT_COMPILED_DIR = os.path.join('model', 'compiled')
+MODEL_PATH = os.path.join('model', 'random_forest_model.joblib')
+SCALER_PATH = os.path.join('model', 'scaler.joblib')
+
+
+def analysis_share(total, workers):
+    """One gunicorn worker's part of a host-wide analysis process or queue total."""
+    if total <= 0:
+        return 0
+    return max(1, total // workers)
+
+
+def compiled_is_current(directory):
+    """True if directory holds a forest compiled from the current model and scaler files."""
+    from compiled_forest import CompiledForest
+    from verdict_cache import artifact_version
+    if not os.path.isdir(directory):
+        return False
+    if not (os.path.exists(MODEL_PATH) and os.path.exists(SCALER_PATH)):
+        return True  # nothing to compare against; a compiled-only deployment
+    return CompiledForest.source(directory) == artifact_version(MODEL_PATH, SCALER_PATH)
+
+
+def compile_model(directory):
+    """Write the memory-mappable forest arrays from the joblib model and scaler."""
+    from joblib import load
+    from compiled_forest import CompiledForest, is_forest
+    from verdict_cache import artifact_version
+    model = load(MODEL_PATH)
+    if not is_forest(model):
+        return False
+    CompiledForest.from_sklearn(model, load(SCALER_PATH)).save(directory, artifact_version(MODEL_PATH, SCALER_PATH))
+    print(f"Compiled the model into {directory}")
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve the API with pre-forked gunicorn workers.')
+    parser.add_argument('--bind', default='127.0.0.1:5000', help='Address to listen on (default: 127.0.0.1:5000).')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='Worker processes (default: one per CPU core).')
+    parser.add_argument('--threads', type=int, default=8, help='Request threads per worker (default: 8).')
+    parser.add_argument('--timeout', type=int, default=120, help='Seconds before a silent worker is restarted.')
+    parser.add_argument('--compiled-model', default=DEFAULT_COMPILED_DIR,
+                        help=f'Directory of compiled forest arrays (default: {DEFAULT_COMPILED_DIR}).')
+    args = parser.parse_args()
+
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        print("serve.py needs gunicorn: pip install -r requierments")
+        sys.exit(1)
+
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    if os.environ.get('COMPILED_MODEL', '1') != '0':
+        # A compiled directory left over from older model files is rebuilt rather than served
+        if compiled_is_current(args.compiled_model) or compile_model(args.compiled_model):
+            os.environ['COMPILED_MODEL_DIR'] = args.compiled_model
+
+    # Host-wide analysis pool size and queue depth, split so N workers do not run N pools of a host's worth each
+    analysis_workers = int(os.environ.get('ANALYSIS_WORKERS', os.cpu_count() or 1))
+    analysis_queue = int(os.environ.get('ANALYSIS_QUEUE', 4 * analysis_workers))
+    os.environ['ANALYSIS_WORKERS'] = str(analysis_share(analysis_workers, args.workers))
+    os.environ['ANALYSIS_QUEUE'] = str(analysis_queue // args.workers)
+
+    # Loaded once here in the master; workers inherit it when gunicorn forks.
+    import server
+    import vt_service
+    server.warm_up()
+    # One VirusTotal quota and watcher for all workers; kept referenced so the manager lives as long as the master
+    vt_manager = vt_service.start_shared(server.vt_service_settings())
+    server.app.config['VT_SERVICE_ADDRESS'] = vt_manager.address
+    server.vt = server.create_vt_service()
+
+    def post_fork(arbiter, worker):
+        # A SQLite connection must not be shared across fork; give each worker its own.
+        server.verdict_cache.close()
+        server.verdict_cache = server.create_verdict_cache()
+        server.vt = server.create_vt_service()
+
+    class Application(BaseApplication):
+        def load_config(self):
+            for key, value in {"bind": args.bind, "workers": args.workers, "threads": args.threads,
+                               "worker_class": "gthread", "timeout": args.timeout,
+                               "preload_app": True, "post_fork": post_fork}.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return server.app
+
+    Application().run()
+
+
+if __name__ == '__main__':
+    main()
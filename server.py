@@ -1,56 +1,288 @@
 import os
-import math
-import pefile
-from flask import Flask, request, jsonify
+import json
+import time
+import zipfile
+from contextlib import ExitStack
+from concurrent.futures import TimeoutError
+from flask import Flask, Response, g, request, jsonify, stream_with_context
 from flask_cors import CORS
-from werkzeug.utils import secure_filename
 from joblib import load
 import numpy as np
-import requests
-import hashlib
+from pe_analysis import read_sample_file, parse_pe, features_from_bytes, load_feature_list, INVALID_PE_ERROR, SPOOL_THRESHOLD
+from analysis_pool import AnalysisPool, PoolSaturated, TIMEOUT_VERDICT, is_budget_error
+from verdict_cache import VerdictCache, artifact_version
+from compiled_forest import CompiledForest, is_forest
+from vt_client import VirusTotalError, VT_BASE_URL
+from vt_watcher import WatchLimitReached, valid_analysis_id
+import vt_service
+import metrics
+from ingest import HashingRequest, file_digests, read_upload, read_zip_member
 
 app = Flask(__name__)
-CORS(app)
-app.config['UPLOAD_FOLDER'] = 'uploads/'
+app.request_class = HashingRequest  # uploads are hashed (MD5/SHA-1/SHA-256) while the body streams in
+CORS(app, expose_headers=['X-Status-Version', 'Server-Timing'])
+
+# Prometheus metrics on /metrics. A request sent with the X-Debug-Timing header gets its per-stage breakdown back in Server-Timing.
+app.config['METRICS_ENABLED'] = os.environ.get('METRICS_ENABLED', '1') != '0'
+metrics.enable(app.config['METRICS_ENABLED'])
+REQUESTS = metrics.REGISTRY.counter('http_requests_total', 'HTTP requests by route, method and status.', ['route', 'method', 'status'])
+ERRORS = metrics.REGISTRY.counter('http_request_errors_total', 'HTTP requests that ended in a 5xx response.', ['route'])
+LATENCY = metrics.REGISTRY.histogram('http_request_duration_seconds', 'HTTP request latency by route.', ['route'])
+IN_FLIGHT = metrics.REGISTRY.gauge('http_requests_in_flight', 'HTTP requests being handled.')
+IN_FLIGHT.set(0)
+
+# Upload size limits, enforced while the body is received (413 once crossed)
+app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get('MAX_CONTENT_LENGTH', 1024 ** 3))  # whole request body
+app.config['MAX_FILE_SIZE'] = int(os.environ.get('MAX_FILE_SIZE', 256 * 1024 ** 2))  # each uploaded file
 
 #prepare VirusTotal API:
-api_key = 'f848319ea1cd5e2b44f7bc686ce99583662cfdd2904e6371543e685033786a39'
-url = "https://www.virustotal.com/api/v3/files"
-headers = {
-    "accept": "application/json",
-    "x-apikey": api_key,
-}
+app.config['VT_API_KEY'] = os.environ.get('VT_API_KEY', 'f848319ea1cd5e2b44f7bc686ce99583662cfdd2904e6371543e685033786a39')
+app.config['VT_BASE_URL'] = os.environ.get('VT_BASE_URL', VT_BASE_URL)
+app.config['VT_REQUESTS_PER_MINUTE'] = float(os.environ.get('VT_REQUESTS_PER_MINUTE', 4))  # public API quota
+app.config['VT_WAIT_SECONDS'] = float(os.environ.get('VT_WAIT_SECONDS', 5))  # longest a request thread waits on VirusTotal
+# One background poller per analysis, shared by every browser watching it
+app.config['VT_POLL_INTERVAL'] = float(os.environ.get('VT_POLL_INTERVAL', 15))
+app.config['VT_LONG_POLL_SECONDS'] = 30  # longest /status?wait= and the SSE heartbeat period
+app.config['VT_MAX_WATCHES'] = int(os.environ.get('VT_MAX_WATCHES', 1000))  # analyses polled at once; 503 beyond
+# serve.py runs the client and watcher in one process for all its workers and sets this to that service's address
+app.config['VT_SERVICE_ADDRESS'] = None
+
+
+def vt_service_settings():
+    return {"api_key": app.config['VT_API_KEY'], "base_url": app.config['VT_BASE_URL'],
+            "requests_per_minute": app.config['VT_REQUESTS_PER_MINUTE'],
+            "poll_interval": app.config['VT_POLL_INTERVAL'], "max_watches": app.config['VT_MAX_WATCHES']}
+
+
+def create_vt_service():
+    if app.config['VT_SERVICE_ADDRESS'] is not None:
+        return vt_service.connect(app.config['VT_SERVICE_ADDRESS'])
+    return vt_service.VirusTotalService(**vt_service_settings())
+
+
+vt = create_vt_service()
 
 # Load the model and the scaler
 model_path = os.path.join('model', 'random_forest_model.joblib')
 scaler_path = os.path.join('model', 'scaler.joblib')
-model = load(model_path)
-scaler = load(scaler_path)
 
-# Ensure the upload folder exists
-os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+# Features the model was trained on, in column order; feature_cost.py writes model/features.json next to a model
+# trained on a cheaper subset. Without the file the server extracts the original eight (pe_analysis.DEFAULT_FEATURES).
+app.config['FEATURES_FILE'] = os.environ.get('FEATURES_FILE', os.path.join('model', 'features.json'))
+model_features = load_feature_list(app.config['FEATURES_FILE'])
+feature_files = [app.config['FEATURES_FILE']] if os.path.exists(app.config['FEATURES_FILE']) else []
+
+# Random forests are flattened into NumPy arrays with the scaler folded in (identical predictions, far lower latency).
+# With COMPILED_MODEL_DIR (written by compiled_forest.py) the arrays are memory-mapped read-only instead of unpickled,
+# so every pre-forked worker shares the same pages; see serve.py.
+app.config['COMPILED_MODEL'] = os.environ.get('COMPILED_MODEL', '1') != '0'
+app.config['COMPILED_MODEL_DIR'] = os.environ.get('COMPILED_MODEL_DIR')
+# Per-row tree walks lose to sklearn's vectorised predict on large batches; past this many rows use sklearn when loaded.
+app.config['COMPILED_MAX_ROWS'] = int(os.environ.get('COMPILED_MAX_ROWS', 512))
+if app.config['COMPILED_MODEL'] and app.config['COMPILED_MODEL_DIR']:
+    model = scaler = None
+    compiled_model = CompiledForest.load(app.config['COMPILED_MODEL_DIR'], mmap_mode='r')
+    model_version = artifact_version(*CompiledForest.files(app.config['COMPILED_MODEL_DIR']), *feature_files)
+else:
+    model = load(model_path)
+    scaler = load(scaler_path)
+    compiled_model = CompiledForest.from_sklearn(model, scaler) if app.config['COMPILED_MODEL'] and is_forest(model) else None
+    model_version = artifact_version(model_path, scaler_path, *feature_files)
+n_features = compiled_model.n_features if compiled_model is not None else model.n_features_in_
+if n_features != len(model_features):
+    raise ValueError(f"The model expects {n_features} features but the server would extract {len(model_features)} "
+                     f"({model_features}); check FEATURES_FILE ({app.config['FEATURES_FILE']})")
+
+# Verdicts are cached by content hash; the key includes the model/scaler fingerprint
+app.config['VERDICT_CACHE_SIZE'] = int(os.environ.get('VERDICT_CACHE_SIZE', 10000))
+app.config['VERDICT_CACHE_DB'] = os.environ.get('VERDICT_CACHE_DB')  # SQLite file for a persistent tier
+
+
+def create_verdict_cache():
+    return VerdictCache(model_version, max_entries=app.config['VERDICT_CACHE_SIZE'],
+                        db_path=app.config['VERDICT_CACHE_DB'])
+
+
+verdict_cache = create_verdict_cache()
+
+# Samples are parsed on a bounded pool of worker processes (ANALYSIS_WORKERS=0 parses on the request thread instead).
+# Past ANALYSIS_QUEUE waiting samples the server answers 503; a sample over its time or memory budget gets the
+# "analysis timeout" verdict and its worker is replaced. Under serve.py both settings are totals for the host,
+# which serve.py divides among the gunicorn workers before this module is imported.
+app.config['ANALYSIS_WORKERS'] = int(os.environ.get('ANALYSIS_WORKERS', os.cpu_count() or 1))
+app.config['ANALYSIS_QUEUE'] = int(os.environ.get('ANALYSIS_QUEUE', 4 * app.config['ANALYSIS_WORKERS']))
+app.config['ANALYSIS_TIMEOUT'] = float(os.environ.get('ANALYSIS_TIMEOUT', 30))  # seconds per sample
+app.config['ANALYSIS_MEMORY_MB'] = int(os.environ.get('ANALYSIS_MEMORY_MB', 1024))  # per worker, 0 = unlimited
+app.config['BATCH_MAX_FILES'] = int(os.environ.get('BATCH_MAX_FILES', 5000))
+app.config['BATCH_MAX_ZIP_BYTES'] = int(os.environ.get('BATCH_MAX_ZIP_BYTES', 2 * 1024 ** 3))  # total uncompressed size
+analysis_pool = None
+if app.config['ANALYSIS_WORKERS'] > 0:
+    analysis_pool = AnalysisPool(app.config['ANALYSIS_WORKERS'], max_queue=app.config['ANALYSIS_QUEUE'],
+                                 timeout=app.config['ANALYSIS_TIMEOUT'],
+                                 memory_limit=app.config['ANALYSIS_MEMORY_MB'] * 1024 ** 2, features=model_features)
+
+
+@app.before_request
+def start_request_metrics():
+    if not metrics.enabled():
+        return
+    IN_FLIGHT.inc()
+    g.metrics_start = time.perf_counter()
+    g.metrics_breakdown = metrics.begin_breakdown()
+
+
+@app.after_request
+def record_request_metrics(response):
+    if 'metrics_start' not in g:
+        return response
+    route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    REQUESTS.inc(route=route, method=request.method, status=response.status_code)
+    if response.status_code >= 500:
+        ERRORS.inc(route=route)
+    LATENCY.observe(time.perf_counter() - g.metrics_start, route=route)
+    breakdown = metrics.end_breakdown(g.pop('metrics_breakdown'))
+    if breakdown and 'X-Debug-Timing' in request.headers:
+        response.headers['Server-Timing'] = metrics.server_timing(breakdown)
+    return response
+
+
+@app.teardown_request
+def finish_request_metrics(exc):
+    if g.pop('metrics_start', None) is not None:
+        IN_FLIGHT.dec()
+
+
+@app.errorhandler(413)
+def too_large(e):
+    return jsonify({"error": e.description}), 413
+
+
+@app.errorhandler(WatchLimitReached)
+def too_many_watches(e):
+    response = jsonify({"error": "Too many analyses are being watched, please try again shortly."})
+    response.headers['Retry-After'] = str(int(app.config['VT_POLL_INTERVAL']))
+    return response, 503
+
+
+@app.errorhandler(PoolSaturated)
+def analysis_saturated(e):
+    response = jsonify({"error": "Server is busy analysing other files, please try again shortly."})
+    response.headers['Retry-After'] = '1'
+    return response, 503
+
+
+#Prometheus text exposition of every counter, gauge and histogram.
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    if app.config['VT_SERVICE_ADDRESS'] is None:
+        return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+    # VirusTotal requests are made by the shared service, so its process holds those metrics
+    body = metrics.render(skip=(vt_service.METRICS_PREFIX,)) + vt.render_metrics()
+    return Response(body, mimetype='text/plain; version=0.0.4')
+
 
 #analyze file against the machine learning model
 @app.route('/upload', methods=['POST'])
 def upload_file():
-    if 'file' not in request.files:
+    with metrics.stage('receive'):
+        files = request.files
+    if 'file' not in files:
         return jsonify({"error": "No file part"}), 400
-    file = request.files['file']
+    file = files['file']
     if file.filename == '':
         return jsonify({"error": "No selected file"}), 400
-    file_path = os.path.join(app.config['UPLOAD_FOLDER'], secure_filename(file.filename))
-    file.save(file_path)  # Save the file to disk
 
-    if not is_pe_file(file_path):
-        os.remove(file_path)
-        return jsonify({"error": "SUSPICIOUS FILE ALERT: File has an executable signature but an invalid PE header."}), 400
+    # The upload was hashed as it arrived; validation, entropy and features all share one buffer and one parse
+    sha256 = file_digests(file)['sha256']
+    with metrics.stage('read'):
+        sample = read_upload(file)
+    with sample:
+        with metrics.stage('cache'):
+            result = verdict_cache.get(sha256)
+        if result is not None:
+            return jsonify({"result": result})
+
+        result, error = analyze_sample(sample, file.filename)
 
-    # Analyze the PE file
-    result = analyze_file(file_path)
-    os.remove(file_path)
+    if error == INVALID_PE_ERROR:
+        return jsonify({"error": INVALID_PE_ERROR}), 400
+    if is_budget_error(error):
+        return jsonify({"result": TIMEOUT_VERDICT, "error": error}), 422
+    if error is not None:
+        return jsonify({"error": "Error processing file"}), 500
+    verdict_cache.put(sha256, result)
     return jsonify({"result": int(result)})
 
 
+#verdict cache hit/miss counters
+@app.route('/cache/stats', methods=['GET'])
+def cache_stats():
+    return jsonify(verdict_cache.stats())
+
+
+#analysis pool size, limits and current load
+@app.route('/analysis/stats', methods=['GET'])
+def analysis_stats():
+    return jsonify(analysis_pool.stats() if analysis_pool is not None else {"workers": 0})
+
+
+#analyze many files (several 'files' parts, or one ZIP archive) with a single vectorized model call
+@app.route('/upload/batch', methods=['POST'])
+def upload_batch():
+    uploads = request.files.getlist('files') or request.files.getlist('file')
+    uploads = [file for file in uploads if file.filename != '']
+    if not uploads:
+        return jsonify({"error": "No file part"}), 400
+
+    # Every sample stays open (in memory or mapped from its temp file) until the response is built
+    with ExitStack() as samples_open:
+        try:
+            if len(uploads) == 1 and is_zip_upload(uploads[0]):
+                samples = read_zip_samples(uploads[0].stream, samples_open)
+            else:
+                samples = [(file.filename, samples_open.enter_context(read_upload(file)), file_digests(file)['sha256'])
+                           for file in uploads]
+        except (zipfile.BadZipFile, ValueError) as e:
+            return jsonify({"error": str(e)}), 400
+        if len(samples) > app.config['BATCH_MAX_FILES']:
+            return jsonify({"error": f"Too many files, the limit is {app.config['BATCH_MAX_FILES']}"}), 413
+        return score_batch(samples)
+
+
+#answers a batch from cached verdicts, extracting and scoring only the samples that missed.
+def score_batch(samples):
+    results = []
+    pending = []  # indexes of samples that missed the cache
+    for name, sample, sha256 in samples:
+        verdict = verdict_cache.get(sha256)
+        results.append({"filename": name, "sha256": sha256, "result": verdict})
+        if verdict is None:
+            pending.append(len(results) - 1)
+
+    with metrics.stage('extract'):
+        extracted = extract_many([samples[i][1] for i in pending])
+    scored = [(i, features) for i, (features, error) in zip(pending, extracted) if features is not None]
+    for i, (features, error) in zip(pending, extracted):
+        if is_budget_error(error):
+            results[i]["result"] = TIMEOUT_VERDICT
+            results[i]["error"] = error
+        elif error is not None:
+            del results[i]["result"]
+            results[i]["error"] = error
+
+    if scored:
+        try:
+            predictions = predict(np.array([features for _, features in scored]))
+        except Exception as e:
+            print(f"Error scoring batch: {e}")
+            return jsonify({"error": "Error processing files"}), 500
+        for (i, _), prediction in zip(scored, predictions):
+            results[i]["result"] = int(prediction)
+            verdict_cache.put(results[i]["sha256"], prediction)
+
+    return jsonify({"count": len(results), "results": results})
+
+
 #Receive file on server, Attempt to get file report by signature, otherwise upload file for an active scan.
 @app.route('/virusTotal', methods=['POST'])
 def virusTotal():
@@ -60,115 +292,155 @@ def virusTotal():
     if file.filename == '':
         return jsonify({"error": "No selected file"}), 400
 
-    # Save the file temporarily to disk
-    file_path = os.path.join(app.config['UPLOAD_FOLDER'], secure_filename(file.filename))
-    file.save(file_path)  
+    md5_digest = file_digests(file)['md5']  # computed while the upload streamed in
+    data = file.stream.read()  # kept for the background upload, which outlives this request's temp file
 
+    # The lookup and upload run on the VirusTotal client's threads; this thread only waits a bounded time
     try:
-        data = get_report_by_hash(file_path)
-
-        if (data != None):
-            return jsonify({"hash": data['data']}) #successful virusTotal file report by signature (md5 hash)
+        with metrics.stage('virustotal'):
+            kind, payload = vt.scan(file.filename, data, md5_digest, app.config['VT_WAIT_SECONDS'])
+    except VirusTotalError as e:
+        return jsonify({"error": "Failed to scan the file", "status": e.status_code}), e.status_code
 
-        with open(file_path, "rb") as f:
-            files = {'file': (file.filename, f)}
-            response = requests.post(url, headers=headers, files=files) #blocking function
+    if kind == 'report':
+        return jsonify({"hash": payload['data']}) #successful virusTotal file report by signature (md5 hash)
+    return jsonify({"file_id": payload}), 202  # an analysis id, or a job id while the lookup/upload is still running
 
-        if response.status_code != 200:
-            return jsonify({"error": "Failed to scan the file", "status": response.status_code}), response.status_code
-        
-        os.remove(file_path)
-        data = response.json()
-        return jsonify({"file_id": data['data']['id']}), 202
 
-    finally:
-        if file_path and os.path.exists(file_path):
-            os.remove(file_path)
-
-            
-#JS client repeatedly polls through requests to this function until the returned status is 'completed'
+#latest state of an analysis. With ?version=N&wait=S this long-polls until a snapshot newer than N exists.
 @app.route('/status/<file_id>', methods=['GET'])
 def check_status(file_id):
-    try:
-        url_id = f"https://www.virustotal.com/api/v3/analyses/{file_id}"
-        response = requests.get(url_id, headers=headers)
+    if not valid_analysis_id(file_id):
+        return jsonify({"error": "Invalid analysis id"}), 400
+    known = request.args.get('version', -1, type=int)
+    wait = min(request.args.get('wait', 0, type=float), app.config['VT_LONG_POLL_SECONDS'])
+    version, data, status_code, done = vt.status(file_id, known, wait)
+    response = jsonify(data)
+    response.headers['X-Status-Version'] = str(version)
+    return response, status_code
 
-        if response.status_code == 200:
-            data = response.json()
-            return jsonify(data)
-        else:
-            return jsonify({"error": f"Failed to get status. Status code: {response.status_code}"}), response.status_code
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
-    
-
-#attempts to get file report by file signature.
-def get_report_by_hash(file_path):
-    md5_hash = hashlib.md5()
-    with open(file_path, "rb") as f:
-        for chunk in iter(lambda: f.read(4096), b""):
-            md5_hash.update(chunk)
-    md5_digest = md5_hash.hexdigest()
-
-    urlbymd5 = f"https://www.virustotal.com/api/v3/files/{md5_digest}"
-    response = requests.get(urlbymd5, headers=headers)
-    if response.status_code == 200:
-        data = response.json()
-        return data
-    return None
-
-#checks if the uploaded file is a Portable Executable.
+
+#pushes every new snapshot of an analysis to the browser as Server-Sent Events until it completes.
+@app.route('/events/<file_id>', methods=['GET'])
+def status_events(file_id):
+    if not valid_analysis_id(file_id):
+        return jsonify({"error": "Invalid analysis id"}), 400
+    first = vt.status(file_id, -1, 0)  # starts watching, and raises WatchLimitReached before the stream begins
+
+    def stream():
+        sent = -1
+        snapshot = first
+        while True:
+            if snapshot is None:
+                snapshot = vt.status(file_id, sent, app.config['VT_LONG_POLL_SECONDS'])
+            version, data, status_code, done = snapshot
+            snapshot = None
+            if version == sent:
+                yield ": keep-alive\n\n"
+                continue
+            sent = version
+            event = "status" if status_code == 200 else "failure"
+            yield f"event: {event}\nid: {version}\ndata: {json.dumps(data)}\n\n"
+            if done:
+                return
+
+    return Response(stream_with_context(stream()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+#watcher counters: analyses being polled, cached reports and upstream requests made.
+@app.route('/status/stats', methods=['GET'])
+def status_stats():
+    return jsonify(vt.stats())
+
+
+#a lone upload is unpacked as an archive only when it is named or typed as a ZIP (self-extracting PEs are ZIPs too).
+def is_zip_upload(file):
+    return file.filename.lower().endswith('.zip') or file.mimetype in ('application/zip', 'application/x-zip-compressed')
+
+
+#opens every regular member of an uploaded ZIP archive as a Sample registered on samples_open, enforcing the batch
+#and per-file size limits before anything is decompressed. At most SPOOL_THRESHOLD bytes of the whole archive are
+#held in memory; other members are mapped from temp files, so the analysis workers map them as they do large uploads.
+def read_zip_samples(stream, samples_open):
+    with zipfile.ZipFile(stream) as archive:
+        members = [info for info in archive.infolist() if not info.is_dir()]
+        if len(members) > app.config['BATCH_MAX_FILES']:
+            raise ValueError(f"Too many files, the limit is {app.config['BATCH_MAX_FILES']}")
+        if sum(info.file_size for info in members) > app.config['BATCH_MAX_ZIP_BYTES']:
+            raise ValueError("Archive is too large once extracted")
+        oversized = [info.filename for info in members if info.file_size > app.config['MAX_FILE_SIZE']]
+        if oversized:
+            raise ValueError(f"Files over the {app.config['MAX_FILE_SIZE']} byte limit: {', '.join(oversized[:5])}")
+        samples = []
+        memory_left = SPOOL_THRESHOLD
+        for info in members:
+            sample, sha256 = read_zip_member(archive, info, app.config['MAX_FILE_SIZE'], memory_left)
+            samples_open.enter_context(sample)
+            if sample.fileno is None:
+                memory_left -= sample.size
+            samples.append((info.filename, sample, sha256))
+        return samples
+
+
+#extracts features for many samples on the analysis pool, spread over its worker processes.
+def extract_many(samples):
+    if analysis_pool is None or not samples:
+        return [features_from_bytes(sample.data, model_features) for sample in samples]
+    return analysis_pool.map([sample.data for sample in samples], [sample.fileno for sample in samples])
+
+
+#scales a matrix of feature rows and runs the model on all of them at once.
+def predict(features_matrix):
+    if compiled_model is not None and (model is None or len(features_matrix) <= app.config['COMPILED_MAX_ROWS']):
+        with metrics.stage('predict'):
+            return compiled_model.predict(features_matrix)
+    with metrics.stage('scale'):
+        scaled = scaler.transform(features_matrix)
+    with metrics.stage('predict'):
+        return model.predict(scaled)
+
+
+#runs one inference so lazy imports, NumPy dispatch and the model's pages are loaded before the first request.
+def warm_up():
+    predict(np.zeros((1, n_features)))
+
+
+#checks if the file at file_path is a Portable Executable.
 def is_pe_file(file_path):
     if not os.path.isfile(file_path):
         return False
-    try:
-        with open(file_path, 'rb') as f:
-            pefile.PE(data=f.read())
-        return True
-    except Exception as e:
-        print(f"Failed to validate PE file: {e}")
-        return False
+    with read_sample_file(file_path) as sample:
+        return parse_pe(sample.data) is not None
 
 
-#calculates file entropy.
-def shannon_entropy(data):
-    freq = {}
-    for byte in data:
-        freq[byte] = freq.get(byte, 0) + 1
-    total_bytes = len(data)
-    entropy = -sum((count / total_bytes) * math.log2(count / total_bytes) for count in freq.values() if count != 0)
-    return entropy
+#extracts one sample's features on the analysis pool and runs the model on them; returns (prediction, error).
+def analyze_sample(sample, name='<upload>'):
+    with metrics.stage('extract'):
+        if analysis_pool is not None:
+            features, error = analysis_pool.run(sample.data, sample.fileno)
+        else:
+            features, error = features_from_bytes(sample.data, model_features)
+    if error is not None:
+        return None, error
+    try:
+        features_array = np.array(features).reshape(1, -1)
+        app.logger.debug("Features: %s", features)
+        prediction = predict(features_array)[0]
+        return prediction, None
+
+    except Exception as e:
+        print(f"Error processing file {name}: {e}")
+        return None, "Error processing file"
 
 
  # Calculate overall file entropy and extract PE features.
 def analyze_file(file_path):
-    try:
-        with open(file_path, 'rb') as file:
-            file_content = file.read()
-        file_size = os.path.getsize(file_path)
-        entropy = shannon_entropy(file_content)
-        pe = pefile.PE(file_path)
-        features_array = np.array([
-            entropy,
-            file_size,
-            len(pe.sections),
-            pe.FILE_HEADER.TimeDateStamp,
-            pe.FILE_HEADER.Characteristics,
-            pe.OPTIONAL_HEADER.DllCharacteristics,
-            len(pe.DIRECTORY_ENTRY_IMPORT) if hasattr(pe, 'DIRECTORY_ENTRY_IMPORT') else 0,
-            0 if pe.verify_checksum() else 1
-        ]).reshape(1, -1)
-
-        print("Features:", features_array)
-        scaled_features_array = scaler.transform(features_array)
-        print("Scaled Features:", scaled_features_array)
-        prediction = model.predict(scaled_features_array)[0]
-        return prediction
-    
-    except Exception as e:
-        print(f"Error processing file {file_path}: {e}")
-        return "Error processing file"
-
+    with read_sample_file(file_path) as sample:
+        result, error = analyze_sample(sample, file_path)
+    if is_budget_error(error):
+        return TIMEOUT_VERDICT
+    return "Error processing file" if error is not None else result
 
 
 if __name__ == '__main__':
@@ -0,0 +1,270 @@
+"""Train and evaluate the malware classifiers outside the notebook.
+
+Every classifier from final.py is cross-validated with stratified K-fold.
+Each fold is fitted exactly once: class predictions are derived from the
+fold's predicted probabilities instead of refitting for predict(). All
+(classifier, fold) fits run in parallel with joblib, and fitted fold models
+are cached on disk under a key made of the fold's data hash and the
+classifier's parameters, so reruns only fit what changed. Metrics are written
+as JSON, and the chosen model plus its StandardScaler are saved as the
+artifacts server.py loads.
+
+Usage:
+  python train.py <dataset> [--test final_external_test.csv] [--classifiers NAME ...]
+                  [--folds 5] [--n-jobs -1] [--cache-dir .train_cache] [--metrics metrics.json]
+                  [--model-dir model] [--final-model "Random Forest"]
+
+<dataset> is a generator CSV or a feature store directory (see feature_store.py).
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+import sklearn
+from joblib import Parallel, delayed, dump, load
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.linear_model import LogisticRegression
+from sklearn.metrics import auc, confusion_matrix, f1_score, precision_score, recall_score, roc_curve
+from sklearn.model_selection import StratifiedKFold
+from sklearn.neighbors import KNeighborsClassifier
+from sklearn.preprocessing import StandardScaler
+from sklearn.svm import SVC
+from sklearn.tree import DecisionTreeClassifier
+
+from compiled_forest import CompiledForest, is_forest
+from feature_store import FeatureStore
+from pe_analysis import save_feature_list, serving_features
+from verdict_cache import artifact_version
+
+LABEL = 'malware'
+MODEL_FILE = 'random_forest_model.joblib'  # the name server.py loads, whatever the model type
+SCALER_FILE = 'scaler.joblib'
+FEATURES_FILE = 'features.json'  # the features server.py extracts for the model, when not its default eight
+
+
+def _xgboost():
+    import xgboost as xgb
+    return xgb.XGBClassifier(eval_metric='logloss')
+
+
+# Same classifiers and settings as final.py
+CLASSIFIERS = {
+    "Decision Tree": lambda: DecisionTreeClassifier(random_state=0),
+    "XGBoost": _xgboost,
+    "Random Forest": lambda: RandomForestClassifier(n_estimators=100, random_state=0),
+    "KNN": lambda: KNeighborsClassifier(n_neighbors=5),
+    "Logistic Regression": lambda: LogisticRegression(random_state=0),
+    "SVM": lambda: SVC(random_state=0, probability=True),
+}
+
+
+def load_dataset(path, label=LABEL):
+    """(X, t, feature_names) from a generator CSV or a feature store directory."""
+    if os.path.isdir(path):
+        store = FeatureStore.open(path)
+        columns = store.load([store.label] + store.feature_names)
+        X = np.column_stack([np.asarray(columns[name], dtype=np.float64) for name in store.feature_names])
+        return X, np.asarray(columns[store.label]), store.feature_names
+    import pandas as pd
+    df = pd.read_csv(path)
+    features = [name for name in df.columns if name != label]
+    return df[features].to_numpy(dtype=np.float64), df[label].to_numpy(), features
+
+
+def data_hash(*arrays):
+    digest = hashlib.sha256()
+    for array in arrays:
+        array = np.ascontiguousarray(array)
+        digest.update(f"{array.dtype.str}{array.shape}".encode())
+        digest.update(array.tobytes())
+    return digest.hexdigest()
+
+
+def model_key(name, clf, X, t):
+    """Cache key of one fitted model: its training data, its parameters and the library version."""
+    params = sorted((key, repr(value)) for key, value in clf.get_params(deep=False).items())
+    digest = hashlib.sha256(f"{name}|{type(clf).__module__}.{type(clf).__qualname__}|{params}|"
+                            f"{sklearn.__version__}|{data_hash(X, t)}".encode())
+    return digest.hexdigest()[:32]
+
+
+def fit_cached(name, X, t, cache_dir=None):
+    """Fit a fresh classifier on (X, t), or load an identical fit from the cache; returns (model, seconds, cached)."""
+    clf = CLASSIFIERS[name]()
+    path = os.path.join(cache_dir, f"{model_key(name, clf, X, t)}.joblib") if cache_dir else None
+    if path is not None and os.path.exists(path):
+        return load(path), 0.0, True
+    start = time.perf_counter()
+    clf.fit(X, t)
+    seconds = time.perf_counter() - start
+    if path is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        dump(clf, tmp_path)
+        os.replace(tmp_path, path)
+    return clf, seconds, False
+
+
+def _fold_task(name, X_train, t_train, X_test, cache_dir):
+    clf, seconds, cached = fit_cached(name, X_train, t_train, cache_dir)
+    return clf.predict_proba(X_test), clf.classes_, seconds, cached
+
+
+def _final_task(name, X_train, t_train, X_test, cache_dir):
+    clf, seconds, cached = fit_cached(name, X_train, t_train, cache_dir)
+    proba = clf.predict_proba(X_test) if X_test is not None else None
+    return clf, proba, seconds, cached
+
+
+def binary_metrics(t, proba, classes):
+    """Metrics reported by final.py, with class predictions taken from the probabilities."""
+    t_pred = classes[np.argmax(proba, axis=1)]
+    t_score = proba[:, list(classes).index(1)]
+    fpr, tpr, _ = roc_curve(t, t_score)
+    cm = confusion_matrix(t, t_pred, labels=[0, 1])
+    specificity = cm[0, 0] / (cm[0, 0] + cm[0, 1]) if cm[0].sum() else 0.0
+    return {
+        "auc": float(auc(fpr, tpr)),
+        "precision": float(precision_score(t, t_pred, zero_division=0)),
+        "recall": float(recall_score(t, t_pred, zero_division=0)),
+        "f1": float(f1_score(t, t_pred, zero_division=0)),
+        "specificity": float(specificity),
+        "fpr": float(1 - specificity),
+        "confusion_matrix": cm.tolist(),
+    }
+
+
+def available(names):
+    """Classifiers whose optional dependency is installed."""
+    usable = []
+    for name in names:
+        try:
+            CLASSIFIERS[name]()
+            usable.append(name)
+        except ImportError as e:
+            print(f"Skipping {name}: {e}")
+    return usable
+
+
+def cross_validate(names, X, t, folds=5, n_jobs=-1, cache_dir=None):
+    """Out-of-fold metrics per classifier; every (classifier, fold) pair is one parallel fit."""
+    splits = list(StratifiedKFold(n_splits=folds).split(X, t))
+    tasks = [(name, train, test) for name in names for train, test in splits]
+    outputs = Parallel(n_jobs=n_jobs)(delayed(_fold_task)(name, X[train], t[train], X[test], cache_dir)
+                                      for name, train, test in tasks)
+    results = {}
+    for name in names:
+        proba = None
+        fit_seconds = 0.0
+        cached = 0
+        for (task_name, _, test), (fold_proba, classes, seconds, hit) in zip(tasks, outputs):
+            if task_name != name:
+                continue
+            if proba is None:
+                proba = np.zeros((len(t), len(classes)))
+            proba[test] = fold_proba
+            fit_seconds += seconds
+            cached += hit
+        results[name] = {**binary_metrics(t, proba, classes), "fit_seconds": round(fit_seconds, 3),
+                         "cached_folds": cached}
+    return results
+
+
+def fit_final(names, X, t, X_test=None, n_jobs=-1, cache_dir=None):
+    """Fit a StandardScaler on all of X and every classifier on the scaled data, as final.py does."""
+    scaler = StandardScaler().fit(X)
+    X_scaled = scaler.transform(X)
+    X_test_scaled = scaler.transform(X_test) if X_test is not None else None
+    outputs = Parallel(n_jobs=n_jobs)(delayed(_final_task)(name, X_scaled, t, X_test_scaled, cache_dir)
+                                      for name in names)
+    return scaler, dict(zip(names, outputs))
+
+
+def save_artifacts(model, scaler, model_dir, features, feature_info=None):
+    """Write the model and scaler server.py loads, and refresh the compiled forest serve.py maps if there is one.
+
+    features are the model's columns in order; features.json is written (or a
+    stale one removed) so server.py extracts exactly those.
+    """
+    served = serving_features(features)
+    if served is None:
+        raise ValueError(f"server.py cannot extract the columns {list(features)}")
+    os.makedirs(model_dir, exist_ok=True)
+    save_feature_list(os.path.join(model_dir, FEATURES_FILE), served, feature_info)
+    model_path, scaler_path = os.path.join(model_dir, MODEL_FILE), os.path.join(model_dir, SCALER_FILE)
+    dump(model, model_path)
+    dump(scaler, scaler_path)
+    compiled_dir = os.path.join(model_dir, 'compiled')
+    if os.path.isdir(compiled_dir):
+        shutil.rmtree(compiled_dir)
+        if is_forest(model):
+            CompiledForest.from_sklearn(model, scaler).save(compiled_dir, artifact_version(model_path, scaler_path))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Cross-validate the classifiers and save the server model artifacts.')
+    parser.add_argument('dataset', help='Training data: generator CSV or feature store directory.')
+    parser.add_argument('--test', help='External test set (CSV or feature store), e.g. final_external_test.csv.')
+    parser.add_argument('--classifiers', nargs='+', choices=list(CLASSIFIERS), default=list(CLASSIFIERS),
+                        help='Classifiers to evaluate (default: all).')
+    parser.add_argument('--folds', type=int, default=5, help='Stratified cross-validation folds (default: 5, 0 to skip).')
+    parser.add_argument('--n-jobs', type=int, default=-1, help='Parallel fits (default: -1, one per CPU core).')
+    parser.add_argument('--cache-dir', default='.train_cache', help="Fitted model cache (default: .train_cache, '' to disable).")
+    parser.add_argument('--metrics', default='metrics.json', help='Metrics JSON to write (default: metrics.json).')
+    parser.add_argument('--model-dir', default='model', help='Where to save the server artifacts (default: model).')
+    parser.add_argument('--final-model', default='Random Forest', help='Classifier saved for the server (default: Random Forest).')
+    parser.add_argument('--no-save', action='store_true', help='Evaluate only; do not write model artifacts.')
+    args = parser.parse_args()
+
+    cache_dir = args.cache_dir or None
+    names = available(args.classifiers)
+    X, t, features = load_dataset(args.dataset)
+    if not args.no_save and serving_features(features) is None:
+        parser.error(f"server.py cannot extract the columns {features}; train on a generator dataset or pass --no-save")
+    report = {"dataset": {"path": args.dataset, "rows": int(len(t)), "features": features,
+                          "sha256": data_hash(X, t)},
+              "sklearn": sklearn.__version__}
+
+    if args.folds:
+        start = time.perf_counter()
+        report["cv"] = {"folds": args.folds, "results": cross_validate(names, X, t, args.folds, args.n_jobs, cache_dir)}
+        report["cv"]["seconds"] = round(time.perf_counter() - start, 3)
+
+    X_test = t_test = None
+    if args.test:
+        X_test, t_test, test_features = load_dataset(args.test)
+        if test_features != features:
+            parser.error(f"Test set columns {test_features} do not match the training columns {features}")
+    final_names = names if args.test else [name for name in names if name == args.final_model]
+    scaler, fitted = fit_final(final_names, X, t, X_test, args.n_jobs, cache_dir)
+    if args.test:
+        report["test"] = {"path": args.test, "rows": int(len(t_test)),
+                          "results": {name: {**binary_metrics(t_test, proba, clf.classes_),
+                                             "fit_seconds": round(seconds, 3), "cached": cached}
+                                      for name, (clf, proba, seconds, cached) in fitted.items()}}
+
+    if not args.no_save:
+        if args.final_model not in fitted:
+            parser.error(f"--final-model {args.final_model!r} was not trained")
+        save_artifacts(fitted[args.final_model][0], scaler, args.model_dir, features)
+        report["artifacts"] = {"model": os.path.join(args.model_dir, MODEL_FILE),
+                               "scaler": os.path.join(args.model_dir, SCALER_FILE), "classifier": args.final_model}
+
+    with open(args.metrics, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    for section in ("cv", "test"):
+        if section not in report:
+            continue
+        print(f"\n{section.upper()}: {'classifier':<22} {'AUC':>6} {'prec':>6} {'recall':>6} {'F1':>6} {'FPR':>6}")
+        for name, m in report[section]["results"].items():
+            print(f"     {name:<22} {m['auc']:>6.3f} {m['precision']:>6.3f} {m['recall']:>6.3f} {m['f1']:>6.3f} {m['fpr']:>6.3f}")
+    print(f"\nMetrics written to {args.metrics}")
+
+
+if __name__ == '__main__':
+    main()
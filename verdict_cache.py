@@ -0,0 +1,118 @@
+"""Content-addressed cache of model verdicts.
+
+Entries are keyed by the SHA-256 of the uploaded bytes together with a version
+string derived from the model and scaler artifacts, so replacing either file
+makes every old entry unreachable. An in-process LRU tier answers repeat
+samples without touching disk; an optional SQLite tier keeps verdicts across
+restarts and between server processes. Hits, misses and evictions are also
+counted in the metrics registry for /metrics.
+"""
+import hashlib
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import metrics
+
+HITS = metrics.REGISTRY.counter('verdict_cache_hits_total', 'Verdicts answered from the cache, by tier.', ['tier'])
+MISSES = metrics.REGISTRY.counter('verdict_cache_misses_total', 'Lookups that found no cached verdict.')
+EVICTIONS = metrics.REGISTRY.counter('verdict_cache_evictions_total', 'Verdicts dropped from the in-memory LRU to make room.')
+ENTRIES = metrics.REGISTRY.gauge('verdict_cache_entries', 'Verdicts held in the in-memory LRU.')
+ENTRIES.set(0)
+
+
+def artifact_version(*paths):
+    """Short fingerprint of the model/scaler files the verdicts were produced with."""
+    digest = hashlib.sha256()
+    for path in paths:
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+
+class VerdictCache:
+    def __init__(self, version, max_entries=10000, db_path=None):
+        self.version = version
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._db = None
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("CREATE TABLE IF NOT EXISTS verdicts ("
+                             "sha256 TEXT NOT NULL, version TEXT NOT NULL, verdict INTEGER NOT NULL, "
+                             "created REAL NOT NULL, PRIMARY KEY (sha256, version))")
+            # Verdicts from any other model/scaler can never be served again.
+            self._db.execute("DELETE FROM verdicts WHERE version != ?", (version,))
+
+    def get(self, sha256):
+        """Return the cached verdict for a content hash, or None."""
+        with self._lock:
+            verdict = self._entries.get(sha256)
+            if verdict is not None:
+                self._entries.move_to_end(sha256)
+                self.memory_hits += 1
+                HITS.inc(tier='memory')
+                return verdict
+            if self._db is not None:
+                row = self._db.execute("SELECT verdict FROM verdicts WHERE sha256 = ? AND version = ?",
+                                       (sha256, self.version)).fetchone()
+                if row is not None:
+                    self._remember(sha256, row[0])
+                    self.disk_hits += 1
+                    HITS.inc(tier='disk')
+                    return row[0]
+            self.misses += 1
+            MISSES.inc()
+            return None
+
+    def put(self, sha256, verdict):
+        verdict = int(verdict)
+        with self._lock:
+            self._remember(sha256, verdict)
+            if self._db is not None:
+                self._db.execute("INSERT OR REPLACE INTO verdicts (sha256, version, verdict, created) VALUES (?, ?, ?, ?)",
+                                 (sha256, self.version, verdict, time.time()))
+
+    def _remember(self, sha256, verdict):
+        self._entries[sha256] = verdict
+        self._entries.move_to_end(sha256)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+            EVICTIONS.inc()
+        ENTRIES.set(len(self._entries))
+
+    def clear(self):
+        """Forget every verdict of this model version, in memory and in the SQLite tier."""
+        with self._lock:
+            self._entries.clear()
+            ENTRIES.set(0)
+            if self._db is not None:
+                self._db.execute("DELETE FROM verdicts WHERE version = ?", (self.version,))
+
+    def stats(self):
+        with self._lock:
+            return {
+                "version": self.version,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "persistent": self._db is not None,
+                "hits": self.memory_hits + self.disk_hits,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
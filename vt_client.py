@@ -0,0 +1,172 @@
+"""VirusTotal API v3 client used by the server.
+
+All calls run on the client's own small thread pool and return
+concurrent.futures.Future objects, so Flask request threads only ever wait
+on them with a bounded timeout. Requests share one pooled requests.Session,
+carry connect/read timeouts, are retried with exponential backoff on
+throttling and server errors (waiting as long as a Retry-After header asks,
+up to max_retry_after seconds), and pass through a token bucket that keeps the
+client under the account's request quota.
+"""
+import math
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+
+VT_BASE_URL = "https://www.virustotal.com/api/v3"
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+UPSTREAM_SECONDS = metrics.REGISTRY.histogram('virustotal_request_duration_seconds',
+                                              'Latency of each VirusTotal HTTP request.', ['endpoint', 'status'])
+UPSTREAM_IN_FLIGHT = metrics.REGISTRY.gauge('virustotal_requests_in_flight', 'VirusTotal HTTP requests in progress.')
+UPSTREAM_IN_FLIGHT.set(0)
+
+
+class VirusTotalError(Exception):
+    """A VirusTotal call failed with a non-retryable status or ran out of retries."""
+
+    def __init__(self, message, status_code=502):
+        super().__init__(message)
+        self.status_code = status_code
+
+    def __reduce__(self):
+        # Keep status_code when the error crosses processes (see vt_service.py)
+        return VirusTotalError, (str(self), self.status_code)
+
+
+class TokenBucket:
+    """Thread-safe token bucket: `rate` tokens per second, at most `capacity` saved up."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Take one token, sleeping the calling thread until one is available."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class VirusTotalClient:
+    def __init__(self, api_key, base_url=VT_BASE_URL, requests_per_minute=4, burst=4,
+                 timeout=(5, 60), retries=3, backoff=2.0, workers=4, max_retry_after=None):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        # Longest Retry-After honoured; by default the read timeout, so one header cannot stall a thread for good
+        if max_retry_after is None:
+            max_retry_after = timeout[1] if isinstance(timeout, tuple) else timeout
+        self.max_retry_after = max_retry_after
+        self.bucket = TokenBucket(requests_per_minute / 60.0, burst)
+        self.session = requests.Session()
+        self.session.headers.update({"accept": "application/json", "x-apikey": api_key})
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='virustotal')
+
+    def _request(self, method, path, **kwargs):
+        """Rate-limited request with retries; returns the final requests.Response."""
+        for attempt in range(self.retries + 1):
+            self.bucket.acquire()
+            try:
+                response = self._send(method, path, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt == self.retries:
+                    raise VirusTotalError(f"VirusTotal unreachable: {e}", 504)
+                time.sleep(self._delay(attempt))
+                continue
+            if response.status_code not in RETRY_STATUSES or attempt == self.retries:
+                return response
+            time.sleep(self._delay(attempt, response.headers.get('Retry-After')))
+
+    def _send(self, method, path, **kwargs):
+        if not metrics.enabled():
+            return self.session.request(method, self.base_url + path, timeout=self.timeout, **kwargs)
+        endpoint = f"{method} /{path.split('/')[1]}"  # e.g. "GET /files", keeps hashes and ids out of the labels
+        status = 'error'
+        UPSTREAM_IN_FLIGHT.inc()
+        start = time.perf_counter()
+        try:
+            response = self.session.request(method, self.base_url + path, timeout=self.timeout, **kwargs)
+            status = str(response.status_code)
+            return response
+        finally:
+            UPSTREAM_SECONDS.observe(time.perf_counter() - start, endpoint=endpoint, status=status)
+            UPSTREAM_IN_FLIGHT.dec()
+
+    def _delay(self, attempt, retry_after=None):
+        if retry_after is not None:
+            try:
+                delay = float(retry_after)
+            except ValueError:
+                delay = math.nan
+            if math.isfinite(delay):
+                return min(max(delay, 0.0), self.max_retry_after)
+            if delay == math.inf:
+                return self.max_retry_after
+        return self.backoff * (2 ** attempt) * (0.5 + random.random() / 2)
+
+    def _file_report(self, md5_digest):
+        response = self._request('GET', f"/files/{md5_digest}")
+        if response.status_code == 200:
+            return response.json()
+        if response.status_code == 404:
+            return None
+        raise VirusTotalError("Failed to get file report", response.status_code)
+
+    def _upload(self, filename, data):
+        response = self._request('POST', "/files", files={'file': (filename, data)})
+        if response.status_code != 200:
+            raise VirusTotalError("Failed to scan the file", response.status_code)
+        return response.json()['data']['id']
+
+    def _analysis(self, analysis_id):
+        response = self._request('GET', f"/analyses/{analysis_id}")
+        if response.status_code != 200:
+            raise VirusTotalError(f"Failed to get status. Status code: {response.status_code}", response.status_code)
+        return response.json()
+
+    def _scan(self, filename, data, md5_digest):
+        report = self._file_report(md5_digest)
+        if report is not None:
+            return 'report', report
+        return 'analysis', self._upload(filename, data)
+
+    def file_report(self, md5_digest):
+        """Future of the file report for a hash, or of None if VirusTotal does not know it."""
+        return self.executor.submit(self._file_report, md5_digest)
+
+    def upload(self, filename, data):
+        """Future of the analysis id for an uploaded file."""
+        return self.executor.submit(self._upload, filename, data)
+
+    def analysis(self, analysis_id):
+        """Future of the analysis object for an analysis id."""
+        return self.executor.submit(self._analysis, analysis_id)
+
+    def scan(self, filename, data, md5_digest):
+        """Future of ('report', report) if the hash is known, else ('analysis', analysis_id) after uploading."""
+        return self.executor.submit(self._scan, filename, data, md5_digest)
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+        self.session.close()
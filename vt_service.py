@@ -0,0 +1,87 @@
+"""VirusTotal lookups and analysis watching as one service several server processes can share.
+
+VirusTotalService puts the VirusTotalClient (and its token bucket) and the
+AnalysisWatcher behind calls that take and return plain values, so it can
+live in another process. serve.py starts one instance with start_shared() in
+a manager process before gunicorn forks, and every worker reaches it through
+connect(). All workers therefore draw on one request quota, each analysis is
+polled once however many workers are asked about it, and a job or analysis id
+handed out by one worker can be followed up on any other. A single-process
+server (python server.py) uses a local instance.
+"""
+import multiprocessing
+from concurrent.futures import TimeoutError
+from multiprocessing.managers import BaseManager
+
+import metrics
+from vt_client import VT_BASE_URL, VirusTotalClient
+from vt_watcher import AnalysisWatcher
+
+METRICS_PREFIX = 'virustotal_'  # the families the service's process records
+
+
+class VirusTotalService:
+    def __init__(self, api_key, base_url=VT_BASE_URL, requests_per_minute=4, poll_interval=15.0, max_watches=1000):
+        self.client = VirusTotalClient(api_key, base_url=base_url, requests_per_minute=requests_per_minute)
+        self.watcher = AnalysisWatcher(self.client, interval=poll_interval, max_watches=max_watches)
+
+    def scan(self, filename, data, md5_digest, wait):
+        """('report', report) if VirusTotal knows the hash, ('analysis', analysis_id) after uploading the file,
+        or ('job', job_id) if neither is known within `wait` seconds; the job is then watched like an analysis."""
+        job = self.client.scan(filename, data, md5_digest)
+        try:
+            return job.result(timeout=wait)
+        except TimeoutError:
+            job_id = f"job-{md5_digest}"
+            self.watcher.watch(job_id, job)
+            return 'job', job_id
+
+    def status(self, analysis_id, version, wait):
+        """(version, data, status_code, done) of an analysis once a snapshot newer than `version` exists (or after wait)."""
+        return self.watcher.watch(analysis_id).wait(version, wait)
+
+    def stats(self):
+        return self.watcher.stats()
+
+    def render_metrics(self):
+        """The VirusTotal metrics of the process the service runs in, in the Prometheus text format."""
+        return metrics.REGISTRY.render(only=(METRICS_PREFIX,))
+
+
+class _ServiceManager(BaseManager):
+    pass
+
+
+_service = None
+
+
+def _create_service(settings):
+    global _service
+    _service = VirusTotalService(**settings)
+
+
+def _get_service():
+    return _service
+
+
+_ServiceManager.register('service', callable=_get_service)
+
+
+def start_shared(settings):
+    """Run one VirusTotalService(**settings) in a new process; returns its manager, whose address connect() takes.
+
+    The manager process is spawned rather than forked, and shuts down when the caller exits.
+    """
+    manager = _ServiceManager(ctx=multiprocessing.get_context('spawn'))
+    manager.start(_create_service, (settings,))
+    return manager
+
+
+def connect(address):
+    """Proxy to the shared service at address, with the same methods as VirusTotalService.
+
+    Processes forked from the one that called start_shared() share its authentication key.
+    """
+    manager = _ServiceManager(address=address)
+    manager.connect()
+    return manager.service()
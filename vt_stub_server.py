@@ -0,0 +1,117 @@
+"""Local stand-in for the VirusTotal v3 API, for exercising vt_client and the server offline.
+
+Usage: python vt_stub_server.py [--port 8089] [--fixtures DIR] [--delay SECONDS] [--throttle-every N]
+Then start the server with VT_BASE_URL=http://127.0.0.1:8089/api/v3
+
+Canned responses are read from the fixtures directory:
+  files/<md5>.json       returned by GET /api/v3/files/<md5> (404 when missing)
+  analyses/<id>.json     returned by GET /api/v3/analyses/<id>; a JSON list is
+                         replayed one element per call, repeating the last one
+POST /api/v3/files answers with analysis id "stub-analysis", for which a
+queued-then-completed sequence is built in when no fixture exists.
+"""
+import argparse
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+STUB_ANALYSIS_ID = "stub-analysis"
+_STATS = {"malicious": 0, "suspicious": 0, "undetected": 60, "harmless": 0}
+_FILE_INFO = {"size": 0, "md5": "", "sha1": "", "sha256": ""}
+DEFAULT_ANALYSIS = [
+    {"data": {"id": STUB_ANALYSIS_ID, "type": "analysis", "attributes": {"status": "queued", "stats": _STATS}},
+     "meta": {"file_info": _FILE_INFO}},
+    {"data": {"id": STUB_ANALYSIS_ID, "type": "analysis", "attributes": {"status": "completed", "stats": _STATS}},
+     "meta": {"file_info": _FILE_INFO}},
+]
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    fixtures = None
+    delay = 0.0
+    throttle_every = 0
+    _calls = {}
+    _requests = 0
+    _lock = threading.Lock()
+
+    def _send(self, status, body):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        if status == 429:
+            self.send_header('Retry-After', '1')
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _throttled(self):
+        with self._lock:
+            StubHandler._requests += 1
+            return self.throttle_every and StubHandler._requests % self.throttle_every == 0
+
+    def _fixture(self, kind, name):
+        if self.fixtures is None:
+            return None
+        path = os.path.join(self.fixtures, kind, os.path.basename(name) + '.json')
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return json.load(f)
+
+    def _replay(self, key, responses):
+        if not isinstance(responses, list):
+            return responses
+        with self._lock:
+            index = self._calls.get(key, 0)
+            self._calls[key] = index + 1
+        return responses[min(index, len(responses) - 1)]
+
+    def do_GET(self):
+        time.sleep(self.delay)
+        if self._throttled():
+            return self._send(429, {"error": {"code": "QuotaExceededError"}})
+        parts = self.path.strip('/').split('/')
+        if parts[:3] == ['api', 'v3', 'files'] and len(parts) == 4:
+            report = self._fixture('files', parts[3])
+            if report is None:
+                return self._send(404, {"error": {"code": "NotFoundError"}})
+            return self._send(200, report)
+        if parts[:3] == ['api', 'v3', 'analyses'] and len(parts) == 4:
+            responses = self._fixture('analyses', parts[3])
+            if responses is None and parts[3] == STUB_ANALYSIS_ID:
+                responses = DEFAULT_ANALYSIS
+            if responses is None:
+                return self._send(404, {"error": {"code": "NotFoundError"}})
+            return self._send(200, self._replay(parts[3], responses))
+        self._send(404, {"error": {"code": "NotFoundError"}})
+
+    def do_POST(self):
+        time.sleep(self.delay)
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if self._throttled():
+            return self._send(429, {"error": {"code": "QuotaExceededError"}})
+        if self.path.rstrip('/') == '/api/v3/files':
+            return self._send(200, {"data": {"type": "analysis", "id": STUB_ANALYSIS_ID}})
+        self._send(404, {"error": {"code": "NotFoundError"}})
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve canned VirusTotal v3 responses locally.')
+    parser.add_argument('--port', type=int, default=8089)
+    parser.add_argument('--fixtures', help='Directory with files/ and analyses/ JSON responses.')
+    parser.add_argument('--delay', type=float, default=0.0, help='Seconds to wait before answering each request.')
+    parser.add_argument('--throttle-every', type=int, default=0, help='Answer every Nth request with 429.')
+    args = parser.parse_args()
+
+    StubHandler.fixtures = args.fixtures
+    StubHandler.delay = args.delay
+    StubHandler.throttle_every = args.throttle_every
+    server = ThreadingHTTPServer(('127.0.0.1', args.port), StubHandler)
+    print(f"VirusTotal stub listening on http://127.0.0.1:{args.port}/api/v3")
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+"""Server-side watcher for VirusTotal analyses.
+
+Every analysis (or pending scan job) is polled by exactly one background
+thread no matter how many browsers are waiting on it. Each new upstream
+response is stored as a numbered snapshot and handed to all waiters, who
+either long-poll for the next version or stream snapshots over Server-Sent
+Events. Finished reports stay in a small LRU so late watchers are answered
+without going upstream. Only well-formed ids are watched, and at most
+max_watches analyses are polled at once.
+"""
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from vt_client import VirusTotalError
+
+PENDING = {"data": {"attributes": {"status": "queued"}}}
+# VirusTotal analysis ids are base64 strings; pending scan jobs are "job-<md5>"
+ANALYSIS_ID = re.compile(r'[A-Za-z0-9+=_-]{1,256}')
+
+
+def valid_analysis_id(analysis_id):
+    return ANALYSIS_ID.fullmatch(analysis_id) is not None
+
+
+class WatchLimitReached(Exception):
+    """max_watches analyses are already being polled."""
+
+
+class Watch:
+    """Latest known state of one analysis plus a condition to wait for changes."""
+
+    def __init__(self, data=PENDING, done=False, status_code=200):
+        self.data = data
+        self.status_code = status_code
+        self.version = 1 if done else 0
+        self.done = done
+        self.last_seen = time.monotonic()
+        self.condition = threading.Condition()
+
+    def _publish(self, data, done, status_code=200):
+        with self.condition:
+            self.data = data
+            self.status_code = status_code
+            self.done = done
+            self.version += 1
+            self.condition.notify_all()
+
+    def wait(self, version, timeout):
+        """Block until a snapshot newer than `version` exists (or timeout); return (version, data, status_code, done)."""
+        with self.condition:
+            self.last_seen = time.monotonic()
+            if not self.done and self.version <= version:
+                self.condition.wait(timeout)
+            return self.version, self.data, self.status_code, self.done
+
+
+class AnalysisWatcher:
+    def __init__(self, client, interval=15.0, idle_timeout=120.0, cache_size=1000, max_watches=1000):
+        self.client = client
+        self.interval = interval  # seconds between upstream polls of one analysis
+        self.idle_timeout = idle_timeout  # stop polling when nobody has asked for this long
+        self.cache_size = cache_size
+        self.max_watches = max_watches
+        self.upstream_requests = 0
+        self._watches = {}
+        self._completed = OrderedDict()
+        self._lock = threading.Lock()
+
+    def watch(self, analysis_id, job=None):
+        """Return the shared Watch for an analysis id, starting its poller if needed.
+
+        `job` is an optional future from VirusTotalClient.scan() whose outcome
+        decides what is polled: a known report completes the watch directly,
+        an analysis id is then polled like any other. Raises ValueError for a
+        malformed id and WatchLimitReached when max_watches are being polled.
+        """
+        if not valid_analysis_id(analysis_id):
+            raise ValueError(f"Invalid analysis id {analysis_id!r}")
+        with self._lock:
+            watch = self._completed.get(analysis_id)
+            if watch is not None:
+                self._completed.move_to_end(analysis_id)
+                return watch
+            watch = self._watches.get(analysis_id)
+            if watch is None:
+                if len(self._watches) >= self.max_watches:
+                    raise WatchLimitReached(f"Already watching {self.max_watches} analyses")
+                watch = self._watches[analysis_id] = Watch()
+                threading.Thread(target=self._poll, args=(analysis_id, watch, job),
+                                 name=f"vt-watch-{analysis_id}", daemon=True).start()
+            return watch
+
+    def _poll(self, key, watch, job):
+        analysis_id = key
+        try:
+            if job is not None:
+                kind, payload = job.result()
+                if kind == 'report':
+                    return self._finish(key, watch, {"hash": payload['data'], "data": {"attributes": {"status": "completed"}}})
+                analysis_id = payload
+            while time.monotonic() - watch.last_seen < self.idle_timeout:
+                with self._lock:
+                    self.upstream_requests += 1
+                data = self.client.analysis(analysis_id).result()
+                if data['data']['attributes']['status'] == 'completed':
+                    return self._finish(key, watch, data)
+                watch._publish(data, done=False)
+                time.sleep(self.interval)
+        except VirusTotalError as e:
+            watch._publish({"error": str(e)}, done=True, status_code=e.status_code)
+        except Exception as e:
+            watch._publish({"error": str(e)}, done=True, status_code=500)
+        with self._lock:
+            self._watches.pop(key, None)
+
+    def _finish(self, key, watch, data):
+        watch._publish(data, done=True)
+        with self._lock:
+            self._watches.pop(key, None)
+            self._completed[key] = watch
+            while len(self._completed) > self.cache_size:
+                self._completed.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            return {"watching": len(self._watches), "completed_cached": len(self._completed),
+                    "upstream_requests": self.upstream_requests}